@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Memory per row: dict rows (what RealDictCursor returns) vs models.py slots rows.
+
+Builds N synthetic user rows each way and measures the containers with
+tracemalloc. Column values are shared between runs so only the row
+overhead is compared. RealDictRow is a dict subclass, so the dict
+figure is a lower bound for what the cursor actually hands back.
+
+    python benchmark_rows.py [rows]
+"""
+
+import gc
+import sys
+import tracemalloc
+from datetime import datetime
+from models import User
+
+def build_values(count):
+    joined_at = datetime(2024, 1, 1)
+    return [
+        (100000 + i, f"User {i}", f"user{i}@example.com", "+251900000000", "Ethiopia", "en",
+         f"REF{i:08d}", None, f"user{i}", True, joined_at, True, i % 7, i % 3)
+        for i in range(count)
+    ]
+
+def measure(label, build, count):
+    gc.collect()
+    tracemalloc.start()
+    rows = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<34} {current / 1024 / 1024:8.1f} MiB  {current / count:7.0f} B/row")
+    del rows
+    return current
+
+def main(count):
+    values = build_values(count)
+    fields = User._fields
+    # Every row must fill every column, or the comparison measures partial rows
+    assert all(len(row) == len(fields) for row in values[:1]), "build_values() is out of step with User"
+    projected = ('user_id', 'language')
+    print(f"{count} rows, {len(fields)} columns\n")
+    as_dict = measure("dict rows, SELECT *", lambda: [dict(zip(fields, row)) for row in values], count)
+    as_model = measure("User rows, SELECT *", lambda: [User(**dict(zip(fields, row))) for row in values], count)
+    as_dict_projected = measure(
+        "dict rows, 2 columns", lambda: [{'user_id': row[0], 'language': row[5]} for row in values], count
+    )
+    as_model_projected = measure(
+        "User rows, 2 columns", lambda: [User(user_id=row[0], language=row[5]) for row in values], count
+    )
+    print(f"\nSlots rows use {as_model / as_dict:.0%} of the dict memory for full rows "
+          f"and {as_model_projected / as_dict_projected:.0%} for the {len(projected)}-column projection")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
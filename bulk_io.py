@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Bulk export/import through Postgres COPY, as gzip-compressed CSV.
+
+Rows stream between the server and the file in COPY's own buffers, so
+memory use is flat regardless of table size.
+
+    python bulk_io.py export users -o users.csv.gz
+    python bulk_io.py import users old_system_users.csv.gz
+"""
+
+import argparse
+import gzip
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+EXPORT_TABLES = ('users', 'subscriptions', 'payments')
+
+# Columns an import may supply; anything else in the CSV header is rejected
+IMPORT_COLUMNS = {
+    'users': (
+        'user_id', 'name', 'email', 'phone', 'country', 'language', 'referral_code',
+        'referred_by', 'telegram_username', 'privacy_allowed', 'joined_at', 'is_active'
+    ),
+}
+IMPORT_REQUIRED = {'users': ('user_id', 'name')}
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+class BulkIOError(Exception):
+    """Raised for unknown tables or malformed import files"""
+
+def export_table(database, table, fileobj):
+    """COPY `table` to `fileobj` as gzip CSV with a header row; returns rows written"""
+    if table not in EXPORT_TABLES:
+        raise BulkIOError(f"Unknown table '{table}', expected one of {', '.join(EXPORT_TABLES)}")
+    with database.pool.connection() as connection:
+        try:
+            with connection.cursor() as cursor, gzip.GzipFile(fileobj=fileobj, mode='wb') as compressed:
+                cursor.copy_expert(f"COPY {table} TO STDOUT WITH (FORMAT csv, HEADER true)", compressed)
+                rows = cursor.rowcount
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    logger.info(f"Exported {rows} rows from {table}")
+    return rows
+
+def import_table(database, table, fileobj):
+    """Load CSV (plain or gzip) with a header row into `table`.
+
+    Rows are COPY'd into a temporary staging table first and then merged
+    in one INSERT, so existing rows are skipped rather than aborting the
+    whole load. Returns (rows_read, rows_inserted).
+    """
+    if table not in IMPORT_COLUMNS:
+        raise BulkIOError(f"Import is only supported for: {', '.join(IMPORT_COLUMNS)}")
+    stream = _open_maybe_gzip(fileobj)
+    header = stream.readline().decode('utf-8-sig').strip()
+    columns = [column.strip().strip('"') for column in header.split(',')]
+    unknown = set(columns) - set(IMPORT_COLUMNS[table])
+    missing = set(IMPORT_REQUIRED[table]) - set(columns)
+    if unknown or missing:
+        raise BulkIOError(
+            f"Bad header for {table}: unknown columns {sorted(unknown)}, missing {sorted(missing)}"
+        )
+    column_list = ', '.join(columns)
+    staging = f"{table}_import"
+    with database.transaction() as cursor:
+        cursor.execute(f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+        # The header was consumed above, so COPY reads data rows only
+        cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)", stream)
+        rows_read = cursor.rowcount
+        cursor.execute(f"""
+        INSERT INTO {table} ({column_list})
+        SELECT {column_list} FROM {staging}
+        ON CONFLICT DO NOTHING
+        """)
+        rows_inserted = cursor.rowcount
+    logger.info(f"Imported {rows_inserted} of {rows_read} rows into {table}")
+    return rows_read, rows_inserted
+
+def _open_maybe_gzip(fileobj):
+    if hasattr(fileobj, 'peek'):
+        magic = fileobj.peek(2)[:2]
+    else:
+        magic = fileobj.read(2)
+        fileobj.seek(0)
+    return gzip.GzipFile(fileobj=fileobj, mode='rb') if magic == GZIP_MAGIC else fileobj
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk COPY export/import of bot tables")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help="Write a table to gzip CSV")
+    export_parser.add_argument('table', choices=EXPORT_TABLES)
+    export_parser.add_argument('-o', '--output', help="Output path (default: <table>.csv.gz)")
+    import_parser = subparsers.add_parser('import', help="Load a CSV or CSV.gz file into a table")
+    import_parser.add_argument('table', choices=sorted(IMPORT_COLUMNS))
+    import_parser.add_argument('path')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    from database import db
+
+    try:
+        if args.command == 'export':
+            output = args.output or f"{args.table}.csv.gz"
+            with open(output, 'wb') as fileobj:
+                rows = export_table(db, args.table, fileobj)
+            print(f"Exported {rows} {args.table} rows to {output}")
+        else:
+            with open(args.path, 'rb') as fileobj:
+                rows_read, rows_inserted = import_table(db, args.table, fileobj)
+            print(f"Read {rows_read} rows, inserted {rows_inserted} new {args.table}")
+    except BulkIOError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
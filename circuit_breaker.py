@@ -0,0 +1,104 @@
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency the breaker considers down"""
+
+class CircuitBreaker:
+    """Closed -> open -> half-open breaker with jittered exponential backoff.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail fast. Once the backoff has elapsed a single trial call is
+    let through (half-open); success closes the circuit, failure reopens
+    it with the backoff doubled up to `max_reset_timeout`.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=1.0, max_reset_timeout=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._trips = 0  # consecutive openings, drives the backoff
+        self._retry_at = 0.0
+        self._trial_in_flight = False
+        self._last_error = None
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead right now.
+        Returns True when this call took the half-open trial slot, which it
+        must then settle with record_success/record_failure or release_trial."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return False
+            if self._state == self.OPEN and time.monotonic() >= self._retry_at:
+                self._transition(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            wait = max(self._retry_at - time.monotonic(), 0)
+        raise CircuitOpenError(f"{self.name} unavailable, retrying in {wait:.1f}s")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            if self._state != self.CLOSED:
+                self._trips = 0
+                self._opened_at = None
+                self._transition(self.CLOSED)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error) if error else None
+            trial_failed = self._state == self.HALF_OPEN
+            self._trial_in_flight = False
+            if trial_failed or self._failures >= self.failure_threshold:
+                self._trips += 1
+                backoff = min(self.reset_timeout * 2 ** (self._trips - 1), self.max_reset_timeout)
+                # Full jitter so replicas don't all probe the database at once
+                self._retry_at = time.monotonic() + random.uniform(backoff / 2, backoff)
+                if self._opened_at is None:
+                    self._opened_at = time.time()
+                self._transition(self.OPEN)
+
+    def release_trial(self):
+        """Give back a half-open trial slot that ended without a verdict; only
+        for the call whose before_call() returned True"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'trips': self._trips,
+                'retry_in': round(max(self._retry_at - time.monotonic(), 0), 1) if self._state != self.CLOSED else 0,
+                'down_since': self._opened_at,
+                'last_error': self._last_error,
+            }
+
+    def _transition(self, state):
+        if state != self._state:
+            log = logger.info if state != self.OPEN else logger.warning
+            log(f"Circuit '{self.name}' {self._state} -> {state}")
+            self._state = state
@@ -9,10 +9,66 @@ ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if
 
 # Database Configuration
 DATABASE_URL = os.getenv('DATABASE_URL')
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))  # seconds to wait for a free connection
+DB_FETCH_SIZE = int(os.getenv('DB_FETCH_SIZE', 500))  # rows per round-trip for streamed reads
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 30))  # probe connections idle longer than this
+DB_CONNECT_RETRIES = int(os.getenv('DB_CONNECT_RETRIES', 5))  # startup attempts before giving up
+DB_BREAKER_THRESHOLD = int(os.getenv('DB_BREAKER_THRESHOLD', 3))  # consecutive failures that open the circuit
+DB_BREAKER_RESET = float(os.getenv('DB_BREAKER_RESET', 1))  # first retry delay (seconds), doubles up to 60
+
+# Queries slower than this are logged with their normalized text
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+
+# User row cache
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 5000))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 300))  # seconds
+
+# Referral leaderboard: materialized view refresh period, also the cache TTL
+LEADERBOARD_REFRESH_MINUTES = int(os.getenv('LEADERBOARD_REFRESH_MINUTES', 15))
+
+# Expiry sweeper: how often it runs and how many subscriptions it expires per batch
+EXPIRY_SWEEP_MINUTES = int(os.getenv('EXPIRY_SWEEP_MINUTES', 5))
+EXPIRY_SWEEP_BATCH_SIZE = int(os.getenv('EXPIRY_SWEEP_BATCH_SIZE', 500))
+
+# Exact-time expiry: how far ahead the timer heap is loaded, and Telegram group removals per second
+EXPIRY_TIMER_HORIZON_MINUTES = int(os.getenv('EXPIRY_TIMER_HORIZON_MINUTES', 60))
+GROUP_REMOVAL_RATE = float(os.getenv('GROUP_REMOVAL_RATE', 20))
+
+# Scheduled jobs: max random delay (seconds) added to each run, capped at half the job's interval
+JOB_JITTER_SECONDS = int(os.getenv('JOB_JITTER_SECONDS', 30))
+
+# Scheduler leader election across replicas: lease heartbeat (seconds); failover takes up to ~3x this
+SCHEDULER_HEARTBEAT_SECONDS = float(os.getenv('SCHEDULER_HEARTBEAT_SECONDS', 10))
+
+# Reminder dispatch: concurrent senders and max sends per second, per channel
+REMINDER_EMAIL_WORKERS = int(os.getenv('REMINDER_EMAIL_WORKERS', 4))
+REMINDER_EMAIL_RATE = float(os.getenv('REMINDER_EMAIL_RATE', 5))
+REMINDER_TELEGRAM_WORKERS = int(os.getenv('REMINDER_TELEGRAM_WORKERS', 8))
+REMINDER_TELEGRAM_RATE = float(os.getenv('REMINDER_TELEGRAM_RATE', 25))  # Telegram allows ~30/s per bot
+REMINDER_JOB_TIMEOUT = float(os.getenv('REMINDER_JOB_TIMEOUT', 3600))  # seconds before a reminder run is cancelled
+
+# In-memory session store, written back to user_sessions in batches
+SESSION_FLUSH_INTERVAL = float(os.getenv('SESSION_FLUSH_INTERVAL', 2))  # seconds; 0 writes through (for several replicas)
+SESSION_FLUSH_BATCH_SIZE = int(os.getenv('SESSION_FLUSH_BATCH_SIZE', 500))
 
 # Email Configuration
 EMAIL_USER = os.getenv('EMAIL_USER')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', 4))  # logged-in sessions kept open at most
+SMTP_IDLE_TIMEOUT = float(os.getenv('SMTP_IDLE_TIMEOUT', 120))  # seconds before an idle session is closed
+SMTP_HEALTH_CHECK_INTERVAL = float(os.getenv('SMTP_HEALTH_CHECK_INTERVAL', 15))  # NOOP sessions idle longer than this
+
+# Email provider quotas (Gmail: ~500/day for personal accounts); reminders leave the reserve share to transactional mail
+EMAIL_QUOTA_PER_MINUTE = int(os.getenv('EMAIL_QUOTA_PER_MINUTE', 20))
+EMAIL_QUOTA_PER_DAY = int(os.getenv('EMAIL_QUOTA_PER_DAY', 500))
+EMAIL_QUOTA_RESERVE = float(os.getenv('EMAIL_QUOTA_RESERVE', 0.2))
+
+# Email outbox: emails per batch, attempts before dead-lettering, first retry delay (seconds, doubles up to 1h)
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 6))
+OUTBOX_RETRY_SECONDS = float(os.getenv('OUTBOX_RETRY_SECONDS', 30))
 
 # Payment Configuration
 BINANCE_WALLET_ADDRESS = os.getenv('BINANCE_WALLET_ADDRESS')
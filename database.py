@@ -1,22 +1,80 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import asyncio
+import atexit
 import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from datetime import datetime, timedelta
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_FETCH_SIZE, DB_HEALTH_CHECK_INTERVAL,
+    DB_CONNECT_RETRIES, DB_BREAKER_THRESHOLD, DB_BREAKER_RESET, USER_CACHE_SIZE, USER_CACHE_TTL,
+    SESSION_FLUSH_INTERVAL, SESSION_FLUSH_BATCH_SIZE, SLOW_QUERY_MS, LEADERBOARD_REFRESH_MINUTES
+)
+from psycopg2 import extensions
+from db_pool import ConnectionPool
+from circuit_breaker import CircuitBreaker
+from cache import LRUCache
+from session_store import SessionStore
+from migrations import run_migrations
+from query_stats import QueryStats
+from models import User, Subscription, SubscriptionWithUser, Payment, ReferralWithName
 
 logger = logging.getLogger(__name__)
 
+# Just what the expiry/renewal reminders read
+NOTICE_COLUMNS = f"{SubscriptionWithUser.columns('id', 'user_id', 'service', 'expiry_date', alias='s')}, u.name, u.email, u.language"
+
+# notification_ledger types; a subscription gets each one once per expiry
+# date on each channel
+EXPIRY_WARNING = 'expiry_warning'
+RENEWAL_REMINDER = 'renewal_reminder'
+EMAIL = 'email'
+TELEGRAM = 'telegram'
+
+# Reminder rows with a channel not yet claimed in the ledger for the current
+# expiry date (email only counts for users who have an address)
+UNNOTIFIED = """
+(
+    NOT EXISTS (
+        SELECT 1 FROM notification_ledger l
+        WHERE l.subscription_id = s.id AND l.notification_type = %(type)s
+        AND l.notify_window = s.expiry_date::date AND l.channel = 'telegram'
+    )
+    OR (u.email <> '' AND NOT EXISTS (
+        SELECT 1 FROM notification_ledger l
+        WHERE l.subscription_id = s.id AND l.notification_type = %(type)s
+        AND l.notify_window = s.expiry_date::date AND l.channel = 'email'
+    ))
+)
+"""
+
 class Database:
     def __init__(self):
-        self.connection = None
+        self.pool = None
+        # Read-through cache for user rows, keyed by (lookup field, value)
+        # and tagged with user_id so writes drop every alias at once
+        self.user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        # Leaderboard pages, ranks and referral trees; dropped on every refresh
+        self.leaderboard_cache = LRUCache(USER_CACHE_SIZE, LEADERBOARD_REFRESH_MINUTES * 60)
+        self.sessions = SessionStore(self, SESSION_FLUSH_INTERVAL, SESSION_FLUSH_BATCH_SIZE)
+        self.query_stats = QueryStats(SLOW_QUERY_MS)
         self.connect()
     #   self.drop_and_recreate_tables()
-        self.create_tables()
+        run_migrations(self)
+        self.sessions.start()
+        atexit.register(self.close)
     
     def connect(self):
         try:
-            self.connection = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-            logger.info("Database connected successfully")
+            self.pool = ConnectionPool(
+                DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT,
+                health_check_interval=DB_HEALTH_CHECK_INTERVAL,
+                connect_retries=DB_CONNECT_RETRIES,
+                breaker=CircuitBreaker('postgres', DB_BREAKER_THRESHOLD, DB_BREAKER_RESET)
+            )
+            logger.info(f"Database connected successfully (pool {DB_POOL_MIN_SIZE}-{DB_POOL_MAX_SIZE})")
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
             raise e
@@ -25,6 +83,7 @@ class Database:
         """Drop existing tables and recreate them with correct schema"""
         try:
             drop_queries = [
+                "DROP TABLE IF EXISTS schema_version CASCADE",
                 "DROP TABLE IF EXISTS user_sessions CASCADE",
                 "DROP TABLE IF EXISTS coupons CASCADE", 
                 "DROP TABLE IF EXISTS referrals CASCADE",
@@ -40,141 +99,226 @@ class Database:
         except Exception as e:
             logger.error(f"Failed to drop tables: {e}")
     
-    def execute_query(self, query, params=None, fetch=False):
+    def execute_query(self, query, params=None, fetch=False, model=None):
+        """Run one statement and commit. With fetch=True the rows come back as
+        dicts, or as `model` instances (see models.py) when a model is given.
+        Returns None if the statement failed."""
+        started = time.perf_counter()
+        rows = 0
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute(query, params)
-                if fetch:
-                    return cursor.fetchall()
-                self.connection.commit()
-                return True
+            with self.pool.connection() as connection:
+                try:
+                    with self._cursor(connection, model) as cursor:
+                        cursor.execute(query, params)
+                        if fetch:
+                            result = model.from_cursor(cursor, cursor.fetchall()) if model else cursor.fetchall()
+                        else:
+                            result = True
+                        rows = len(result) if fetch else max(cursor.rowcount, 0)
+                    # Commit fetches too: INSERT ... RETURNING would otherwise be
+                    # rolled back when the connection goes back to the pool
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
         except Exception as e:
-            self.connection.rollback()
+            self.query_stats.record(query, (time.perf_counter() - started) * 1000, error=True)
             logger.error(f"Query execution failed: {e}")
             return None
+        self.query_stats.record(query, (time.perf_counter() - started) * 1000, rows)
+        return result
+
+    @staticmethod
+    def _cursor(connection, model=None, name=None):
+        """Dict cursor by default; a plain tuple cursor when rows become models"""
+        if model:
+            return connection.cursor(name=name, cursor_factory=extensions.cursor)
+        return connection.cursor(name=name)
+
+    def stream_query(self, query, params=None, chunk_size=None, model=None):
+        """Yield the result set in lists of at most `chunk_size` rows, read through
+        a named server-side cursor so memory stays flat however many rows match.
+
+        The pooled connection (and its read transaction) is held until the
+        generator is exhausted or closed, so consume it promptly.
+        """
+        chunk_size = chunk_size or DB_FETCH_SIZE
+        started = time.perf_counter()
+        rows = 0
+        try:
+            with self.pool.connection() as connection:
+                try:
+                    with self._cursor(connection, model, name=f"stream_{uuid.uuid4().hex}") as cursor:
+                        cursor.itersize = chunk_size
+                        cursor.execute(query, params)
+                        while True:
+                            chunk = cursor.fetchmany(chunk_size)
+                            if not chunk:
+                                break
+                            rows += len(chunk)
+                            yield model.from_cursor(cursor, chunk) if model else chunk
+                    connection.commit()
+                except BaseException:
+                    connection.rollback()
+                    raise
+        except Exception as e:
+            self.query_stats.record(query, (time.perf_counter() - started) * 1000, rows, error=True)
+            logger.error(f"Streaming query failed after {rows} rows: {e}")
+            return
+        self.query_stats.record(query, (time.perf_counter() - started) * 1000, rows)
+
+    @contextmanager
+    def transaction(self):
+        """Yield a cursor whose statements commit together or roll back on error"""
+        with self.pool.connection() as connection:
+            try:
+                with connection.cursor() as cursor:
+                    yield cursor
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
     
-    def create_tables(self):
-        tables = [
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                email VARCHAR(255),
-                phone VARCHAR(50),
-                country VARCHAR(100),
-                language VARCHAR(10) DEFAULT 'en',
-                referral_code VARCHAR(50) UNIQUE,
-                referred_by BIGINT,
-                telegram_username VARCHAR(100),
-                privacy_allowed BOOLEAN DEFAULT FALSE,
-                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS subscriptions (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT REFERENCES users(user_id),
-                service VARCHAR(50) NOT NULL,
-                duration INTEGER NOT NULL,
-                amount DECIMAL(10,2) NOT NULL,
-                payment_method VARCHAR(50),
-                status VARCHAR(20) DEFAULT 'pending',
-                start_date TIMESTAMP,
-                expiry_date TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS payments (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT REFERENCES users(user_id),
-                subscription_id INTEGER REFERENCES subscriptions(id),
-                payment_method VARCHAR(50) NOT NULL,
-                amount DECIMAL(10,2) NOT NULL,
-                tx_hash VARCHAR(255),
-                receipt_path VARCHAR(500),
-                status VARCHAR(20) DEFAULT 'pending',
-                verified_by BIGINT,
-                verified_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS referrals (
-                id SERIAL PRIMARY KEY,
-                referrer_id BIGINT REFERENCES users(user_id),
-                referred_id BIGINT REFERENCES users(user_id),
-                reward_type VARCHAR(50),
-                reward_amount INTEGER,
-                status VARCHAR(20) DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS coupons (
-                id SERIAL PRIMARY KEY,
-                code VARCHAR(50) UNIQUE NOT NULL,
-                discount_type VARCHAR(20) NOT NULL,
-                discount_value DECIMAL(10,2) NOT NULL,
-                applicable_services TEXT[],
-                max_uses INTEGER DEFAULT 1,
-                used_count INTEGER DEFAULT 0,
-                expires_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS user_sessions (
-                user_id BIGINT PRIMARY KEY,
-                current_step VARCHAR(100),
-                temp_data JSONB,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        ]
-        
-        for table in tables:
-            self.execute_query(table)
-    
+    def _execute_with_email(self, query, params, compose_email=None, check=None):
+        """Run a RETURNING statement and, in the same transaction, queue the email
+        compose_email(row) returns for its first row as (to_email, subject, body),
+        or nothing if it returns None. The change and its email commit together.
+        If check(row) returns an error message the whole change is rolled back.
+        Returns the row (None if no row matched), or False if the statement failed."""
+        started = time.perf_counter()
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(query, params)
+                row = cursor.fetchone()
+                error = check(row) if row and check else None
+                if error:
+                    raise ValueError(error)
+                email = compose_email(row) if row and compose_email else None
+                if email:
+                    cursor.execute(
+                        "INSERT INTO email_outbox (to_email, subject, body) VALUES (%s, %s, %s)", email
+                    )
+        except Exception as e:
+            self.query_stats.record(query, (time.perf_counter() - started) * 1000, error=True)
+            logger.error(f"Query execution failed: {e}")
+            return False
+        self.query_stats.record(query, (time.perf_counter() - started) * 1000, 1 if row else 0)
+        return row
+
     # User operations
-    def create_user(self, user_id, name, email, phone, country, referral_code, telegram_username='', privacy_allowed=False):
+    def create_user(self, user_id, name, email, phone, country, referral_code, telegram_username='',
+                    privacy_allowed=False, compose_email=None):
+        """Insert the user; compose_email(row) may return a welcome email to queue
+        with it (only sent when the user is actually new)"""
         query = """
         INSERT INTO users (user_id, name, email, phone, country, referral_code, telegram_username, privacy_allowed)
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         ON CONFLICT (user_id) DO NOTHING
-        RETURNING user_id
+        RETURNING user_id, name, email
         """
-        result = self.execute_query(query, (user_id, name, email, phone, country, referral_code, telegram_username, privacy_allowed), fetch=True)
-        return result is not None
+        result = self._execute_with_email(
+            query, (user_id, name, email, phone, country, referral_code, telegram_username, privacy_allowed), compose_email
+        )
+        self.invalidate_user(user_id)
+        return result is not False
     
     def get_user(self, user_id):
-        query = "SELECT * FROM users WHERE user_id = %s"
-        result = self.execute_query(query, (user_id,), fetch=True)
-        return result[0] if result else None
+        return self._get_user_by('user_id', user_id)
     
     def get_user_by_email(self, email):
-        query = "SELECT * FROM users WHERE email = %s"
-        result = self.execute_query(query, (email,), fetch=True)
-        return result[0] if result else None
+        return self._get_user_by('email', email)
     
     def update_user_language(self, user_id, language):
         query = "UPDATE users SET language = %s WHERE user_id = %s"
-        return self.execute_query(query, (language, user_id))
+        result = self.execute_query(query, (language, user_id))
+        self.invalidate_user(user_id)
+        return result
     
     def update_user_phone(self, user_id, phone):
         query = "UPDATE users SET phone = %s WHERE user_id = %s"
-        return self.execute_query(query, (phone, user_id))
+        result = self.execute_query(query, (phone, user_id))
+        self.invalidate_user(user_id)
+        return result
     
     def update_user_country(self, user_id, country):
         query = "UPDATE users SET country = %s WHERE user_id = %s"
-        return self.execute_query(query, (country, user_id))
+        result = self.execute_query(query, (country, user_id))
+        self.invalidate_user(user_id)
+        return result
     
     def get_user_by_referral_code(self, referral_code):
-        query = "SELECT * FROM users WHERE referral_code = %s"
-        result = self.execute_query(query, (referral_code,), fetch=True)
-        return result[0] if result else None
+        return self._get_user_by('referral_code', referral_code)
+
+    def _get_user_by(self, field, value):
+        """Read-through lookup of a user row by a unique column"""
+        key = (field, value)
+        user = self.user_cache.get(key)
+        if user is not None:
+            return user
+        query = f"SELECT {User.columns()} FROM users WHERE {field} = %s"
+        result = self.execute_query(query, (value,), fetch=True, model=User)
+        if not result:
+            return None
+        user = result[0]
+        self.user_cache.set(key, user, tag=user['user_id'])
+        return user
+
+    def invalidate_user(self, user_id):
+        """Drop every cached lookup of this user"""
+        self.user_cache.invalidate_tag(user_id)
+
+    def get_query_stats(self, limit=10):
+        """Top `limit` statements by total time spent in execute_query"""
+        return self.query_stats.top(limit)
+
+    def get_health(self):
+        """Circuit breaker state and pool usage, for monitoring"""
+        return self.pool.health()
+
+    def get_cache_stats(self):
+        return self.user_cache.stats()
+    
+    def get_request_snapshot(self, user_id):
+        """The user row, active subscription and stored session for one user in a
+        single round-trip. Primes the user cache with the result. Returns
+        (user, active_subscription, session), where session is None when the
+        user has no live session, or None if the query failed."""
+        query = """
+        SELECT {user_columns},
+               s.id AS subscription__id, s.user_id AS subscription__user_id,
+               s.service AS subscription__service, s.duration AS subscription__duration,
+               s.amount AS subscription__amount, s.payment_method AS subscription__payment_method,
+               s.status AS subscription__status, s.start_date AS subscription__start_date,
+               s.expiry_date AS subscription__expiry_date, s.created_at AS subscription__created_at,
+               us.user_id AS session__user_id, us.current_step AS session__current_step,
+               us.temp_data AS session__temp_data, us.updated_at AS session__updated_at
+        FROM (SELECT %s::BIGINT AS uid) k
+        LEFT JOIN users u ON u.user_id = k.uid
+        LEFT JOIN LATERAL (
+            SELECT * FROM subscriptions
+            WHERE user_id = k.uid AND status = 'active' AND expiry_date > CURRENT_TIMESTAMP
+            ORDER BY expiry_date DESC LIMIT 1
+        ) s ON TRUE
+        LEFT JOIN user_sessions us ON us.user_id = k.uid
+        AND us.updated_at > CURRENT_TIMESTAMP - %s
+        """.format(user_columns=User.columns(alias='u'))
+        result = self.execute_query(query, (user_id, self.sessions.ttl), fetch=True)
+        if not result:
+            return None
+        user, subscription, session = {}, {}, {}
+        for column, value in result[0].items():
+            if column.startswith('subscription__'):
+                subscription[column[len('subscription__'):]] = value
+            elif column.startswith('session__'):
+                session[column[len('session__'):]] = value
+            else:
+                user[column] = value
+        user = User.from_mapping(user) if user['user_id'] is not None else None
+        subscription = Subscription.from_mapping(subscription) if subscription['id'] is not None else None
+        session = self.sessions.from_row(session) if session['user_id'] is not None else None
+        if user:
+            self.user_cache.set(('user_id', user_id), user, tag=user_id)
+        return user, subscription, session
     
     # Subscription operations
     def create_subscription(self, user_id, service, duration, amount, payment_method):
@@ -187,30 +331,154 @@ class Database:
         return result[0]['id'] if result else None
     
     def get_active_subscription(self, user_id):
-        query = """
-        SELECT * FROM subscriptions 
+        query = f"""
+        SELECT {Subscription.columns()} FROM subscriptions 
         WHERE user_id = %s AND status = 'active' AND expiry_date > CURRENT_TIMESTAMP
         ORDER BY expiry_date DESC LIMIT 1
         """
-        result = self.execute_query(query, (user_id,), fetch=True)
+        result = self.execute_query(query, (user_id,), fetch=True, model=Subscription)
         return result[0] if result else None
     
-    def activate_subscription(self, subscription_id, start_date, expiry_date):
+    def expire_due_subscriptions(self, batch_size=500):
+        """Mark up to `batch_size` lapsed active subscriptions expired, oldest first.
+        Rows another sweeper holds are skipped rather than waited on. Returns the
+        expired rows, an empty list when nothing is due, or None on failure."""
         query = """
-        UPDATE subscriptions 
-        SET status = 'active', start_date = %s, expiry_date = %s
-        WHERE id = %s
+        WITH due AS (
+            SELECT id FROM subscriptions
+            WHERE status = 'active' AND expiry_date < CURRENT_TIMESTAMP
+            ORDER BY expiry_date
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE subscriptions s
+        SET status = 'expired'
+        FROM due
+        WHERE s.id = due.id
+        RETURNING s.id, s.user_id, s.service, s.duration, s.expiry_date
         """
-        return self.execute_query(query, (start_date, expiry_date, subscription_id))
-    
-    def get_expiring_subscriptions(self, days_ahead=3):
+        return self.execute_query(query, (batch_size,), fetch=True, model=Subscription)
+
+    def expire_subscriptions(self, subscription_ids):
+        """Mark the given subscriptions expired if they are active and due. Returns
+        the rows actually expired (others already were, or were extended)."""
         query = """
-        SELECT s.*, u.name, u.email FROM subscriptions s
+        UPDATE subscriptions
+        SET status = 'expired'
+        WHERE id = ANY(%s) AND status = 'active' AND expiry_date <= CURRENT_TIMESTAMP
+        RETURNING id, user_id, service, duration, expiry_date
+        """
+        return self.execute_query(query, (list(subscription_ids),), fetch=True, model=Subscription)
+
+    def get_upcoming_expiries(self, until, limit=10000):
+        """Active subscriptions expiring before `until`, soonest first (served by
+        idx_subscriptions_status_expiry)"""
+        query = """
+        SELECT id, user_id, service, duration, expiry_date FROM subscriptions
+        WHERE status = 'active' AND expiry_date <= %s
+        ORDER BY expiry_date
+        LIMIT %s
+        """
+        return self.execute_query(query, (until, limit), fetch=True, model=Subscription)
+
+    def get_active_service_pairs(self, user_ids):
+        """{(user_id, service, duration)} for every unexpired active subscription of these users"""
+        query = """
+        SELECT DISTINCT user_id, service, duration FROM subscriptions
+        WHERE user_id = ANY(%s) AND status = 'active' AND expiry_date > CURRENT_TIMESTAMP
+        """
+        result = self.execute_query(query, (list(user_ids),), fetch=True)
+        if result is None:
+            return None
+        return {(row['user_id'], row['service'], row['duration']) for row in result}
+
+    def get_expiring_subscriptions(self, days_ahead=3):
+        return [row for chunk in self.iter_expiring_subscriptions(days_ahead) for row in chunk]
+
+    def _iter_notice_pages(self, query, params, chunk_size=None):
+        """Yield reminder rows from `query` in keyset pages on s.id.
+
+        Separate short queries rather than stream_query(): the reminder jobs
+        consuming this send at a throttled rate between pages, and a
+        server-side cursor would pin a pooled connection and an open
+        transaction for the whole run. `query` takes its cursor and page
+        size as %(after)s and %(limit)s.
+        """
+        chunk_size = chunk_size or DB_FETCH_SIZE
+        page_query = f"{query} AND s.id > %(after)s ORDER BY s.id LIMIT %(limit)s"
+        after = 0
+        while True:
+            rows = self.execute_query(
+                page_query, dict(params, after=after, limit=chunk_size), fetch=True, model=SubscriptionWithUser
+            )
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            after = rows[-1]['id']
+
+    def iter_expiring_subscriptions(self, days_ahead=3, chunk_size=None):
+        """Page through active subscriptions expiring within `days_ahead` days, with
+        user name/email, leaving out those already warned about this expiry date"""
+        query = f"""
+        SELECT {NOTICE_COLUMNS} FROM subscriptions s
         JOIN users u ON s.user_id = u.user_id
         WHERE s.status = 'active' AND s.expiry_date BETWEEN CURRENT_TIMESTAMP 
-        AND CURRENT_TIMESTAMP + INTERVAL '%s days'
+        AND CURRENT_TIMESTAMP + INTERVAL '%(days)s days'
+        AND {UNNOTIFIED}
+        """
+        params = {'days': days_ahead, 'type': EXPIRY_WARNING}
+        return self._iter_notice_pages(query, params, chunk_size)
+
+    def iter_recently_expired_subscriptions(self, days_back=7, chunk_size=None):
+        """Page through subscriptions that expired within the last `days_back` days,
+        leaving out those already reminded about this expiry"""
+        query = f"""
+        SELECT {NOTICE_COLUMNS} FROM subscriptions s
+        JOIN users u ON s.user_id = u.user_id
+        WHERE s.status = 'expired' 
+        AND s.expiry_date > CURRENT_TIMESTAMP - INTERVAL '%(days)s days'
+        AND s.expiry_date < CURRENT_TIMESTAMP
+        AND {UNNOTIFIED}
+        """
+        params = {'days': days_back, 'type': RENEWAL_REMINDER}
+        return self._iter_notice_pages(query, params, chunk_size)
+
+    def claim_notifications(self, notification_type, subscriptions, channel):
+        """Record `notification_type` as sent on `channel` for each subscription's
+        current expiry date, in one INSERT. Returns the (subscription_id, window)
+        pairs this call claimed; pairs another run got to first are left out.
+        None on failure."""
+        if not subscriptions:
+            return set()
+        query = """
+        INSERT INTO notification_ledger (subscription_id, notification_type, notify_window, channel)
+        SELECT c.subscription_id, %s, c.notify_window, %s
+        FROM unnest(%s::integer[], %s::date[]) AS c(subscription_id, notify_window)
+        ON CONFLICT DO NOTHING
+        RETURNING subscription_id, notify_window
+        """
+        ids = [subscription['id'] for subscription in subscriptions]
+        windows = [subscription['expiry_date'].date() for subscription in subscriptions]
+        result = self.execute_query(query, (notification_type, channel, ids, windows), fetch=True)
+        if result is None:
+            return None
+        return {(row['subscription_id'], row['notify_window']) for row in result}
+
+    def release_notifications(self, notification_type, keys, channel):
+        """Drop `channel` ledger entries for (subscription_id, window) pairs that
+        were never delivered there, so the next run tries them again"""
+        if not keys:
+            return True
+        query = """
+        DELETE FROM notification_ledger l
+        USING unnest(%s::integer[], %s::date[]) AS r(subscription_id, notify_window)
+        WHERE l.subscription_id = r.subscription_id AND l.notify_window = r.notify_window
+        AND l.notification_type = %s AND l.channel = %s
         """
-        return self.execute_query(query, (days_ahead,), fetch=True)
+        ids, windows = zip(*keys)
+        return self.execute_query(query, (list(ids), list(windows), notification_type, channel))
     
     # Payment operations
     def create_payment(self, user_id, subscription_id, payment_method, amount, tx_hash=None, receipt_path=None):
@@ -223,6 +491,10 @@ class Database:
         return result[0]['id'] if result else None
     
     def get_pending_payments(self):
+        return [row for chunk in self.iter_pending_payments() for row in chunk]
+
+    def iter_pending_payments(self, chunk_size=None):
+        """Stream pending payments, newest first, with user and subscription details"""
         query = """
         SELECT p.*, u.name, u.email, s.service, s.duration FROM payments p
         JOIN users u ON p.user_id = u.user_id
@@ -230,71 +502,228 @@ class Database:
         WHERE p.status = 'pending'
         ORDER BY p.created_at DESC
         """
-        return self.execute_query(query, fetch=True)
+        return self.stream_query(query, chunk_size=chunk_size)
     
-    def approve_payment(self, payment_id, admin_id):
-        query = """
-        UPDATE payments 
-        SET status = 'approved', verified_by = %s, verified_at = CURRENT_TIMESTAMP
-        WHERE id = %s
+    def count_pending_payments(self):
+        query = "SELECT pending_payments AS count FROM stats_totals"
+        result = self.execute_query(query, fetch=True)
+        return result[0]['count'] if result else 0
+
+    def get_pending_payments_page(self, after=None, before=None, limit=10):
+        """Keyset page of pending payments, newest first, keyed on (created_at, id).
+        Returns (rows, has_more) like get_users_page()."""
+        conditions, params = ["p.status = 'pending'"], []
+        if after:
+            conditions.append("(p.created_at, p.id) < (%s, %s)")
+            params.extend(after)
+        if before:
+            conditions.append("(p.created_at, p.id) > (%s, %s)")
+            params.extend(before)
+        order = "ASC" if before else "DESC"
+        query = f"""
+        SELECT p.*, u.name, u.email, s.service, s.duration FROM payments p
+        JOIN users u ON p.user_id = u.user_id
+        JOIN subscriptions s ON p.subscription_id = s.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY p.created_at {order}, p.id {order}
+        LIMIT %s
         """
-        return self.execute_query(query, (admin_id, payment_id))
+        params.append(limit + 1)
+        rows = self.execute_query(query, tuple(params), fetch=True) or []
+        if before:
+            rows.reverse()
+        return self._trim_page(rows, limit, backwards=bool(before))
+
+    @staticmethod
+    def _trim_page(rows, limit, backwards):
+        """Drop the look-ahead row fetched to detect whether more pages exist"""
+        has_more = len(rows) > limit
+        if has_more:
+            rows = rows[1:] if backwards else rows[:limit]
+        return rows, has_more
     
-    def reject_payment(self, payment_id, admin_id):
+    def approve_and_activate(self, payment_id, admin_id, compose_email=None):
+        """Approve a pending payment and activate its subscription in one atomic
+        statement. Returns the payment, subscription and user details needed
+        for notifications, None if the payment isn't pending (or is missing), or
+        False on failure. A payment whose subscription or user is missing is
+        left pending rather than approved without an activation.
+        compose_email(row) may return a confirmation email to queue in the same
+        transaction."""
+        query = """
+        WITH approved AS (
+            UPDATE payments
+            SET status = 'approved', verified_by = %s, verified_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND status = 'pending'
+            RETURNING id, user_id, subscription_id, amount, payment_method
+        ), activated AS (
+            UPDATE subscriptions s
+            SET status = 'active', start_date = CURRENT_TIMESTAMP,
+                expiry_date = CURRENT_TIMESTAMP + s.duration * INTERVAL '30 days'
+            FROM approved a
+            WHERE s.id = a.subscription_id
+            RETURNING s.id, s.service, s.duration, s.start_date, s.expiry_date
+        )
+        SELECT a.id AS payment_id, a.user_id, a.amount, a.payment_method,
+               v.id AS subscription_id, v.service, v.duration, v.start_date, v.expiry_date,
+               u.user_id AS account_id, u.name, u.email, u.language
+        FROM approved a
+        LEFT JOIN activated v ON v.id = a.subscription_id
+        LEFT JOIN users u ON u.user_id = a.user_id
+        """
+
+        def check(row):
+            if row['subscription_id'] is None:
+                return f"payment {payment_id} has no subscription to activate"
+            if row['account_id'] is None:
+                return f"payment {payment_id} belongs to a missing user"
+            return None
+
+        return self._execute_with_email(query, (admin_id, payment_id), compose_email, check)
+
+    def reject_with_details(self, payment_id, admin_id, compose_email=None):
+        """Reject a pending payment, returning the details needed to notify the
+        user, None if the payment isn't pending (or is missing), or False on
+        failure. compose_email(row) may return an email to queue in the same
+        transaction."""
         query = """
-        UPDATE payments 
-        SET status = 'rejected', verified_by = %s, verified_at = CURRENT_TIMESTAMP
-        WHERE id = %s
+        WITH rejected AS (
+            UPDATE payments
+            SET status = 'rejected', verified_by = %s, verified_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND status = 'pending'
+            RETURNING id, user_id, amount, payment_method
+        )
+        SELECT r.id AS payment_id, r.user_id, r.amount, r.payment_method,
+               u.name, u.email, u.language
+        FROM rejected r
+        JOIN users u ON u.user_id = r.user_id
         """
-        return self.execute_query(query, (admin_id, payment_id))
+        return self._execute_with_email(query, (admin_id, payment_id), compose_email)
     
     def get_payment(self, payment_id):
-        query = "SELECT * FROM payments WHERE id = %s"
-        result = self.execute_query(query, (payment_id,), fetch=True)
+        query = f"SELECT {Payment.columns()} FROM payments WHERE id = %s"
+        result = self.execute_query(query, (payment_id,), fetch=True, model=Payment)
         return result[0] if result else None
     
-    # Session management
+    # Session management (served from memory, written back by SessionStore)
     def update_user_session(self, user_id, step, temp_data=None):
-        query = """
-        INSERT INTO user_sessions (user_id, current_step, temp_data)
-        VALUES (%s, %s, %s)
-        ON CONFLICT (user_id) DO UPDATE SET
-        current_step = EXCLUDED.current_step,
-        temp_data = EXCLUDED.temp_data,
-        updated_at = CURRENT_TIMESTAMP
-        """
-        # Convert temp_data to JSON string if it's a dict
-        if isinstance(temp_data, dict):
-            import json
-            temp_data = json.dumps(temp_data)
-        return self.execute_query(query, (user_id, step, temp_data))
+        return self.sessions.update(user_id, step, temp_data)
     
     def get_user_session(self, user_id):
-        query = "SELECT * FROM user_sessions WHERE user_id = %s"
-        result = self.execute_query(query, (user_id,), fetch=True)
-        if result:
-            session = dict(result[0])
-            # Parse temp_data if it's a JSON string
-            if session.get('temp_data') and isinstance(session['temp_data'], str):
-                try:
-                    import json
-                    session['temp_data'] = json.loads(session['temp_data'])
-                except:
-                    session['temp_data'] = {}
-            return session
-        return None
+        return self.sessions.get(user_id)
     
     def clear_user_session(self, user_id):
-        query = "DELETE FROM user_sessions WHERE user_id = %s"
-        return self.execute_query(query, (user_id,))
+        return self.sessions.clear(user_id)
+
+    def cleanup_old_sessions(self):
+        """Remove sessions idle for more than 24 hours; returns how many were
+        removed, or None on failure"""
+        self.sessions.flush()
+        query = """
+        DELETE FROM user_sessions 
+        WHERE updated_at < CURRENT_TIMESTAMP - INTERVAL '24 hours'
+        RETURNING user_id
+        """
+        result = self.execute_query(query, fetch=True)
+        return len(result) if result is not None else None
     
+    # Email outbox (drained by email_outbox.OutboxWorker)
+    def enqueue_email(self, to_email, subject, body):
+        query = """
+        INSERT INTO email_outbox (to_email, subject, body) VALUES (%s, %s, %s)
+        RETURNING id
+        """
+        result = self.execute_query(query, (to_email, subject, body), fetch=True)
+        return result[0]['id'] if result else None
+
+    def claim_outbox_batch(self, limit=50, lease_seconds=300):
+        """Take up to `limit` due emails, counting the attempt and pushing their next
+        attempt `lease_seconds` out so a crashed sender's batch is retried later
+        rather than never. Rows another worker holds are skipped."""
+        query = """
+        WITH due AS (
+            SELECT id FROM email_outbox
+            WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY next_attempt_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE email_outbox o
+        SET attempts = o.attempts + 1,
+            next_attempt_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+        FROM due
+        WHERE o.id = due.id
+        RETURNING o.id, o.to_email, o.subject, o.body, o.attempts
+        """
+        return self.execute_query(query, (limit, lease_seconds), fetch=True)
+
+    def mark_outbox_sent(self, ids):
+        if not ids:
+            return True
+        query = """
+        UPDATE email_outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL
+        WHERE id = ANY(%s)
+        """
+        return self.execute_query(query, (list(ids),))
+
+    def mark_outbox_failed(self, ids, error, max_attempts=6, base_delay=30, max_delay=3600):
+        """Schedule a retry with jittered exponential backoff, or move emails that
+        used up their attempts to the dead letters (status 'dead').
+        Returns the ids that went dead, or None on failure."""
+        if not ids:
+            return []
+        query = """
+        UPDATE email_outbox
+        SET status = CASE WHEN attempts >= %s THEN 'dead' ELSE 'pending' END,
+            next_attempt_at = CURRENT_TIMESTAMP + LEAST(%s * POWER(2, attempts - 1), %s)
+                              * (0.5 + random() / 2) * INTERVAL '1 second',
+            last_error = %s
+        WHERE id = ANY(%s)
+        RETURNING id, status
+        """
+        result = self.execute_query(query, (max_attempts, base_delay, max_delay, error, list(ids)), fetch=True)
+        if result is None:
+            return None
+        return [row['id'] for row in result if row['status'] == 'dead']
+
+    def mark_outbox_dead(self, ids, error):
+        """Move emails straight to the dead letters, e.g. after a permanent rejection"""
+        if not ids:
+            return True
+        query = "UPDATE email_outbox SET status = 'dead', last_error = %s WHERE id = ANY(%s)"
+        return self.execute_query(query, (error, list(ids)))
+
+    def defer_outbox(self, ids, until):
+        """Put claimed emails back untried until `until`, refunding the attempt"""
+        query = """
+        UPDATE email_outbox SET attempts = attempts - 1, next_attempt_at = %s
+        WHERE id = ANY(%s)
+        """
+        return self.execute_query(query, (until, list(ids)))
+
+    def get_outbox_stats(self):
+        """{'pending': n, 'sent': n, 'dead': n} from the outbox"""
+        result = self.execute_query("SELECT status, COUNT(*) AS count FROM email_outbox GROUP BY status", fetch=True)
+        counts = {'pending': 0, 'sent': 0, 'dead': 0}
+        for row in result or []:
+            counts[row['status']] = row['count']
+        return counts
+
+    def purge_sent_emails(self, days=7):
+        query = "DELETE FROM email_outbox WHERE status = 'sent' AND sent_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'"
+        return self.execute_query(query, (days,))
+
     # Referral operations
     def create_referral(self, referrer_id, referred_id, reward_type='extension', reward_amount=7):
+        # trg_referral_counters bumps the referrer's counters in the same transaction
         query = """
         INSERT INTO referrals (referrer_id, referred_id, reward_type, reward_amount)
         VALUES (%s, %s, %s, %s)
+        ON CONFLICT (referrer_id, referred_id) DO NOTHING
         """
-        return self.execute_query(query, (referrer_id, referred_id, reward_type, reward_amount))
+        result = self.execute_query(query, (referrer_id, referred_id, reward_type, reward_amount))
+        self.invalidate_user(referrer_id)
+        return result
     
     def get_user_referrals(self, user_id):
         query = """
@@ -303,49 +732,284 @@ class Database:
         WHERE r.referrer_id = %s
         ORDER BY r.created_at DESC
         """
-        return self.execute_query(query, (user_id,), fetch=True)
+        return self.execute_query(query, (user_id,), fetch=True, model=ReferralWithName)
+
+    def get_user_referrals_page(self, user_id, after=None, limit=10):
+        """Keyset page of a user's referrals, newest first, keyed on (created_at, id).
+        Returns (rows, has_more)."""
+        conditions, params = ["r.referrer_id = %s"], [user_id]
+        if after:
+            conditions.append("(r.created_at, r.id) < (%s, %s)")
+            params.extend(after)
+        query = f"""
+        SELECT r.*, u.name as referred_name FROM referrals r
+        JOIN users u ON r.referred_id = u.user_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY r.created_at DESC, r.id DESC
+        LIMIT %s
+        """
+        params.append(limit + 1)
+        rows = self.execute_query(query, tuple(params), fetch=True, model=ReferralWithName)
+        if rows is None:
+            return [], False
+        return rows[:limit], len(rows) > limit
 
     def count_completed_referrals(self, user_id):
-        """Count completed referrals for a user"""
-        query = "SELECT COUNT(*) FROM referrals WHERE referrer_id = %s AND status = 'completed'"
-        result = self.execute_query(query, (user_id,), fetch=True)
-        return result[0]['count'] if result else 0
+        """Completed referrals for a user, from the trigger-maintained counter"""
+        user = self.get_user(user_id)
+        return user['completed_referral_count'] if user else 0
+
+    # Referral leaderboard (materialized view refreshed by the scheduler)
+    def refresh_referral_leaderboard(self):
+        """Recompute referral_leaderboard without blocking readers"""
+        result = self.execute_query("REFRESH MATERIALIZED VIEW CONCURRENTLY referral_leaderboard")
+        self.leaderboard_cache.invalidate_tag('leaderboard')
+        return result
+
+    def get_leaderboard(self, period='month', limit=10):
+        """Top referrers for 'week', 'month' or 'all', with names"""
+        key = ('top', period, limit)
+        rows = self.leaderboard_cache.get(key)
+        if rows is not None:
+            return rows
+        query = """
+        SELECT l.rank, l.referrer_id, l.referrals, l.completed_referrals, l.refreshed_at, u.name
+        FROM referral_leaderboard l
+        JOIN users u ON u.user_id = l.referrer_id
+        WHERE l.period = %s
+        ORDER BY l.rank, l.referrer_id
+        LIMIT %s
+        """
+        rows = self.execute_query(query, (period, limit), fetch=True)
+        if rows is not None:
+            self.leaderboard_cache.set(key, rows, tag='leaderboard')
+        return rows or []
+
+    def get_referral_ranks(self, user_id):
+        """{period: {'rank', 'referrals'}} for a user; periods without referrals are absent"""
+        key = ('rank', user_id)
+        ranks = self.leaderboard_cache.get(key)
+        if ranks is not None:
+            return ranks
+        query = "SELECT period, rank, referrals FROM referral_leaderboard WHERE referrer_id = %s"
+        rows = self.execute_query(query, (user_id,), fetch=True)
+        if rows is None:
+            return {}
+        ranks = {row['period']: {'rank': row['rank'], 'referrals': row['referrals']} for row in rows}
+        self.leaderboard_cache.set(key, ranks, tag='leaderboard')
+        return ranks
+
+    def get_referral_tree(self, user_id, max_depth=3, limit=200):
+        """Users referred by `user_id` and, recursively, by them, up to `max_depth`
+        levels, breadth-first. Each row carries its depth (1 = direct referral)."""
+        key = ('tree', user_id, max_depth, limit)
+        rows = self.leaderboard_cache.get(key)
+        if rows is not None:
+            return rows
+        query = """
+        WITH RECURSIVE tree AS (
+            SELECT user_id, name, referred_by, joined_at, 1 AS depth, ARRAY[user_id] AS path
+            FROM users WHERE referred_by = %s
+            UNION ALL
+            SELECT u.user_id, u.name, u.referred_by, u.joined_at, t.depth + 1, t.path || u.user_id
+            FROM users u
+            JOIN tree t ON u.referred_by = t.user_id
+            WHERE t.depth < %s AND NOT u.user_id = ANY(t.path)
+        )
+        SELECT user_id, name, referred_by, joined_at, depth FROM tree
+        ORDER BY depth, joined_at
+        LIMIT %s
+        """
+        rows = self.execute_query(query, (user_id, max_depth, limit), fetch=True)
+        if rows is not None:
+            self.leaderboard_cache.set(key, rows, tag='leaderboard')
+        return rows or []
 
     def set_user_referred_by(self, user_id, referrer_id):
         """Set referred_by for a user"""
         query = "UPDATE users SET referred_by = %s WHERE user_id = %s"
-        return self.execute_query(query, (referrer_id, user_id))
+        result = self.execute_query(query, (referrer_id, user_id))
+        self.invalidate_user(user_id)
+        return result
     
     # Admin queries
     def get_all_users(self, status=None):
+        return [row for chunk in self.iter_all_users(status) for row in chunk]
+
+    def iter_all_users(self, status=None, chunk_size=None):
+        """Stream users, newest first, optionally filtered on is_active"""
         if status:
-            query = "SELECT * FROM users WHERE is_active = %s ORDER BY joined_at DESC"
-            return self.execute_query(query, (status,), fetch=True)
+            query = f"SELECT {User.columns()} FROM users WHERE is_active = %s ORDER BY joined_at DESC"
+            return self.stream_query(query, (status,), chunk_size, model=User)
         else:
-            query = "SELECT * FROM users ORDER BY joined_at DESC"
-            return self.execute_query(query, fetch=True)
+            query = f"SELECT {User.columns()} FROM users ORDER BY joined_at DESC"
+            return self.stream_query(query, chunk_size=chunk_size, model=User)
     
-    def get_user_stats(self):
-        query = """
-        SELECT 
-            COUNT(*) as total_users,
-            COUNT(CASE WHEN joined_at > CURRENT_DATE - INTERVAL '7 days' THEN 1 END) as new_this_week,
-            COUNT(CASE WHEN is_active = true THEN 1 END) as active_users
-        FROM users
+    def count_users(self, active_only=False):
+        column = "active_users" if active_only else "total_users"
+        result = self.execute_query(f"SELECT {column} AS count FROM stats_totals", fetch=True)
+        return result[0]['count'] if result else 0
+
+    def get_users_with_subscription(self, active_only=False, after=None, limit=500, before=None):
+        """One page of users, newest first, each joined with its current active
+        subscription (subscription_* columns are NULL when there is none).
+        `after`/`before` are (joined_at, user_id) keys bounding the page."""
+        conditions, params = [], []
+        if active_only:
+            conditions.append("u.is_active = true")
+        if after:
+            conditions.append("(u.joined_at, u.user_id) < (%s, %s)")
+            params.extend(after)
+        if before:
+            conditions.append("(u.joined_at, u.user_id) > (%s, %s)")
+            params.extend(before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # Walking backwards reads ascending from the cursor; flipped below
+        order = "ASC" if before else "DESC"
+        query = f"""
+        SELECT u.*, s.id AS subscription_id, s.service AS subscription_service,
+               s.duration AS subscription_duration, s.expiry_date AS subscription_expiry_date
+        FROM users u
+        LEFT JOIN LATERAL (
+            SELECT id, service, duration, expiry_date FROM subscriptions
+            WHERE user_id = u.user_id AND status = 'active' AND expiry_date > CURRENT_TIMESTAMP
+            ORDER BY expiry_date DESC LIMIT 1
+        ) s ON TRUE
+        {where}
+        ORDER BY u.joined_at {order}, u.user_id {order}
+        LIMIT %s
         """
-        result = self.execute_query(query, fetch=True)
-        return result[0] if result else None
+        params.append(limit)
+        rows = self.execute_query(query, tuple(params), fetch=True)
+        if rows and before:
+            rows.reverse()
+        return rows
+
+    def get_users_page(self, after=None, before=None, limit=20):
+        """Keyset page of users (with active subscription) for the admin list.
+        Returns (rows, has_more), where has_more tells whether another page
+        exists further in the direction being paged."""
+        rows = self.get_users_with_subscription(after=after, before=before, limit=limit + 1) or []
+        return self._trim_page(rows, limit, backwards=bool(before))
+
+    def iter_users_with_subscription(self, active_only=False, chunk_size=None):
+        """Yield get_users_with_subscription() pages until the table is exhausted.
+
+        Keyset pages rather than stream_query(): the broadcast consuming this
+        sleeps between sends, and a server-side cursor would pin a pooled
+        connection and an open transaction for the whole run.
+        """
+        chunk_size = chunk_size or DB_FETCH_SIZE
+        after = None
+        while True:
+            rows = self.get_users_with_subscription(active_only, after, chunk_size)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            after = (rows[-1]['joined_at'], rows[-1]['user_id'])
     
-    def get_revenue_stats(self):
+    # Scheduler run history (catch-up after downtime)
+    def get_scheduler_runs(self):
+        """{job_name: last_scheduled_at} for every job that has run"""
+        result = self.execute_query("SELECT job_name, last_scheduled_at FROM scheduler_runs", fetch=True)
+        if result is None:
+            return None
+        return {row['job_name']: row['last_scheduled_at'] for row in result}
+
+    def record_scheduler_run(self, job_name, scheduled_at, started_at, finished_at, duration_ms, status, error=None):
         query = """
-        SELECT 
-            SUM(amount) as total_revenue,
-            COUNT(*) as total_payments,
-            AVG(amount) as avg_payment
-        FROM payments WHERE status = 'approved'
+        INSERT INTO scheduler_runs (job_name, last_scheduled_at, last_started_at, last_finished_at,
+                                    last_duration_ms, last_status, last_error)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (job_name) DO UPDATE SET
+        last_scheduled_at = EXCLUDED.last_scheduled_at,
+        last_started_at = EXCLUDED.last_started_at,
+        last_finished_at = EXCLUDED.last_finished_at,
+        last_duration_ms = EXCLUDED.last_duration_ms,
+        last_status = EXCLUDED.last_status,
+        last_error = EXCLUDED.last_error
+        """
+        return self.execute_query(query, (job_name, scheduled_at, started_at, finished_at, duration_ms, status, error))
+
+    def get_stats_summary(self):
+        """Admin dashboard numbers from the trigger-maintained rollups (O(1) reads)"""
+        query = """
+        SELECT
+            t.total_users,
+            t.active_users,
+            t.pending_payments,
+            t.approved_payments AS total_payments,
+            t.total_revenue,
+            CASE WHEN t.approved_payments > 0 THEN t.total_revenue / t.approved_payments ELSE 0 END AS avg_payment,
+            COALESCE(w.new_users, 0) AS new_this_week,
+            COALESCE(w.approved_payments, 0) AS weekly_payments,
+            COALESCE(w.revenue, 0) AS weekly_revenue
+        FROM stats_totals t
+        CROSS JOIN LATERAL (
+            SELECT SUM(new_users) AS new_users, SUM(approved_payments) AS approved_payments, SUM(revenue) AS revenue
+            FROM stats_daily WHERE day >= CURRENT_DATE - 7
+        ) w
         """
         result = self.execute_query(query, fetch=True)
         return result[0] if result else None
 
-# Global database instance
+    def close(self):
+        """Flush pending sessions and release the pool (idempotent)"""
+        if not self.pool:
+            return
+        self.sessions.stop()
+        self.pool.close()
+        self.pool = None
+
+class AsyncDatabase:
+    """Awaitable facade over Database for use inside the bot's event loop.
+
+    Every Database method is exposed as a coroutine that runs on a worker
+    thread, so a slow query never stalls other updates and concurrent
+    handlers overlap their round-trips. The executor is sized to the pool.
+    """
+
+    def __init__(self, database, max_workers):
+        self._db = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(attr, *args, **kwargs))
+
+        method.__name__ = name
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, method)
+        return method
+
+    async def run(self, func, *args, **kwargs):
+        """Run func(database, *args, **kwargs) on a worker thread, for helpers
+        outside Database that need its pool (e.g. bulk_io)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, self._db, *args, **kwargs))
+
+    async def iterate(self, name, *args, **kwargs):
+        """Drive a chunk-yielding Database generator (e.g. iter_users_with_subscription)
+        from the event loop, fetching each chunk on a worker thread"""
+        loop = asyncio.get_running_loop()
+        generator = getattr(self._db, name)(*args, **kwargs)
+        done = object()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self._executor, next, generator, done)
+                if chunk is done:
+                    return
+                yield chunk
+        finally:
+            await loop.run_in_executor(self._executor, generator.close)
+
+# Global database instances: `db` for synchronous callers, `adb` for handlers
 db = Database()
+adb = AsyncDatabase(db, DB_POOL_MAX_SIZE)
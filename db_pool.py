@@ -0,0 +1,144 @@
+import random
+import threading
+import time
+import logging
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import RealDictCursor
+from circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection or server is gone, as opposed to a bad statement
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection frees up within the acquire timeout"""
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool with a bounded wait on acquire.
+
+    ThreadedConnectionPool raises immediately once every connection is
+    checked out; the semaphore in front of it makes callers queue for up
+    to `timeout` seconds instead.
+
+    Connections are probed before reuse and dropped when they turn out to
+    be dead, so the pool heals itself after a database restart. A circuit
+    breaker makes callers fail fast while the server is unreachable
+    rather than each waiting out a connect timeout.
+    """
+
+    def __init__(self, dsn, min_size, max_size, timeout, health_check_interval=30,
+                 connect_retries=5, breaker=None):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.breaker = breaker or CircuitBreaker('postgres')
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}  # id(connection) -> monotonic time it was last returned
+        self._pool = self._open(connect_retries)
+
+    def _open(self, retries):
+        """Create the underlying pool, retrying with jittered backoff on startup"""
+        for attempt in range(retries + 1):
+            try:
+                return ThreadedConnectionPool(self.min_size, self.max_size, self.dsn, cursor_factory=RealDictCursor)
+            except CONNECTION_ERRORS as e:
+                if attempt == retries:
+                    raise
+                delay = random.uniform(0, min(2 ** attempt, 30))
+                logger.warning(f"Database connect attempt {attempt + 1} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    @contextmanager
+    def connection(self):
+        """Check out a live connection, returning it to the pool afterwards"""
+        trial = self.breaker.before_call()
+        if not self._slots.acquire(timeout=self.timeout):
+            if trial:
+                self.breaker.release_trial()
+            raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+        try:
+            connection = self._checkout()
+        except Exception:
+            self._slots.release()
+            if trial:
+                self.breaker.release_trial()
+            raise
+        broken = False
+        try:
+            yield connection
+        except CONNECTION_ERRORS as e:
+            broken = True
+            self.breaker.record_failure(e)
+            raise
+        except Exception:
+            # A failed statement still proves the server is reachable
+            broken = connection.closed != 0
+            if not broken:
+                self.breaker.record_success()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            # Covers GeneratorExit from abandoned streams, which skips the branches above
+            if trial:
+                self.breaker.release_trial()
+            self._checkin(connection, broken)
+            self._slots.release()
+
+    def _checkout(self):
+        """getconn() plus a liveness probe; dead connections are replaced once"""
+        for attempt in range(2):
+            try:
+                connection = self._pool.getconn()
+            except CONNECTION_ERRORS as e:
+                self.breaker.record_failure(e)
+                raise
+            if self._is_alive(connection):
+                return connection
+            logger.warning("Discarding dead pooled database connection")
+            self._checkin(connection, broken=True)
+        error = psycopg2.OperationalError("Could not obtain a live database connection")
+        self.breaker.record_failure(error)
+        raise error
+
+    def _is_alive(self, connection):
+        """Cheap check first; a round-trip only for connections idle a while"""
+        if connection.closed:
+            return False
+        if connection.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        idle_since = self._last_used.get(id(connection))
+        if idle_since is not None and time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except CONNECTION_ERRORS:
+            return False
+
+    def _checkin(self, connection, broken=False):
+        if broken:
+            self._last_used.pop(id(connection), None)
+        else:
+            self._last_used[id(connection)] = time.monotonic()
+        try:
+            self._pool.putconn(connection, close=broken or bool(connection.closed))
+        except Exception as e:
+            logger.error(f"Failed to return connection to pool: {e}")
+
+    def health(self):
+        """Breaker state and pool occupancy for monitoring"""
+        return dict(self.breaker.stats(), pool_max=self.max_size, pool_in_use=len(self._pool._used))
+
+    def close(self):
+        """Close every pooled connection"""
+        self._pool.closeall()
+        logger.info("Database connection pool closed")
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import time
+from email_service import REJECTED
+
+logger = logging.getLogger(__name__)
+
+class OutboxWorker:
+    """Delivers queued emails from the email_outbox table.
+
+    Handlers never talk to SMTP: they write the email in the same
+    transaction as the change it reports (see Database._execute_with_email)
+    or queue it with enqueue_email(), and return. drain() claims due rows
+    in batches (SKIP LOCKED, so replicas never share a row), sends each
+    batch over one pooled SMTP session on a worker thread, and marks the
+    result. Failed emails are retried with exponential backoff; after
+    `max_attempts` they are moved to the dead letters (status 'dead').
+    Emails the server rejects permanently (5xx) go there straight away.
+    Emails the send quota defers don't use up an attempt; they wait for
+    the next quota window.
+    """
+
+    def __init__(self, database, email_service, batch_size=50, max_attempts=6, base_delay=30, max_batches=20):
+        self._db = database  # AsyncDatabase
+        self.email_service = email_service
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_batches = max_batches
+
+    async def drain(self):
+        """Send everything due (up to max_batches batches); returns the counts"""
+        started = time.perf_counter()
+        summary = {'sent': 0, 'retrying': 0, 'dead': 0, 'deferred': 0}
+        for _ in range(self.max_batches):
+            batch = await self._db.claim_outbox_batch(self.batch_size)
+            if not batch:
+                break
+            results = await asyncio.to_thread(
+                self.email_service.send_many,
+                [(row['to_email'], row['subject'], row['body']) for row in batch]
+            )
+            sent = [row['id'] for row, ok in zip(batch, results) if ok]
+            failed = [row['id'] for row, ok in zip(batch, results) if ok is False]
+            deferred = [row['id'] for row, ok in zip(batch, results) if ok is None]
+            rejected = [row['id'] for row, ok in zip(batch, results) if ok is REJECTED]
+            await self._db.mark_outbox_sent(sent)
+            if rejected:
+                await self._db.mark_outbox_dead(rejected, "Rejected by the SMTP server")
+                logger.error(f"Moved {len(rejected)} emails the server rejected to the dead letters: {rejected}")
+            if deferred:
+                await self._db.defer_outbox(deferred, self.email_service.quota.deferred_until())
+            dead = await self._db.mark_outbox_failed(
+                failed, "SMTP send failed", self.max_attempts, self.base_delay
+            ) or []
+            if dead:
+                logger.error(f"Moved {len(dead)} emails to the dead letters after {self.max_attempts} attempts: {dead}")
+            summary['sent'] += len(sent)
+            summary['retrying'] += len(failed) - len(dead)
+            summary['dead'] += len(dead) + len(rejected)
+            summary['deferred'] += len(deferred)
+            if deferred or len(batch) < self.batch_size:
+                break
+        if any(summary.values()):
+            logger.info(
+                f"Email outbox: {summary['sent']} sent, {summary['retrying']} to retry, {summary['dead']} dead, "
+                f"{summary['deferred']} deferred by quota "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+        return summary
@@ -0,0 +1,125 @@
+import threading
+import time
+import logging
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Priority classes: transactional mail may use the whole quota, reminders
+# leave a reserve untouched so confirmations still go out on a busy day
+TRANSACTIONAL = 'transactional'
+REMINDER = 'reminder'
+PRIORITIES = (TRANSACTIONAL, REMINDER)
+
+# Share of the daily quota used before a warning is logged
+QUOTA_WARNING_SHARE = 0.8
+
+class EmailQuota:
+    """Token bucket for the provider's per-minute limit plus a per-day counter.
+
+    Senders call acquire() before a batch and only send what it grants;
+    the rest is deferred, and deferred_until() says when to try again.
+    Reminders may not dip into the last `reserve` share of either quota,
+    which is kept for transactional mail. A limit of 0 disables it.
+
+    The day is the server's local calendar day, and counts are per process.
+    That matches how it's used: only the scheduler leader sends mail.
+    """
+
+    def __init__(self, per_minute=20, per_day=500, reserve=0.2, max_wait=30):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._tokens = float(per_minute)
+        self._refilled = time.monotonic()
+        self._day = date.today()
+        self._used_today = 0
+        self._warned = False
+        self.counters = {priority: {'sent': 0, 'deferred': 0} for priority in PRIORITIES}
+
+    def acquire(self, count, priority=TRANSACTIONAL):
+        """Grant up to `count` sends, waiting up to max_wait seconds for the
+        per-minute bucket to refill (blocking; call from a worker thread).
+        Returns how many may be sent now."""
+        floor = 0.0 if priority == TRANSACTIONAL else self.reserve
+        deadline = time.monotonic() + self.max_wait
+        granted = 0
+        while granted < count:
+            with self._lock:
+                self._refill()
+                available = count - granted
+                if self.per_day:
+                    available = min(available, int(self.per_day * (1 - floor)) - self._used_today)
+                    if available < 1:
+                        break
+                if self.per_minute:
+                    bucket_floor = self.per_minute * floor
+                    available = min(available, int(self._tokens - bucket_floor))
+                    if available < 1:
+                        wait = (bucket_floor + 1 - self._tokens) * 60 / self.per_minute
+                    else:
+                        self._tokens -= available
+                if available >= 1:
+                    self._used_today += available
+                    granted += available
+                    continue
+            if time.monotonic() + wait > deadline:
+                break
+            time.sleep(wait)
+        with self._lock:
+            self.counters[priority]['sent'] += granted
+            self.counters[priority]['deferred'] += count - granted
+            self._check_usage()
+        return granted
+
+    def refund(self, count, priority=TRANSACTIONAL):
+        """Give back sends acquire() granted that were never accepted"""
+        with self._lock:
+            self._refill()
+            if self.per_minute:
+                self._tokens = min(self.per_minute, self._tokens + count)
+            self._used_today = max(self._used_today - count, 0)
+            self.counters[priority]['sent'] -= count
+
+    def deferred_until(self, priority=TRANSACTIONAL):
+        """When a deferred send of this priority is worth retrying: the next day
+        if the daily quota is spent, otherwise in a minute"""
+        with self._lock:
+            self._refill()
+            floor = 0.0 if priority == TRANSACTIONAL else self.reserve
+            if self.per_day and self._used_today >= int(self.per_day * (1 - floor)):
+                return datetime.combine(self._day + timedelta(days=1), datetime.min.time())
+        return datetime.now() + timedelta(minutes=1)
+
+    def stats(self):
+        with self._lock:
+            self._refill()
+            return {
+                'per_minute': self.per_minute,
+                'per_day': self.per_day,
+                'used_today': self._used_today,
+                'tokens': int(self._tokens),
+                'counters': {priority: dict(counts) for priority, counts in self.counters.items()},
+            }
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.per_minute:
+            self._tokens = min(self.per_minute, self._tokens + (now - self._refilled) * self.per_minute / 60)
+        self._refilled = now
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._used_today = 0
+            self._warned = False
+
+    def _check_usage(self):
+        if not self.per_day or self._warned or self._used_today < self.per_day * QUOTA_WARNING_SHARE:
+            return
+        self._warned = True
+        logger.warning(
+            f"Email quota: {self._used_today}/{self.per_day} sends used today; "
+            f"reminders stop at {int(self.per_day * (1 - self.reserve))}"
+        )
@@ -4,42 +4,120 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 import logging
-from config import EMAIL_USER, EMAIL_PASSWORD
+from config import (
+    EMAIL_USER, EMAIL_PASSWORD, SMTP_POOL_SIZE, SMTP_IDLE_TIMEOUT, SMTP_HEALTH_CHECK_INTERVAL,
+    EMAIL_QUOTA_PER_MINUTE, EMAIL_QUOTA_PER_DAY, EMAIL_QUOTA_RESERVE
+)
+from smtp_pool import SMTPPool, SMTP_CONNECTION_ERRORS
+from email_quota import EmailQuota, TRANSACTIONAL
 
 logger = logging.getLogger(__name__)
 
+class _Rejected:
+    """send_many() result for a message the server refused for good (5xx).
+    Falsy like False, so callers that only check success are unaffected."""
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'REJECTED'
+
+REJECTED = _Rejected()
+
+def is_permanent_failure(error):
+    """True for SMTP errors that resending won't fix (5xx replies)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(code >= 500 for code in codes)
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
 class EmailService:
     def __init__(self):
         self.email_user = EMAIL_USER
         self.email_password = EMAIL_PASSWORD
         self.smtp_server = "smtp.gmail.com"
         self.smtp_port = 587  # Changed from 465 to 587
+        # Logged-in sessions kept between sends (see smtp_pool.py)
+        self.pool = SMTPPool(
+            self.open_connection, SMTP_POOL_SIZE,
+            idle_timeout=SMTP_IDLE_TIMEOUT, health_check_interval=SMTP_HEALTH_CHECK_INTERVAL
+        )
+        # Provider send limits (see email_quota.py)
+        self.quota = EmailQuota(EMAIL_QUOTA_PER_MINUTE, EMAIL_QUOTA_PER_DAY, EMAIL_QUOTA_RESERVE)
     
-    def send_email(self, to_email, subject, body, is_html=False):
+    def open_connection(self):
+        """New logged-in SMTP connection (the pool calls this as needed)"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.email_user
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            if is_html:
-                msg.attach(MIMEText(body, 'html'))
-            else:
-                msg.attach(MIMEText(body, 'plain'))
-            
-            # Fixed SMTP connection
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.email_user, self.email_password)
-                server.send_message(msg)
-            
-            logger.info(f"Email sent successfully to {to_email}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to send email to {to_email}: {e}")
-            return False
+            server.starttls()
+            server.login(self.email_user, self.email_password)
+        except Exception:
+            server.close()
+            raise
+        return server
     
-    def send_welcome_email(self, user_name, user_email):
+    def build_message(self, to_email, subject, body, is_html=False):
+        msg = MIMEMultipart()
+        msg['From'] = self.email_user
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        if is_html:
+            msg.attach(MIMEText(body, 'html'))
+        else:
+            msg.attach(MIMEText(body, 'plain'))
+        return msg
+    
+    def send_email(self, to_email, subject, body, is_html=False):
+        return bool(self.send_many([(to_email, subject, body)], is_html)[0])
+    
+    def send_many(self, messages, is_html=False, priority=TRANSACTIONAL):
+        """Send (to_email, subject, body) tuples back to back over one pooled
+        session. If the session drops mid-batch it reconnects once and carries
+        on from the message that failed. Returns one True/False per message,
+        REJECTED for messages the server refused permanently (5xx), or None
+        for messages deferred because the send quota for `priority` ran out;
+        quota.deferred_until(priority) says when to retry those. Quota is only
+        charged for messages the server accepted."""
+        messages = list(messages)
+        allowed = self.quota.acquire(len(messages), priority)
+        if allowed < len(messages):
+            logger.warning(f"Email quota reached: deferring {len(messages) - allowed} {priority} emails")
+        pending = [self.build_message(to_email, subject, body, is_html) for to_email, subject, body in messages[:allowed]]
+        results = []
+        for attempt in range(2):
+            try:
+                with self.pool.session() as server:
+                    while len(results) < len(pending):
+                        msg = pending[len(results)]
+                        try:
+                            server.send_message(msg)
+                        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                            # Rejected message; the session itself is still usable
+                            logger.error(f"Failed to send email to {msg['To']}: {e}")
+                            results.append(REJECTED if is_permanent_failure(e) else False)
+                        else:
+                            logger.info(f"Email sent successfully to {msg['To']}")
+                            results.append(True)
+                break
+            except SMTP_CONNECTION_ERRORS as e:
+                if attempt:
+                    logger.error(f"SMTP connection lost again, {len(pending) - len(results)} emails not sent: {e}")
+                else:
+                    logger.warning(f"SMTP connection lost ({e}); reconnecting")
+            except Exception as e:
+                logger.error(f"Failed to send {len(pending) - len(results)} emails: {e}")
+                break
+        results.extend([False] * (len(pending) - len(results)))
+        unsent = sum(1 for result in results if not result)
+        if unsent:
+            self.quota.refund(unsent, priority)
+        return results + [None] * (len(messages) - allowed)
+    
+    def welcome_content(self, user_name):
         subject = "Welcome to Trading Mentor Bot! 🎉"
         body = f"""
 Dear {user_name},
@@ -59,9 +137,13 @@ If you have any questions, feel free to reach out to our support team.
 Best regards,
 Trading Mentor Team
         """
+        return subject, body
+    
+    def send_welcome_email(self, user_name, user_email):
+        subject, body = self.welcome_content(user_name)
         return self.send_email(user_email, subject, body)
     
-    def send_payment_confirmation(self, user_name, user_email, service, duration, amount):
+    def payment_confirmation_content(self, user_name, service, duration, amount):
         subject = f"Payment Confirmation - {service}"
         body = f"""
 Dear {user_name},
@@ -79,9 +161,18 @@ Thank you for choosing Trading Mentor Bot!
 Best regards,
 Trading Mentor Team
         """
+        return subject, body
+    
+    def send_payment_confirmation(self, user_name, user_email, service, duration, amount):
+        subject, body = self.payment_confirmation_content(user_name, service, duration, amount)
         return self.send_email(user_email, subject, body)
     
-    def send_expiry_warning(self, user_name, user_email, service, days_left):
+    def payment_rejected_content(self, user_name):
+        subject = "Payment Rejected"
+        body = f"Dear {user_name},\n\nYour payment was rejected. Please contact support or try again.\n\nBest regards,\nTrading Mentor Team"
+        return subject, body
+    
+    def expiry_warning_content(self, user_name, service, days_left):
         subject = f"Subscription Expiring Soon - {service}"
         body = f"""
 Dear {user_name},
@@ -95,6 +186,31 @@ Return to the bot to renew: [Bot Link]
 Best regards,
 Trading Mentor Team
         """
+        return subject, body
+    
+    def send_expiry_warning(self, user_name, user_email, service, days_left):
+        subject, body = self.expiry_warning_content(user_name, service, days_left)
+        return self.send_email(user_email, subject, body)
+    
+    def renewal_reminder_content(self, user_name, service):
+        subject = f"Renew Your {service} Subscription"
+        body = f"""
+Dear {user_name},
+
+Your {service} subscription expired recently.
+
+Don't miss out on continuing your trading journey!
+Renew now and get back to learning and earning.
+
+Return to the bot to renew: [Bot Link]
+
+Best regards,
+Trading Mentor Team
+        """
+        return subject, body
+    
+    def send_renewal_reminder(self, user_name, user_email, service):
+        subject, body = self.renewal_reminder_content(user_name, service)
         return self.send_email(user_email, subject, body)
     
     def send_admin_notification(self, admin_email, subject, message):
@@ -0,0 +1,60 @@
+import inspect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class ExpirySweeper:
+    """Expires lapsed subscriptions in bounded batches.
+
+    Each batch is its own short transaction, so the sweep never holds
+    locks on more than `batch_size` rows. Listeners registered with
+    add_listener() are called (and awaited, if coroutines) with every
+    batch of expired subscriptions (id, user_id, service, duration,
+    expiry_date), e.g. to remove users from their service groups.
+    """
+
+    def __init__(self, database, batch_size=500, max_batches=100):
+        self._db = database  # AsyncDatabase
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+        return listener
+
+    async def sweep(self):
+        """Expire everything due (up to max_batches batches); returns how many"""
+        started = time.perf_counter()
+        expired = 0
+        for _ in range(self.max_batches):
+            batch = await self._db.expire_due_subscriptions(self.batch_size)
+            if not batch:
+                break
+            expired += len(batch)
+            await self._emit(batch)
+            if len(batch) < self.batch_size:
+                break
+        else:
+            logger.warning(f"Expiry sweep stopped after {self.max_batches} batches; the rest waits for the next run")
+        if expired:
+            logger.info(f"Expired {expired} subscriptions in {time.perf_counter() - started:.2f}s")
+        return expired
+
+    async def expire(self, subscription_ids):
+        """Expire specific subscriptions now (e.g. from a timer at their exact
+        expiry time) and notify listeners; returns the rows expired"""
+        batch = await self._db.expire_subscriptions(subscription_ids)
+        if batch:
+            await self._emit(batch)
+        return batch or []
+
+    async def _emit(self, batch):
+        for listener in self._listeners:
+            try:
+                result = listener(batch)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Expiry listener {getattr(listener, '__name__', listener)} failed: {e}")
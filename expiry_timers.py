@@ -0,0 +1,173 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from telegram.error import RetryAfter
+from notification_dispatcher import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Shortest gap between reloads, however early a full page ends
+MIN_RELOAD_DELAY = timedelta(seconds=5)
+
+class ExpiryTimers:
+    """Expires subscriptions at their exact expiry time instead of at the next sweep.
+
+    A min-heap holds the active subscriptions expiring within the next
+    `horizon` minutes, loaded from one indexed query and reloaded every
+    half horizon, so memory stays bounded however many subscriptions
+    exist. When more than `max_entries` fall inside the horizon, the next
+    reload comes as soon as time reaches the last one loaded. Activations always expire at least 30 days out, far beyond the
+    horizon, so the reloads pick them up in time on every replica. When an
+    entry falls due it is expired through the sweeper (sweeper.expire()),
+    whose listeners then see the batch just as they see sweep batches.
+    Entries due together fire as one batch.
+
+    Timers fire only while `is_active()` is true (the scheduler leader);
+    other replicas keep their entries, and on_leadership() makes a newly
+    elected one reload and fire whatever came due in the meantime.
+    Anything missed is still caught by the regular sweep.
+    """
+
+    def __init__(self, database, sweeper, horizon_minutes=60, max_entries=10000, is_active=None):
+        self._db = database  # AsyncDatabase
+        self._sweeper = sweeper
+        self.horizon = timedelta(minutes=horizon_minutes)
+        self.max_entries = max_entries
+        self._is_active = is_active or (lambda: True)
+        self._heap = []  # (expiry_date, subscription_id)
+        self._due = {}  # subscription_id -> expiry_date of its live heap entry
+        self._loaded_until = None
+        self._next_reload = datetime.min
+        self._changed = asyncio.Event()
+        self._task = None
+        self.fired = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="expiry-timers")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def on_leadership(self, elected):
+        """Leader listener: reload straight away on election"""
+        if elected:
+            self._next_reload = datetime.now()
+            self._changed.set()
+
+    def stats(self):
+        return {
+            'pending': len(self._due),
+            'next_expiry': self._heap[0][0] if self._heap else None,
+            'fired': self.fired,
+        }
+
+    def _push(self, subscription_id, expiry_date):
+        # Superseded entries stay in the heap and are dropped when popped
+        self._due[subscription_id] = expiry_date
+        heapq.heappush(self._heap, (expiry_date, subscription_id))
+
+    async def _reload(self):
+        until = datetime.now() + self.horizon
+        rows = await self._db.get_upcoming_expiries(until, self.max_entries)
+        if rows is None:
+            return
+        self._heap, self._due = [], {}
+        for row in rows:
+            self._push(row['id'], row['expiry_date'])
+        # A full page may have cut the window short; don't claim more than was read
+        self._loaded_until = rows[-1]['expiry_date'] if len(rows) == self.max_entries else until
+        logger.debug(f"Expiry timers loaded {len(rows)} subscriptions up to {self._loaded_until:%H:%M}")
+
+    async def _run(self):
+        while True:
+            now = datetime.now()
+            if now >= self._next_reload:
+                await self._reload()
+                # A page cut short by max_entries is reloaded once time reaches its edge
+                self._next_reload = now + self.horizon / 2
+                if self._loaded_until is not None:
+                    self._next_reload = max(min(self._next_reload, self._loaded_until), now + MIN_RELOAD_DELAY)
+            active = self._is_active()
+            # Standby replicas keep their entries for when they are elected
+            due = self._pop_due(now) if active else []
+            if due:
+                try:
+                    expired = await self._sweeper.expire(due)
+                    self.fired += len(expired)
+                except Exception as e:
+                    logger.error(f"Expiry timers failed to expire {len(due)} subscriptions: {e}")
+            wake_at = self._next_reload
+            if active and self._heap:
+                wake_at = min(wake_at, self._heap[0][0])
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=max((wake_at - datetime.now()).total_seconds(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            expiry_date, subscription_id = heapq.heappop(self._heap)
+            if self._due.get(subscription_id) == expiry_date:
+                del self._due[subscription_id]
+                due.append(subscription_id)
+        return due
+
+class GroupRemover:
+    """Expiry listener that removes users from the SERVICE_GROUPS chat of each
+    expired subscription.
+
+    Removal is a ban followed by an unban, which kicks the user without
+    blocking a later rejoin on renewal. Users who still hold another
+    active subscription to the same group are left in. Calls are spaced
+    to `rate` per second to stay inside Telegram's limits.
+    """
+
+    def __init__(self, bot, database, service_groups, rate=20):
+        self.bot = bot
+        self._db = database  # AsyncDatabase
+        self.service_groups = service_groups
+        self.limiter = RateLimiter(rate)
+        self.removed = 0
+
+    async def __call__(self, subscriptions):
+        targets = []
+        for subscription in subscriptions:
+            group_id = self.service_groups.get(subscription['service'], {}).get(str(subscription['duration']))
+            if group_id:
+                targets.append((subscription, group_id))
+        if not targets:
+            return
+        still_active = await self._db.get_active_service_pairs({subscription['user_id'] for subscription, _ in targets})
+        if still_active is None:
+            logger.error(f"Skipping group removal for {len(targets)} subscriptions: could not check renewals")
+            return
+        for subscription, group_id in targets:
+            if (subscription['user_id'], subscription['service'], subscription['duration']) in still_active:
+                continue
+            await self._remove(group_id, subscription['user_id'])
+
+    async def _remove(self, group_id, user_id):
+        for attempt in range(2):
+            await self.limiter.wait()
+            try:
+                await self.bot.ban_chat_member(group_id, user_id)
+                await self.limiter.wait()
+                await self.bot.unban_chat_member(group_id, user_id, only_if_banned=True)
+                self.removed += 1
+                return
+            except RetryAfter as e:
+                # Flood control: back off as told, then retry once
+                if attempt:
+                    break
+                retry_after = e.retry_after
+                await asyncio.sleep(retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after)
+            except Exception as e:
+                logger.error(f"Failed to remove user {user_id} from group {group_id}: {e}")
+                return
+        logger.error(f"Gave up removing user {user_id} from group {group_id} after flood control")
@@ -2,15 +2,41 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Keyboar
 from telegram.ext import ContextTypes
 import logging
 import json
-from database import db
+import tempfile
+from datetime import datetime
+from database import adb
+from request_context import get_request_context
 from messages import get_message
 from config import SERVICES, SERVICE_GROUPS, TELERAM_USERNAME
-from utils import is_admin, format_currency, get_expiry_date, log_user_action
+from utils import is_admin, format_currency, log_user_action, encode_page_cursor, decode_page_cursor
 from email_service import email_service
-from datetime import datetime
+from query_stats import LATENCY_BUCKETS_MS
+from bulk_io import EXPORT_TABLES, export_table
 
 logger = logging.getLogger(__name__)
 
+USERS_PAGE_SIZE = 20
+PAYMENTS_PAGE_SIZE = 10
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024  # bots can send documents up to 50 MB
+
+def get_page_request(update: Update, prefix):
+    """Return (after, before) keyset cursors from a Next/Prev callback, or (None, None)"""
+    query = update.callback_query
+    if query and query.data and query.data.startswith(prefix):
+        direction, token = query.data[len(prefix):].split('_', 1)
+        cursor = decode_page_cursor(token)
+        return (cursor, None) if direction == 'next' else (None, cursor)
+    return None, None
+
+def build_page_navigation(prefix, first_key, last_key, has_prev, has_next):
+    """Prev/Next button row for a keyset-paginated listing"""
+    row = []
+    if has_prev:
+        row.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"{prefix}prev_{encode_page_cursor(*first_key)}"))
+    if has_next:
+        row.append(InlineKeyboardButton("Next ➡️", callback_data=f"{prefix}next_{encode_page_cursor(*last_key)}"))
+    return row
+
 async def handle_admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show admin panel"""
     user_id = update.effective_user.id
@@ -24,29 +50,28 @@ async def handle_admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     log_user_action(user_id, "admin_panel_access")
 
-    # Get statistics
-    user_stats = db.get_user_stats()
-    revenue_stats = db.get_revenue_stats()
-    pending_payments = db.get_pending_payments()
+    # Get statistics (precomputed rollups, one round-trip)
+    stats = await adb.get_stats_summary()
+    pending_count = stats['pending_payments'] if stats else 0
 
     message = f"""
 👨‍💼 **Admin Panel**
 
 📊 **User Statistics:**
-• Total Users: {user_stats['total_users'] if user_stats else 0}
-• New This Week: {user_stats['new_this_week'] if user_stats else 0}
-• Active Users: {user_stats['active_users'] if user_stats else 0}
+• Total Users: {stats['total_users'] if stats else 0}
+• New This Week: {stats['new_this_week'] if stats else 0}
+• Active Users: {stats['active_users'] if stats else 0}
 
 💰 **Revenue Statistics:**
-• Total Revenue: {format_currency(revenue_stats['total_revenue'] or 0) if revenue_stats else '$0.00'}
-• Total Payments: {revenue_stats['total_payments'] if revenue_stats else 0}
-• Average Payment: {format_currency(revenue_stats['avg_payment'] or 0) if revenue_stats else '$0.00'}
+• Total Revenue: {format_currency(stats['total_revenue'] or 0) if stats else '$0.00'}
+• Total Payments: {stats['total_payments'] if stats else 0}
+• Average Payment: {format_currency(stats['avg_payment'] or 0) if stats else '$0.00'}
 
-⏳ **Pending Payments:** {len(pending_payments) if pending_payments else 0}
+⏳ **Pending Payments:** {pending_count}
     """
 
     keyboard = [
-        [InlineKeyboardButton(f"💳 Pending Payments ({len(pending_payments) if pending_payments else 0})", callback_data="admin_pending_payments")],
+        [InlineKeyboardButton(f"💳 Pending Payments ({pending_count})", callback_data="admin_pending_payments")],
         [InlineKeyboardButton("👥 All Users", callback_data="admin_all_users")],
         [InlineKeyboardButton("📢 Broadcast Message", callback_data="admin_broadcast")],
         [InlineKeyboardButton("📤 Broadcast to User", callback_data="admin_broadcast_user")],
@@ -100,15 +125,21 @@ async def handle_pending_payments(update: Update, context: ContextTypes.DEFAULT_
             await update.message.reply_text("Access denied!")
         return
 
-    pending_payments = db.get_pending_payments()
+    after, before = get_page_request(update, "admin_payments_")
+    pending_payments, has_more = await adb.get_pending_payments_page(after, before, PAYMENTS_PAGE_SIZE)
+    if not pending_payments and (after or before):
+        # The page emptied out (payments processed meanwhile); start over
+        after = before = None
+        pending_payments, has_more = await adb.get_pending_payments_page(limit=PAYMENTS_PAGE_SIZE)
 
     if not pending_payments:
         message = "✅ No pending payments!"
         keyboard = [[InlineKeyboardButton("🔙 Back to Admin", callback_data="admin_panel")]]
     else:
-        message = f"💳 **Pending Payments ({len(pending_payments)})**\n\n"
+        total_pending = await adb.count_pending_payments()
+        message = f"💳 **Pending Payments ({total_pending})**\n\n"
         keyboard = []
-        for payment in pending_payments[:10]:  # Show max 10 at a time
+        for payment in pending_payments:
             service_info = SERVICES.get(payment['service'], {})
             service_name = service_info.get('name', payment['service'])
             payment_text = f"""
@@ -124,6 +155,15 @@ async def handle_pending_payments(update: Update, context: ContextTypes.DEFAULT_
                 InlineKeyboardButton(f"✅ Approve #{payment['id']}", callback_data=f"approve_payment_{payment['id']}"),
                 InlineKeyboardButton(f"❌ Reject #{payment['id']}", callback_data=f"reject_payment_{payment['id']}")
             ])
+        navigation = build_page_navigation(
+            "admin_payments_",
+            (pending_payments[0]['created_at'], pending_payments[0]['id']),
+            (pending_payments[-1]['created_at'], pending_payments[-1]['id']),
+            has_prev=bool(after) or (bool(before) and has_more),
+            has_next=bool(before) or has_more
+        )
+        if navigation:
+            keyboard.append(navigation)
         keyboard.append([InlineKeyboardButton("🔙 Back to Admin", callback_data="admin_panel")])
 
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -152,72 +192,72 @@ async def handle_approve_payment(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     payment_id = int(update.callback_query.data.split('_')[2])
-    payment = db.get_payment(payment_id)
-    if not payment:
-        await update.callback_query.answer("Payment not found.")
+
+    def confirmation_email(row):
+        # Queued in the approval's own transaction; the outbox worker sends it
+        if not row['email']:
+            return None
+        service_name = SERVICES.get(row['service'], {}).get('name', row['service'])
+        subject, body = email_service.payment_confirmation_content(row['name'], service_name, row['duration'], row['amount'])
+        return row['email'], subject, body
+
+    # Approve the payment and activate its subscription in one statement
+    approved = await adb.approve_and_activate(payment_id, user_id, compose_email=confirmation_email)
+    if approved is False:
+        logger.error(f"Failed to approve payment {payment_id}")
+        await update.callback_query.answer("❌ Failed to approve payment!")
         return
+    if not approved:
+        payment = await adb.get_payment(payment_id)
+        if not payment:
+            await update.callback_query.answer("Payment not found.")
+        elif payment['status'] != 'pending':
+            await update.callback_query.answer("Payment already processed!")
+        else:
+            logger.error(f"Failed to approve payment {payment_id}")
+            await update.callback_query.answer("❌ Failed to approve payment!")
+        return
+
+    try:
+        service_info = SERVICES.get(approved['service'], {})
+        service_name = service_info.get('name', approved['service'])
 
-    # Activate subscription
-    subscription = db.get_active_subscription(payment['user_id'])
-    if subscription:
-        service = subscription['service']
-        duration = str(subscription['duration'])
-        group_id = SERVICE_GROUPS.get(service, {}).get(duration)
+        # Add user to the group for the subscription just activated
+        group_id = SERVICE_GROUPS.get(approved['service'], {}).get(str(approved['duration']))
         if group_id:
             try:
-                await context.bot.invite_chat_member(group_id, payment['user_id'])
+                await context.bot.invite_chat_member(group_id, approved['user_id'])
             except Exception as e:
-                logger.error(f"Failed to add user {payment['user_id']} to group {group_id}: {e}")
-
-    try:
-        db.approve_payment(payment_id, user_id)
-        subscription_query = "SELECT * FROM subscriptions WHERE id = %s"
-        subscription_result = db.execute_query(subscription_query, (payment['subscription_id'],), fetch=True)
-        if subscription_result:
-            subscription = subscription_result[0]
-            start_date = datetime.now()
-            expiry_date = get_expiry_date(subscription['duration'])
-            db.activate_subscription(subscription['id'], start_date, expiry_date)
-            user = db.get_user(payment['user_id'])
-            if user:
-                service_info = SERVICES.get(subscription['service'], {})
-                service_name = service_info.get('name', subscription['service'])
-                # Send confirmation email
-                email_service.send_payment_confirmation(
-                    user['name'],
-                    user['email'],
-                    service_name,
-                    subscription['duration'],
-                    payment['amount']
-                )
-                # Send confirmation to user
-                user_language = user.get('language', 'en')
-                bot_message = get_message(
-                    user_language,
-                    'bot_payment_approved',
-                    service=service_name,
-                    duration=subscription['duration'],
-                    amount=payment['amount'],
-                    expiry_date=expiry_date.strftime('%B %d, %Y')
-                )
-                keyboard = [[InlineKeyboardButton("📊 My Dashboard", callback_data="show_dashboard")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                try:
-                    await context.bot.send_message(
-                        chat_id=payment['user_id'],
-                        text=bot_message,
-                        parse_mode='Markdown',
-                        reply_markup=reply_markup
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to notify user {payment['user_id']}: {e}")
+                logger.error(f"Failed to add user {approved['user_id']} to group {group_id}: {e}")
+
+        # Send confirmation to user
+        user_language = approved['language'] or 'en'
+        bot_message = get_message(
+            user_language,
+            'bot_payment_approved',
+            service=service_name,
+            duration=approved['duration'],
+            amount=approved['amount'],
+            expiry_date=approved['expiry_date'].strftime('%B %d, %Y')
+        )
+        keyboard = [[InlineKeyboardButton("📊 My Dashboard", callback_data="show_dashboard")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        try:
+            await context.bot.send_message(
+                chat_id=approved['user_id'],
+                text=bot_message,
+                parse_mode='Markdown',
+                reply_markup=reply_markup
+            )
+        except Exception as e:
+            logger.error(f"Failed to notify user {approved['user_id']}: {e}")
 
         log_user_action(user_id, "approve_payment", payment_id)
         await update.callback_query.answer("✅ Payment approved!")
         await handle_pending_payments(update, context)
     except Exception as e:
-        logger.error(f"Failed to approve payment {payment_id}: {e}")
-        await update.callback_query.answer("❌ Failed to approve payment!")
+        logger.error(f"Failed to finish approval of payment {payment_id}: {e}")
+        await update.callback_query.answer("✅ Payment approved, but notifying the user failed!")
 
 async def handle_reject_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Reject a payment and notify user (and email)"""
@@ -231,54 +271,59 @@ async def handle_reject_payment(update: Update, context: ContextTypes.DEFAULT_TY
         return
 
     payment_id = int(update.callback_query.data.split('_')[2])
-    payment = db.get_payment(payment_id)
-    if not payment:
-        await update.callback_query.answer("Payment not found!")
-        return
 
-    if payment['status'] != 'pending':
-        await update.callback_query.answer("Payment already processed!")
+    def rejection_email(row):
+        if not row['email']:
+            return None
+        return (row['email'],) + email_service.payment_rejected_content(row['name'])
+
+    # Reject only if still pending, getting the user details back (and queueing the email) in one transaction
+    rejected = await adb.reject_with_details(payment_id, user_id, compose_email=rejection_email)
+    if rejected is False:
+        logger.error(f"Failed to reject payment {payment_id}")
+        await update.callback_query.answer("❌ Failed to reject payment!")
+        return
+    if not rejected:
+        payment = await adb.get_payment(payment_id)
+        if not payment:
+            await update.callback_query.answer("Payment not found!")
+        elif payment['status'] != 'pending':
+            await update.callback_query.answer("Payment already processed!")
+        else:
+            logger.error(f"Failed to reject payment {payment_id}")
+            await update.callback_query.answer("❌ Failed to reject payment!")
         return
 
     try:
-        db.reject_payment(payment_id, user_id)
-        user = db.get_user(payment['user_id'])
-        if user:
-            user_language = user.get('language', 'en')
-            user_message = get_message(
-                user_language,
-                'bot_payment_rejected',
-                amount=payment['amount'],
-                payment_method=payment['payment_method']
-            )
-            # Prepare support contact
-            SUPPORT_USERNAME = f"{TELERAM_USERNAME}" if TELERAM_USERNAME else "support"
-            keyboard = [
-                [InlineKeyboardButton("📚 Try Again", callback_data="browse_services")],
-                [InlineKeyboardButton("💬 Contact Support", url=f"https://t.me/{SUPPORT_USERNAME}")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            try:
-                await context.bot.send_message(
-                    chat_id=payment['user_id'],
-                    text=user_message,
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                logger.error(f"Failed to notify user {payment['user_id']}: {e}")
-            # Send rejection email
-            email_service.send_email(
-                user['email'],
-                "Payment Rejected",
-                f"Dear {user['name']},\n\nYour payment was rejected. Please contact support or try again.\n\nBest regards,\nTrading Mentor Team"
+        user_language = rejected['language'] or 'en'
+        user_message = get_message(
+            user_language,
+            'bot_payment_rejected',
+            amount=rejected['amount'],
+            payment_method=rejected['payment_method']
+        )
+        # Prepare support contact
+        SUPPORT_USERNAME = f"{TELERAM_USERNAME}" if TELERAM_USERNAME else "support"
+        keyboard = [
+            [InlineKeyboardButton("📚 Try Again", callback_data="browse_services")],
+            [InlineKeyboardButton("💬 Contact Support", url=f"https://t.me/{SUPPORT_USERNAME}")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        try:
+            await context.bot.send_message(
+                chat_id=rejected['user_id'],
+                text=user_message,
+                parse_mode='Markdown',
+                reply_markup=reply_markup
             )
+        except Exception as e:
+            logger.error(f"Failed to notify user {rejected['user_id']}: {e}")
         log_user_action(user_id, "reject_payment", payment_id)
         await update.callback_query.answer("❌ Payment rejected!")
         await handle_pending_payments(update, context)
     except Exception as e:
-        logger.error(f"Failed to reject payment {payment_id}: {e}")
-        await update.callback_query.answer("❌ Failed to reject payment!")
+        logger.error(f"Failed to finish rejection of payment {payment_id}: {e}")
+        await update.callback_query.answer("❌ Payment rejected, but notifying the user failed!")
 
 async def handle_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show all users"""
@@ -291,16 +336,22 @@ async def handle_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Access denied!")
         return
     
-    users = db.get_all_users()
+    after, before = get_page_request(update, "admin_users_")
+    users, has_more = await adb.get_users_page(after, before, USERS_PAGE_SIZE)
+    if not users and (after or before):
+        # The cursor points past the last user (e.g. users deleted meanwhile); start over
+        after = before = None
+        users, has_more = await adb.get_users_page(limit=USERS_PAGE_SIZE)
+    keyboard = []
     
     if not users:
         message = "No users found!"
     else:
-        message = f"👥 **All Users ({len(users)})**\n\n"
+        total_users = await adb.count_users()
+        message = f"👥 **All Users ({total_users})**\n\n"
         
-        for user in users[:20]:  # Show max 20 at a time
-            active_sub = db.get_active_subscription(user['user_id'])
-            status = "🟢 Active" if active_sub else "🔴 No subscription"
+        for user in users:
+            status = "🟢 Active" if user['subscription_id'] else "🔴 No subscription"
             
             message += f"""
 **{user['name']}**
@@ -311,8 +362,17 @@ async def handle_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📊 {status}
 
             """
+        navigation = build_page_navigation(
+            "admin_users_",
+            (users[0]['joined_at'], users[0]['user_id']),
+            (users[-1]['joined_at'], users[-1]['user_id']),
+            has_prev=bool(after) or (bool(before) and has_more),
+            has_next=bool(before) or has_more
+        )
+        if navigation:
+            keyboard.append(navigation)
     
-    keyboard = [[InlineKeyboardButton("🔙 Back to Admin", callback_data="admin_panel")]]
+    keyboard.append([InlineKeyboardButton("🔙 Back to Admin", callback_data="admin_panel")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     if update.callback_query:
         await update.callback_query.edit_message_text(
@@ -328,6 +388,148 @@ async def handle_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
 
+async def handle_db_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the slowest statements by total time (/dbstats [limit])"""
+    user_id = update.effective_user.id
+
+    if not is_admin(user_id):
+        await update.message.reply_text("Access denied!")
+        return
+
+    limit = 10
+    if context.args and context.args[0].isdigit():
+        limit = max(1, min(int(context.args[0]), 25))
+
+    log_user_action(user_id, "db_stats")
+    statements = await adb.get_query_stats(limit)
+    cache = await adb.get_cache_stats()
+    health = await adb.get_health()
+
+    # Plain text: normalized SQL is full of characters Markdown would eat
+    message = f"🗄 Top {len(statements)} statements by total time\n\n"
+    for index, entry in enumerate(statements, 1):
+        p95 = f"{entry['p95_ms']}" if entry['p95_ms'] is not None else f">{LATENCY_BUCKETS_MS[-1]}"
+        message += (
+            f"{index}. {entry['total_ms']:.0f} ms total, {entry['calls']} calls, "
+            f"avg {entry['avg_ms']:.1f} ms, p95 ≤{p95} ms, max {entry['max_ms']:.0f} ms, "
+            f"{entry['rows']} rows, {entry['errors']} errors\n"
+            f"   {entry['query'][:200]}\n\n"
+        )
+    if not statements:
+        message += "No queries recorded yet.\n\n"
+    message += (
+        f"🔌 Postgres: {health['state']}, {health['pool_in_use']}/{health['pool_max']} connections in use"
+        + (f", retry in {health['retry_in']}s, last error: {health['last_error']}" if health['state'] != 'closed' else "")
+        + "\n"
+    )
+    smtp = email_service.pool.stats()
+    outbox = await adb.get_outbox_stats()
+    message += (
+        f"✉️ SMTP: {smtp['idle']} idle of {smtp['max_size']} sessions, "
+        f"{smtp['opened']} opened, {smtp['reused']} reused; "
+        f"outbox {outbox['pending']} pending, {outbox['dead']} dead\n"
+    )
+    quota = email_service.quota.stats()
+    message += (
+        f"📮 Email quota: {quota['used_today']}/{quota['per_day'] or '∞'} today, "
+        f"{quota['tokens']}/{quota['per_minute'] or '∞'} this minute; deferred "
+        + ", ".join(f"{priority} {counts['deferred']}" for priority, counts in quota['counters'].items())
+        + "\n"
+    )
+    message += (
+        f"👤 User cache: {cache['size']}/{cache['max_size']} entries, "
+        f"hit rate {cache['hit_rate']:.1%}, {cache['evictions']} evictions"
+    )
+
+    # Telegram caps messages at 4096 characters
+    await update.message.reply_text(message[:4096])
+
+async def handle_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send a table as a gzip CSV document (/export users|subscriptions|payments)"""
+    user_id = update.effective_user.id
+
+    if not is_admin(user_id):
+        await update.message.reply_text("Access denied!")
+        return
+
+    table = context.args[0].lower() if context.args else ''
+    if table not in EXPORT_TABLES:
+        await update.message.reply_text(f"Usage: /export {'|'.join(EXPORT_TABLES)}")
+        return
+
+    log_user_action(user_id, "export", table)
+    await update.message.reply_text(f"⏳ Exporting {table}...")
+    filename = f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv.gz"
+    # Spool to disk so the export never sits in memory
+    with tempfile.TemporaryFile() as fileobj:
+        try:
+            rows = await adb.run(export_table, table, fileobj)
+        except Exception as e:
+            logger.error(f"Failed to export {table}: {e}")
+            await update.message.reply_text("❌ Export failed!")
+            return
+        size = fileobj.tell()
+        if size > TELEGRAM_UPLOAD_LIMIT:
+            await update.message.reply_text(
+                f"❌ Export is {size / 1024 / 1024:.0f} MB, over Telegram's upload limit. "
+                f"Use `python bulk_io.py export {table}` on the server instead.",
+                parse_mode='Markdown'
+            )
+            return
+        fileobj.seek(0)
+        await context.bot.send_document(
+            chat_id=user_id,
+            document=fileobj,
+            filename=filename,
+            caption=f"📦 {table}: {rows} rows"
+        )
+
+async def handle_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show scheduled job timings (/jobs)"""
+    user_id = update.effective_user.id
+
+    if not is_admin(user_id):
+        await update.message.reply_text("Access denied!")
+        return
+
+    scheduler = context.application.bot_data.get('scheduler')
+    if not scheduler:
+        await update.message.reply_text("Scheduler is not running.")
+        return
+
+    lease = scheduler.leader.stats()
+    role = "leader" if lease['leader'] else "standby (jobs run on the leader replica)"
+    timers = scheduler.expiry_timers.stats()
+    message = f"⏰ Scheduled jobs — this replica: {role}\n"
+    message += f"Expiry timers: {timers['pending']} pending, {timers['fired']} fired"
+    if timers['next_expiry']:
+        message += f", next {timers['next_expiry']:%Y-%m-%d %H:%M}"
+    message += f"; {scheduler.group_remover.removed} group removals\n\n"
+    for job in scheduler.runner.stats():
+        state = "▶️ running" if job['running'] else (job['last_status'] or "not run yet")
+        message += f"{job['name']} ({job['cron']}): {state}\n"
+        if job['runs']:
+            message += (
+                f"   {job['runs']} runs, {job['failures']} failed, {job['skipped']} skipped; "
+                f"last {job['last_seconds']:.1f}s, avg {job['avg_seconds']:.1f}s, max {job['max_seconds']:.1f}s\n"
+            )
+        result = job['last_result']
+        if isinstance(result, dict) and 'email' in result:
+            message += (
+                f"   last run: email {result['email']['sent']} sent/{result['email']['failed']} failed/"
+                f"{result['email']['deferred']} deferred, "
+                f"telegram {result['telegram']['sent']} sent/{result['telegram']['failed']} failed\n"
+            )
+        elif isinstance(result, dict) and 'retrying' in result:
+            message += (
+                f"   last run: {result['sent']} sent, {result['retrying']} to retry, "
+                f"{result['dead']} dead, {result['deferred']} deferred\n"
+            )
+        if job['next_run']:
+            message += f"   next: {job['next_run']:%Y-%m-%d %H:%M}\n"
+
+    await update.message.reply_text(message[:4096])
+
 async def handle_broadcast_setup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Setup broadcast message"""
     user_id = update.effective_user.id
@@ -340,7 +542,7 @@ async def handle_broadcast_setup(update: Update, context: ContextTypes.DEFAULT_T
         return
     
     # Set session for broadcast
-    db.update_user_session(user_id, "admin_broadcast", json.dumps({}))
+    await adb.update_user_session(user_id, "admin_broadcast", json.dumps({}))
     
     message = """
 📢 **Broadcast Message**
@@ -382,68 +584,72 @@ async def handle_broadcast_message(update: Update, context: ContextTypes.DEFAULT
             await update.message.reply_text("Access denied!")
         return
     
-    session = db.get_user_session(user_id)
+    ctx = await get_request_context(update, context)
+    session = ctx.session
     if not session or session['current_step'] != 'admin_broadcast':
         await update.message.reply_text("Session expired. Please start over.")
         return
     
     broadcast_text = update.message.text.strip()
     
-    # Get all active users
-    users = db.get_all_users(status=True)
+    # Count active users; the users themselves are streamed in chunks below
+    total_users = await adb.count_users(active_only=True)
     
-    if not users:
+    if not total_users:
         await update.message.reply_text("No users found to broadcast to.")
         return
     
     # Clear session
-    db.clear_user_session(user_id)
+    await adb.clear_user_session(user_id)
     
     # Send broadcast
     sent_count = 0
     failed_count = 0
 
     status_message = await update.message.reply_text(
-        f"📢 Broadcasting to {len(users)} users...\n\nSent: 0\nFailed: 0"
+        f"📢 Broadcasting to {total_users} users...\n\nSent: 0\nFailed: 0"
     )
     
-    for i, user in enumerate(users):
-        try:
-            # Get user's active subscription for personalization
-            active_sub = db.get_active_subscription(user['user_id'])
-            service_name = active_sub['service'].replace('_', ' ').title() if active_sub else 'None'
-            expiry_date = active_sub['expiry_date'].strftime('%B %d, %Y') if active_sub else 'N/A'
-            
-            # Format message with user data
-            personalized_message = broadcast_text.format(
-                name=user['name'],
-                service=service_name,
-                expiry=expiry_date
-            )
-            
-            await context.bot.send_message(
-                chat_id=user['user_id'],
-                text=personalized_message,
-                parse_mode='Markdown'
-            )
-            sent_count += 1
-            
-        except Exception as e:
-            logger.error(f"Failed to send broadcast to user {user['user_id']}: {e}")
-            failed_count += 1
-        
-        # Update status every 10 messages
-        if (i + 1) % 10 == 0:
+    i = 0
+    async for users in adb.iterate('iter_users_with_subscription', active_only=True):
+        for user in users:
             try:
-                await status_message.edit_text(
-                    f"📢 Broadcasting to {len(users)} users...\n\nSent: {sent_count}\nFailed: {failed_count}\nProgress: {i + 1}/{len(users)}"
+                # Active subscription comes joined onto the user row for personalization
+                has_sub = user['subscription_id'] is not None
+                service_name = user['subscription_service'].replace('_', ' ').title() if has_sub else 'None'
+                expiry_date = user['subscription_expiry_date'].strftime('%B %d, %Y') if has_sub else 'N/A'
+                
+                # Format message with user data
+                personalized_message = broadcast_text.format(
+                    name=user['name'],
+                    service=service_name,
+                    expiry=expiry_date
                 )
-            except:
-                pass
+                
+                await context.bot.send_message(
+                    chat_id=user['user_id'],
+                    text=personalized_message,
+                    parse_mode='Markdown'
+                )
+                sent_count += 1
+                
+            except Exception as e:
+                logger.error(f"Failed to send broadcast to user {user['user_id']}: {e}")
+                failed_count += 1
+            
+            i += 1
+            # Update status every 10 messages
+            if i % 10 == 0:
+                try:
+                    await status_message.edit_text(
+                        f"📢 Broadcasting to {total_users} users...\n\nSent: {sent_count}\nFailed: {failed_count}\nProgress: {i}/{total_users}"
+                    )
+                except:
+                    pass
     
     # Final status
     await status_message.edit_text(
-        f"✅ Broadcast completed!\n\nSent: {sent_count}\nFailed: {failed_count}\nTotal: {len(users)}"
+        f"✅ Broadcast completed!\n\nSent: {sent_count}\nFailed: {failed_count}\nTotal: {i}"
     )
     
     log_user_action(user_id, "broadcast_message", f"sent:{sent_count}_failed:{failed_count}")
@@ -458,15 +664,15 @@ async def handle_broadcast_user_setup(update: Update, context: ContextTypes.DEFA
             await update.message.reply_text("Access denied!")
         return
 
-    # Get all users (limit to 20 for menu)
-    users = db.get_all_users()
+    # Get the newest users (limit to 20 for menu)
+    users, _ = await adb.get_users_page(limit=USERS_PAGE_SIZE)
     if not users:
         await update.message.reply_text("No users found!")
         return
 
     # Build inline keyboard with user names and IDs
     keyboard = []
-    for user in users[:20]:
+    for user in users:
         display = f"{user['name']} ({user['user_id']})"
         keyboard.append([InlineKeyboardButton(display, callback_data=f"admin_broadcast_user_select_{user['user_id']}")])
     keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data="admin_panel")])
@@ -495,9 +701,9 @@ async def handle_broadcast_user_select(update: Update, context: ContextTypes.DEF
 
     # Extract target user_id from callback data
     target_user_id = int(update.callback_query.data.split('_')[-1])
-    db.update_user_session(user_id, "admin_broadcast_user", json.dumps({"target_user_id": target_user_id}))
+    await adb.update_user_session(user_id, "admin_broadcast_user", json.dumps({"target_user_id": target_user_id}))
 
-    target_user = db.get_user(target_user_id)
+    target_user = await adb.get_user(target_user_id)
     if not target_user:
         await update.callback_query.edit_message_text("User not found.")
         return
@@ -518,7 +724,8 @@ async def handle_broadcast_user_message(update: Update, context: ContextTypes.DE
         await update.message.reply_text("Access denied!")
         return
 
-    session = db.get_user_session(user_id)
+    ctx = await get_request_context(update, context)
+    session = ctx.session
     if not session or session['current_step'] != 'admin_broadcast_user':
         await update.message.reply_text("Session expired. Please start over.")
         return
@@ -540,4 +747,4 @@ async def handle_broadcast_user_message(update: Update, context: ContextTypes.DE
     except Exception as e:
         logger.error(f"Failed to send broadcast to user {target_id}: {e}")
         await update.message.reply_text(f"❌ Failed to send message to user {target_id}.")
-    db.clear_user_session(user_id)
\ No newline at end of file
+    await adb.clear_user_session(user_id)
\ No newline at end of file
@@ -1,17 +1,25 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import logging
-from database import db
+from database import adb
+from request_context import get_request_context
 from messages import get_message
 from config import SERVICES
-from utils import format_currency, create_referral_link, log_user_action
+from utils import format_currency, create_referral_link, log_user_action, encode_page_cursor, decode_page_cursor
 
 logger = logging.getLogger(__name__)
 
+REFERRALS_PAGE_SIZE = 10
+REFERRALS_MORE_PREFIX = "show_referrals_after_"
+LEADERBOARD_SIZE = 10
+LEADERBOARD_PERIODS = {'week': "This Week", 'month': "This Month", 'all': "All Time"}
+REFERRAL_TREE_DEPTH = 3
+
 async def handle_show_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user dashboard"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         if update.callback_query:
@@ -24,11 +32,12 @@ async def handle_show_dashboard(update: Update, context: ContextTypes.DEFAULT_TY
     log_user_action(user_id, "view_dashboard")
     
     # Get active subscription
-    active_sub = db.get_active_subscription(user_id)
+    active_sub = ctx.active_subscription
     
-    # Get referral stats
-    referrals = db.get_user_referrals(user_id)
-    referral_count = len(referrals) if referrals else 0
+    # Referral count is kept on the user row; rank comes from the cached leaderboard
+    referral_count = user.get('referral_count', 0)
+    ranks = await adb.get_referral_ranks(user_id)
+    rank_info = f"\n• Rank this month: #{ranks['month']['rank']}" if 'month' in ranks else ""
     
     # Create referral link
     bot_username = context.bot.username
@@ -68,7 +77,7 @@ async def handle_show_dashboard(update: Update, context: ContextTypes.DEFAULT_TY
 {subscription_info}
 
 🤝 **Referral Program:**
-• Referrals: {referral_count}
+• Referrals: {referral_count}{rank_info}
 • Your link: `{referral_link}`
 
 💡 Share your referral link to earn rewards!
@@ -106,7 +115,8 @@ async def handle_show_dashboard(update: Update, context: ContextTypes.DEFAULT_TY
 async def handle_show_referrals(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show referral program details"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         if update.callback_query:
@@ -118,8 +128,12 @@ async def handle_show_referrals(update: Update, context: ContextTypes.DEFAULT_TY
     
     log_user_action(user_id, "view_referrals")
     
-    # Get referral stats
-    referrals = db.get_user_referrals(user_id)
+    # One page of referrals, continuing after the cursor from a "More" button
+    after = None
+    data = update.callback_query.data if update.callback_query else ''
+    if data.startswith(REFERRALS_MORE_PREFIX):
+        after = decode_page_cursor(data[len(REFERRALS_MORE_PREFIX):])
+    referrals, has_more = await adb.get_user_referrals_page(user_id, after, REFERRALS_PAGE_SIZE)
     
     # Create referral link
     bot_username = context.bot.username
@@ -132,7 +146,7 @@ async def handle_show_referrals(update: Update, context: ContextTypes.DEFAULT_TY
 `{referral_link}`
 
 📊 **Statistics:**
-• Total Referrals: {len(referrals) if referrals else 0}
+• Total Referrals: {user.get('referral_count', 0)}
 • Pending Rewards: 0
 • Total Earned: Coming soon
 
@@ -146,9 +160,11 @@ async def handle_show_referrals(update: Update, context: ContextTypes.DEFAULT_TY
     """
     
     if referrals:
-        for i, referral in enumerate(referrals[:10], 1):  # Show max 10
+        for referral in referrals:
             status_emoji = "✅" if referral['status'] == 'completed' else "⏳"
-            message += f"{i}. {status_emoji} {referral['referred_name']} - {referral['created_at'].strftime('%m/%d/%Y')}\n"
+            message += f"• {status_emoji} {referral['referred_name']} - {referral['created_at'].strftime('%m/%d/%Y')}\n"
+    elif after:
+        message += "No more referrals."
     else:
         message += "No referrals yet. Start sharing your link!"
     
@@ -157,6 +173,14 @@ async def handle_show_referrals(update: Update, context: ContextTypes.DEFAULT_TY
         [InlineKeyboardButton("📱 Share Link", url=f"https://t.me/share/url?url={referral_link}&text=Join me on Trading Mentor Bot!")],
         [InlineKeyboardButton("🔙 Back to Dashboard", callback_data="show_dashboard")]
     ]
+    keyboard.insert(0, [
+        InlineKeyboardButton("🏆 Leaderboard", callback_data="referral_leaderboard_month"),
+        InlineKeyboardButton("🌳 Referral Tree", callback_data="referral_tree")
+    ])
+    if has_more:
+        last = referrals[-1]
+        cursor = encode_page_cursor(last['created_at'], last['id'])
+        keyboard.insert(0, [InlineKeyboardButton("➡️ More Referrals", callback_data=f"{REFERRALS_MORE_PREFIX}{cursor}")])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -176,7 +200,8 @@ async def handle_show_referrals(update: Update, context: ContextTypes.DEFAULT_TY
 async def handle_copy_referral_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle copy referral link"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         if update.callback_query:
@@ -197,7 +222,8 @@ async def handle_copy_referral_link(update: Update, context: ContextTypes.DEFAUL
 async def handle_update_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle profile update request"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         if update.callback_query:
@@ -236,4 +262,87 @@ What would you like to update?
 async def handle_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Return to main menu"""
     from handlers.start_handler import show_main_menu
-    await show_main_menu(update, context)
\ No newline at end of file
+    await show_main_menu(update, context)
+
+async def handle_referral_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show top referrers for a period plus the user's own rank"""
+    user_id = update.effective_user.id
+    period = update.callback_query.data[len("referral_leaderboard_"):]
+    if period not in LEADERBOARD_PERIODS:
+        period = 'month'
+
+    log_user_action(user_id, "view_leaderboard", period)
+
+    leaders = await adb.get_leaderboard(period, LEADERBOARD_SIZE)
+    ranks = await adb.get_referral_ranks(user_id)
+
+    message = f"🏆 **Top Referrers - {LEADERBOARD_PERIODS[period]}**\n\n"
+    if leaders:
+        medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+        for leader in leaders:
+            marker = " ← you" if leader['referrer_id'] == user_id else ""
+            badge = medals.get(leader['rank'], f"#{leader['rank']}")
+            message += f"{badge} {leader['name']} - {leader['referrals']}{marker}\n"
+        message += f"\n_Updated {leaders[0]['refreshed_at'].strftime('%H:%M')}_\n"
+    else:
+        message += "No referrals yet in this period.\n"
+
+    own = ranks.get(period)
+    if own:
+        message += f"\n📍 Your rank: #{own['rank']} ({own['referrals']} referrals)"
+    else:
+        message += "\n📍 You're not ranked yet. Share your link to get on the board!"
+
+    keyboard = [
+        [
+            InlineKeyboardButton(("• " if key == period else "") + label, callback_data=f"referral_leaderboard_{key}")
+            for key, label in LEADERBOARD_PERIODS.items()
+        ],
+        [InlineKeyboardButton("🔙 Back to Referrals", callback_data="show_referrals")]
+    ]
+    await update.callback_query.edit_message_text(
+        message,
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def handle_referral_tree(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the user's referrals and their referrals, a few levels deep"""
+    user_id = update.effective_user.id
+
+    log_user_action(user_id, "view_referral_tree")
+
+    tree = await adb.get_referral_tree(user_id, REFERRAL_TREE_DEPTH)
+
+    message = "🌳 **Your Referral Tree**\n\n"
+    if tree:
+        per_level = {}
+        for node in tree:
+            per_level[node['depth']] = per_level.get(node['depth'], 0) + 1
+        message += "\n".join(f"Level {depth}: {count} people" for depth, count in sorted(per_level.items()))
+        message += "\n\n"
+        # Render depth-first under each direct referral; rows come breadth-first
+        children = {}
+        for node in tree:
+            children.setdefault(node['referred_by'], []).append(node)
+
+        lines = []
+        def render(parent_id, depth):
+            for node in children.get(parent_id, []):
+                if len(lines) >= 30:
+                    return
+                lines.append(f"{'    ' * (depth - 1)}└ {node['name']}")
+                render(node['user_id'], depth + 1)
+        render(user_id, 1)
+        message += "\n".join(lines)
+        if len(lines) < len(tree):
+            message += f"\n… and {len(tree) - len(lines)} more"
+    else:
+        message += "No referrals yet. Start sharing your link!"
+
+    keyboard = [[InlineKeyboardButton("🔙 Back to Referrals", callback_data="show_referrals")]]
+    await update.callback_query.edit_message_text(
+        message,
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
@@ -1,7 +1,8 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import logging
-from database import db
+from database import adb
+from request_context import invalidate_request_context
 from config import LANGUAGES
 from messages import get_message
 from utils import log_user_action
@@ -56,9 +57,10 @@ async def handle_set_language(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     # Update user language in database
-    success = db.update_user_language(user_id, language_code)
+    success = await adb.update_user_language(user_id, language_code)
 
     if success:
+        invalidate_request_context(context)
         log_user_action(user_id, "language_changed", language_code)
 
         # Get localized message
@@ -5,7 +5,8 @@ from telegram.ext import ContextTypes
 import logging
 import json
 import os
-from database import db
+from database import adb
+from request_context import get_request_context
 from messages import get_message
 from config import BINANCE_WALLET_ADDRESS, BINANCE_API_KEY, BINANCE_SECRET_KEY, SERVICES, PAYMENT_METHODS, SERVICE_GROUPS, BINANCE_USER_ID, PHONE_NUMBER, CBE_ACCOUNT, ABYSSINIA_ACCOUNT
 import binance
@@ -19,14 +20,15 @@ logger = logging.getLogger(__name__)
 async def handle_payment_method(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle payment method selection"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         await update.callback_query.answer("Please register first!")
         return
     
     # Get session data
-    session = db.get_user_session(user_id)
+    session = ctx.session
     if not session or session['current_step'] != 'selecting_payment':
         await update.callback_query.answer("Session expired. Please start over.")
         return
@@ -46,7 +48,7 @@ async def handle_payment_method(update: Update, context: ContextTypes.DEFAULT_TY
     log_user_action(user_id, "select_payment_method", payment_method)
     
     # Create subscription
-    subscription_id = db.create_subscription(
+    subscription_id = await adb.create_subscription(
         user_id=user_id,
         service=session_data['service'],
         duration=session_data['duration'],
@@ -64,7 +66,7 @@ async def handle_payment_method(update: Update, context: ContextTypes.DEFAULT_TY
     
     if payment_method == 'binance':
         # Binance payment: offer two options
-        db.update_user_session(user_id, "waiting_binance_method", json.dumps(session_data))
+        await adb.update_user_session(user_id, "waiting_binance_method", json.dumps(session_data))
         message = (
             "💰 *Binance Payment Options*\n\n"
             "You can pay using either:\n"
@@ -105,11 +107,11 @@ async def handle_payment_method(update: Update, context: ContextTypes.DEFAULT_TY
     ) + extra_info + "\n\n⚠️ Please upload your receipt within 1 hour, or your pending payment will expire."
 
     # Save as pending payment with expiry
-    db.update_user_session(user_id, "waiting_receipt", json.dumps(session_data))
+    await adb.update_user_session(user_id, "waiting_receipt", json.dumps(session_data))
     # Save pending payment with expiry timestamp
     expiry_time = datetime.now() + timedelta(hours=1)
     session_data['pending_expiry'] = expiry_time.isoformat()
-    db.update_user_session(user_id, "waiting_receipt", json.dumps(session_data))
+    await adb.update_user_session(user_id, "waiting_receipt", json.dumps(session_data))
 
     keyboard = [
         [InlineKeyboardButton("📎 Upload Receipt", callback_data="upload_receipt")],
@@ -124,11 +126,12 @@ async def handle_payment_method(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def handle_binance_method(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     if not user:
         await update.callback_query.answer("Please register first!")
         return
-    session = db.get_user_session(user_id)
+    session = ctx.session
     if not session or session['current_step'] != 'waiting_binance_method':
         await update.callback_query.answer("Session expired. Please start over.")
         return
@@ -142,7 +145,7 @@ async def handle_binance_method(update: Update, context: ContextTypes.DEFAULT_TY
     user_language = user.get('language', 'en')
     method = update.callback_query.data
     if method == "binance_payid":
-        db.update_user_session(user_id, "entering_order_id", json.dumps(session_data))
+        await adb.update_user_session(user_id, "entering_order_id", json.dumps(session_data))
         binance_id = BINANCE_USER_ID
         message = (
             f"🔢 *Binance Pay ID Payment*\n\n"
@@ -162,7 +165,7 @@ async def handle_binance_method(update: Update, context: ContextTypes.DEFAULT_TY
             reply_markup=reply_markup
         )
     elif method == "binance_wallet":
-        db.update_user_session(user_id, "entering_tx_hash", json.dumps(session_data))
+        await adb.update_user_session(user_id, "entering_tx_hash", json.dumps(session_data))
         message = (
             f"🏦 *Binance Wallet Address Payment*\n\n"
             f"Send exactly ${session_data['amount']} USDT to this BSC address:\n"
@@ -186,13 +189,14 @@ async def handle_binance_method(update: Update, context: ContextTypes.DEFAULT_TY
 async def handle_submit_order_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle Binance PayID order ID submission"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     if not user:
         await update.callback_query.answer("Please register first!")
         return
 
     user_language = user.get('language', 'en')
-    session = db.get_user_session(user_id)
+    session = ctx.session
     if session:
         session_data = session.get('temp_data', {})
         if isinstance(session_data, str):
@@ -201,7 +205,7 @@ async def handle_submit_order_id(update: Update, context: ContextTypes.DEFAULT_T
             except:
                 session_data = {}
         
-        db.update_user_session(user_id, "entering_order_id", json.dumps(session_data))
+        await adb.update_user_session(user_id, "entering_order_id", json.dumps(session_data))
 
     message = get_message(user_language, 'ask_order_id') + "\n\n*You must also upload a screenshot after entering the Order ID.*"
     keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="cancel_payment")]]
@@ -212,12 +216,13 @@ async def handle_submit_order_id(update: Update, context: ContextTypes.DEFAULT_T
 async def handle_order_id_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle order ID text input for Binance PayID"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     if not user:
         await update.message.reply_text("Please register first!")
         return
 
-    session = db.get_user_session(user_id)
+    session = ctx.session
     if not session or session['current_step'] != 'entering_order_id':
         await update.message.reply_text("Session expired. Please start over.")
         return
@@ -239,7 +244,7 @@ async def handle_order_id_input(update: Update, context: ContextTypes.DEFAULT_TY
 
     # Store order ID in session and ask for screenshot
     session_data['order_id'] = order_id
-    db.update_user_session(user_id, "waiting_receipt", json.dumps(session_data))
+    await adb.update_user_session(user_id, "waiting_receipt", json.dumps(session_data))
     await update.message.reply_text(
         "✅ Order ID received.\n\nNow, please upload a screenshot of your payment for verification.",
         reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data="cancel_payment")]])
@@ -248,7 +253,8 @@ async def handle_order_id_input(update: Update, context: ContextTypes.DEFAULT_TY
 async def handle_submit_tx_hash(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle TX hash submission"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         await update.callback_query.answer("Please register first!")
@@ -257,7 +263,7 @@ async def handle_submit_tx_hash(update: Update, context: ContextTypes.DEFAULT_TY
     user_language = user.get('language', 'en')
     
     
-    session = db.get_user_session(user_id)
+    session = ctx.session
     if session:
         session_data = session.get('temp_data', {})
         if isinstance(session_data, str):
@@ -265,7 +271,7 @@ async def handle_submit_tx_hash(update: Update, context: ContextTypes.DEFAULT_TY
                 session_data = json.loads(session_data)
             except:
                 session_data = {}
-        db.update_user_session(user_id, "entering_tx_hash", json.dumps(session_data))
+        await adb.update_user_session(user_id, "entering_tx_hash", json.dumps(session_data))
     
     message = get_message(user_language, 'ask_tx_hash') + "\n\n*You must also upload a screenshot after entering the TX Hash.*"
     
@@ -277,13 +283,14 @@ async def handle_submit_tx_hash(update: Update, context: ContextTypes.DEFAULT_TY
 async def handle_tx_hash_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle TX hash text input"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         await update.message.reply_text("Please register first!")
         return
     
-    session = db.get_user_session(user_id)
+    session = ctx.session
     if not session or session['current_step'] != 'entering_tx_hash':
         await update.message.reply_text("Session expired. Please start over.")
         return
@@ -305,7 +312,7 @@ async def handle_tx_hash_input(update: Update, context: ContextTypes.DEFAULT_TYP
     
     
     session_data['tx_hash'] = tx_hash
-    db.update_user_session(user_id, "waiting_receipt", json.dumps(session_data))
+    await adb.update_user_session(user_id, "waiting_receipt", json.dumps(session_data))
     await update.message.reply_text(
         "✅ TX Hash received.\n\nNow, please upload a screenshot of your payment for verification.",
         reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data="cancel_payment")]])
@@ -314,7 +321,8 @@ async def handle_tx_hash_input(update: Update, context: ContextTypes.DEFAULT_TYP
 async def handle_upload_receipt_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle receipt upload request"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         await update.callback_query.answer("Please register first!")
@@ -323,7 +331,7 @@ async def handle_upload_receipt_request(update: Update, context: ContextTypes.DE
     user_language = user.get('language', 'en')
     
     # Check session data
-    session = db.get_user_session(user_id)
+    session = ctx.session
     if session:
         session_data = session.get('temp_data', {})
         if isinstance(session_data, str):
@@ -331,7 +339,7 @@ async def handle_upload_receipt_request(update: Update, context: ContextTypes.DE
                 session_data = json.loads(session_data)
             except:
                 session_data = {}
-        db.update_user_session(user_id, "uploading_receipt", json.dumps(session_data))
+        await adb.update_user_session(user_id, "uploading_receipt", json.dumps(session_data))
     
     message = get_message(user_language, 'upload_receipt')
     
@@ -343,13 +351,14 @@ async def handle_upload_receipt_request(update: Update, context: ContextTypes.DE
 async def handle_receipt_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle receipt file upload"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         await update.message.reply_text("Please register first!")
         return
     
-    session = db.get_user_session(user_id)
+    session = ctx.session
     session_data = session.get('temp_data', {}) if session else {}
     if isinstance(session_data, str):
         try:
@@ -362,7 +371,7 @@ async def handle_receipt_upload(update: Update, context: ContextTypes.DEFAULT_TY
     if expiry_str:
         expiry_time = datetime.fromisoformat(expiry_str)
         if datetime.now() > expiry_time:
-            db.clear_user_session(user_id)
+            await adb.clear_user_session(user_id)
             await update.message.reply_text(
                 "❌ Your pending payment has expired. Please start again.",
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]])
@@ -377,7 +386,7 @@ async def handle_receipt_upload(update: Update, context: ContextTypes.DEFAULT_TY
     # Save receipt file
     photo_file = await update.message.photo[-1].get_file()
     file_content = await photo_file.download_as_bytearray()
-    payment_id = db.create_payment(
+    payment_id = await adb.create_payment(
         user_id=user_id,
         subscription_id=session_data.get('subscription_id'),
         payment_method=session_data.get('payment_method'),
@@ -386,7 +395,7 @@ async def handle_receipt_upload(update: Update, context: ContextTypes.DEFAULT_TY
     )
     receipt_path = save_receipt_file(file_content, user_id, payment_id)
     # Update payment with receipt path
-    db.execute_query("UPDATE payments SET receipt_path = %s WHERE id = %s", (receipt_path, payment_id))
+    await adb.execute_query("UPDATE payments SET receipt_path = %s WHERE id = %s", (receipt_path, payment_id))
 
     # Send to admin for approval
     admin_message = (
@@ -422,14 +431,14 @@ async def handle_receipt_upload(update: Update, context: ContextTypes.DEFAULT_TY
         "✅ Receipt uploaded! Your payment is pending admin approval. You will be notified once approved.",
         reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]])
     )
-    db.clear_user_session(user_id)
+    await adb.clear_user_session(user_id)
 
 async def handle_cancel_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle payment cancellation"""
     user_id = update.effective_user.id
     
     # Clear session
-    db.clear_user_session(user_id)
+    await adb.clear_user_session(user_id)
     
     keyboard = [[InlineKeyboardButton("📚 Browse Services", callback_data="browse_services")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
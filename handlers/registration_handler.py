@@ -2,7 +2,8 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKe
 from telegram.ext import ContextTypes
 import logging
 import json
-from database import db
+from database import adb
+from request_context import get_request_context
 from messages import get_message
 from utils import generate_referral_code, create_referral_link, validate_email, log_user_action, validate_phone, clean_country_input
 from email_service import email_service
@@ -17,7 +18,7 @@ async def handle_registration_start(update: Update, context: ContextTypes.DEFAUL
     log_user_action(user_id, "registration_start")
     
     # Update session
-    db.update_user_session(user_id, "registration_name")
+    await adb.update_user_session(user_id, "registration_name")
     
     message = get_message(user_language, 'registration_start')
     
@@ -53,7 +54,8 @@ async def handle_email_option(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = update.effective_user.id
     user_language = 'en'
     
-    session = db.get_user_session(user_id)
+    ctx = await get_request_context(update, context)
+    session = ctx.session
     if not session:
         await update.callback_query.edit_message_text("Session expired. Please start with /start")
         return
@@ -67,7 +69,7 @@ async def handle_email_option(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     if update.callback_query.data == "add_email_yes":
         # Ask for email
-        db.update_user_session(user_id, "registration_email", json.dumps(temp_data))
+        await adb.update_user_session(user_id, "registration_email", json.dumps(temp_data))
         message = get_message(user_language, 'ask_email')
         keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="cancel_registration")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -76,7 +78,7 @@ async def handle_email_option(update: Update, context: ContextTypes.DEFAULT_TYPE
     else:
         # Skip email, go to telegram
         temp_data['email'] = None
-        db.update_user_session(user_id, "registration_telegram_option", json.dumps(temp_data))
+        await adb.update_user_session(user_id, "registration_telegram_option", json.dumps(temp_data))
         
         message = get_message(user_language, 'ask_telegram_username')
         keyboard = [
@@ -93,7 +95,8 @@ async def handle_telegram_option(update: Update, context: ContextTypes.DEFAULT_T
     user_id = update.effective_user.id
     user_language = 'en'
     
-    session = db.get_user_session(user_id)
+    ctx = await get_request_context(update, context)
+    session = ctx.session
     if not session:
         await update.callback_query.edit_message_text("Session expired. Please start with /start")
         return
@@ -107,7 +110,7 @@ async def handle_telegram_option(update: Update, context: ContextTypes.DEFAULT_T
     
     if update.callback_query.data == "add_telegram_yes":
         # Ask for telegram username
-        db.update_user_session(user_id, "registration_telegram", json.dumps(temp_data))
+        await adb.update_user_session(user_id, "registration_telegram", json.dumps(temp_data))
         message = get_message(user_language, 'ask_telegram_username_input')
         keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="cancel_registration")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -116,7 +119,7 @@ async def handle_telegram_option(update: Update, context: ContextTypes.DEFAULT_T
     else:
         # Skip telegram, go to privacy
         temp_data['telegram_username'] = None
-        db.update_user_session(user_id, "registration_privacy", json.dumps(temp_data))
+        await adb.update_user_session(user_id, "registration_privacy", json.dumps(temp_data))
         
         message = get_message(user_language, 'ask_privacy_permission')
         keyboard = [
@@ -133,7 +136,8 @@ async def handle_privacy_option(update: Update, context: ContextTypes.DEFAULT_TY
     user_id = update.effective_user.id
     user_language = 'en'
     
-    session = db.get_user_session(user_id)
+    ctx = await get_request_context(update, context)
+    session = ctx.session
     if not session:
         await update.callback_query.edit_message_text("Session expired. Please start with /start")
         return
@@ -149,7 +153,7 @@ async def handle_privacy_option(update: Update, context: ContextTypes.DEFAULT_TY
     temp_data['privacy_allowed'] = privacy_allowed
     
     # Go to phone
-    db.update_user_session(user_id, "registration_phone", json.dumps(temp_data))
+    await adb.update_user_session(user_id, "registration_phone", json.dumps(temp_data))
     message = get_message(user_language, 'ask_phone')
     keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="cancel_registration")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -162,7 +166,8 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
     user_language = 'en'
     
     # Get current session
-    session = db.get_user_session(user_id)
+    ctx = await get_request_context(update, context)
+    session = ctx.session
     if not session:
         await update.message.reply_text("Session expired. Please start with /start")
         return
@@ -184,7 +189,7 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
             await show_error_with_menu(update, "Please provide a valid name (letters only, at least 2 characters).")
             return
         temp_data['name'] = name
-        db.update_user_session(user_id, "registration_email_option", json.dumps(temp_data))
+        await adb.update_user_session(user_id, "registration_email_option", json.dumps(temp_data))
         
         message = get_message(user_language, 'ask_email_optional')
         keyboard = [
@@ -207,7 +212,7 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
             return
         
         # Check if email already exists
-        existing_user = db.get_user_by_email(email)
+        existing_user = await adb.get_user_by_email(email)
         if existing_user:
             await update.message.reply_text(
                 get_message(user_language, 'error_email_exists')
@@ -215,7 +220,7 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
             return
         
         temp_data['email'] = email
-        db.update_user_session(user_id, "registration_telegram_option", json.dumps(temp_data))
+        await adb.update_user_session(user_id, "registration_telegram_option", json.dumps(temp_data))
         
         message = get_message(user_language, 'ask_telegram_username')
         keyboard = [
@@ -231,7 +236,7 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
         # Store telegram and ask for privacy
         telegram_username = update.message.text.strip().replace('@', '')
         temp_data['telegram_username'] = telegram_username
-        db.update_user_session(user_id, "registration_privacy", json.dumps(temp_data))
+        await adb.update_user_session(user_id, "registration_privacy", json.dumps(temp_data))
         
         message = get_message(user_language, 'ask_privacy_permission')
         keyboard = [
@@ -250,7 +255,7 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
             await show_error_with_menu(update, "Please enter a valid Ethiopian phone number (09..., 07..., or +251...).")
             return
         temp_data['phone'] = phone
-        db.update_user_session(user_id, "registration_country", json.dumps(temp_data))
+        await adb.update_user_session(user_id, "registration_country", json.dumps(temp_data))
         
         message = get_message(user_language, 'ask_country')
         await update.message.reply_text(message)
@@ -270,11 +275,11 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
         referred_by = None
         referrer = None
         if temp_data.get('referral_code'):
-            referrer = db.get_user_by_referral_code(temp_data['referral_code'])
+            referrer = await adb.get_user_by_referral_code(temp_data['referral_code'])
             if referrer:
                 referred_by = referrer['user_id']
 
-        start_session = db.get_user_session(user_id)
+        start_session = ctx.session
         if start_session and start_session.get('temp_data'):
             start_data = start_session['temp_data']
             if isinstance(start_data, str):
@@ -283,13 +288,13 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
                 except:
                  start_data = {}
             if start_data.get('referral_code'):
-                referrer = db.get_user_by_referral_code(start_data['referral_code'])
+                referrer = await adb.get_user_by_referral_code(start_data['referral_code'])
                 if referrer:
                     referred_by = referrer['user_id']
         
         # Also check if there's a referral code in current temp_data
         if temp_data.get('referral_code'):
-            referrer = db.get_user_by_referral_code(temp_data['referral_code'])
+            referrer = await adb.get_user_by_referral_code(temp_data['referral_code'])
             if referrer:
                 referred_by = referrer['user_id']
         
@@ -298,9 +303,15 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
         if not telegram_username and update.effective_user.username:
             telegram_username = update.effective_user.username
         
+        def welcome_email(row):
+            # Queued with the new user row; the outbox worker sends it
+            if not row['email']:
+                return None
+            return (row['email'],) + email_service.welcome_content(row['name'])
+
         # Create user
         try:
-            db.create_user(
+            await adb.create_user(
                 user_id=user_id,
                 name=temp_data['name'],
                 email=temp_data.get('email'),
@@ -308,7 +319,8 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
                 country=temp_data['country'],
                 referral_code=referral_code,
                 telegram_username=telegram_username,
-                privacy_allowed=temp_data.get('privacy_allowed', False)
+                privacy_allowed=temp_data.get('privacy_allowed', False),
+                compose_email=welcome_email
             )
             # Notify all admins with updated panel
             from config import ADMIN_IDS
@@ -326,19 +338,11 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
             
             # Create referral if applicable
             if referred_by:
-                db.create_referral(referred_by, user_id)
-                db.create_referral(referred_by, user_id)
+                await adb.create_referral(referred_by, user_id)
                 log_user_action(user_id, "referred_by", referred_by)
             
             # Clear session
-            db.clear_user_session(user_id)
-            
-            # Send welcome email if email provided
-            if temp_data.get('email'):
-                try:
-                    email_service.send_welcome_email(temp_data['name'], temp_data['email'])
-                except Exception as e:
-                    logger.error(f"Failed to send welcome email: {e}")
+            await adb.clear_user_session(user_id)
             
             # Create referral link
             bot_username = context.bot.username
@@ -408,7 +412,7 @@ async def handle_registration_steps(update: Update, context: ContextTypes.DEFAUL
             
         except Exception as e:
             logger.error(f"Registration failed for user {user_id}: {e}")
-            user = db.get_user(user_id)
+            user = await adb.get_user(user_id)
             if not user:
                recovery_keyboard = [
                 [KeyboardButton("/start"), KeyboardButton("/help")]
@@ -430,7 +434,7 @@ async def handle_cancel_registration(update: Update, context: ContextTypes.DEFAU
     user_id = update.effective_user.id
     
     # Clear session
-    db.clear_user_session(user_id)
+    await adb.clear_user_session(user_id)
     
     await update.callback_query.edit_message_text(
         "Registration cancelled. You can start again anytime with /start"
@@ -450,7 +454,8 @@ async def show_error_with_menu(update, error_message):
 
 async def handle_resume_registration(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    session = db.get_user_session(user_id)
+    ctx = await get_request_context(update, context)
+    session = ctx.session
     if session:
         # Continue from last step
         await handle_registration_steps(update, context)
@@ -2,7 +2,8 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import logging
 import json
-from database import db
+from database import adb
+from request_context import get_request_context
 from messages import get_message
 from config import SERVICES
 from utils import format_currency, calculate_savings, get_service_emoji, log_user_action
@@ -12,7 +13,8 @@ logger = logging.getLogger(__name__)
 async def handle_browse_services(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show available services"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         if update.callback_query:
@@ -60,7 +62,8 @@ async def handle_browse_services(update: Update, context: ContextTypes.DEFAULT_T
 async def handle_select_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle service selection"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         if update.callback_query:
@@ -83,7 +86,7 @@ async def handle_select_service(update: Update, context: ContextTypes.DEFAULT_TY
     log_user_action(user_id, "select_service", service_key)
     
     # Store service selection in session
-    db.update_user_session(user_id, "selecting_duration", json.dumps({"service": service_key}))
+    await adb.update_user_session(user_id, "selecting_duration", json.dumps({"service": service_key}))
     
     # Calculate savings
     price_1 = service_info['prices']['1']
@@ -122,7 +125,8 @@ async def handle_select_service(update: Update, context: ContextTypes.DEFAULT_TY
 async def handle_select_duration(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle duration selection"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     
     if not user:
         if update.callback_query:
@@ -155,7 +159,7 @@ async def handle_select_duration(update: Update, context: ContextTypes.DEFAULT_T
     # Service discount
     service_discount = service_info.get('discount', 0)
     # Referral discount
-    completed_referrals = db.count_completed_referrals(user_id)
+    completed_referrals = user.get('completed_referral_count', 0)
     referral_discount = completed_referrals // 100  # $1 per 100 completed referrals
 
     total_discount = service_discount + referral_discount
@@ -173,7 +177,7 @@ async def handle_select_duration(update: Update, context: ContextTypes.DEFAULT_T
         "referral_discount": referral_discount,
         "total_discount": total_discount
     }
-    db.update_user_session(user_id, "selecting_payment", json.dumps(session_data))
+    await adb.update_user_session(user_id, "selecting_payment", json.dumps(session_data))
     
     message = get_message(
         user_language,
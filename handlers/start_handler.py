@@ -2,7 +2,8 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Keyboar
 from telegram.ext import ContextTypes
 import logging
 import json
-from database import db
+from database import adb
+from request_context import get_request_context
 from messages import get_message
 from utils import generate_referral_code, create_referral_link, is_admin, log_user_action
 
@@ -29,7 +30,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Check if user exists
-    existing_user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    existing_user = ctx.user
 
     # Try to get language from user profile or fallback to English
     user_language = existing_user.get('language', 'en') if existing_user else 'en'
@@ -48,7 +50,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Store referral code in session if provided
         if referral_code:
-            db.update_user_session(user_id, "start_with_referral", json.dumps({"referral_code": referral_code}))
+            await adb.update_user_session(user_id, "start_with_referral", json.dumps({"referral_code": referral_code}))
 
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
@@ -60,9 +62,10 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, user=None):
     """Show main menu for registered users"""
     user_id = update.effective_user.id
+    ctx = await get_request_context(update, context)
 
     if not user:
-        user = db.get_user(user_id)
+        user = ctx.user
 
     if not user:
         if update.message:
@@ -72,7 +75,7 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, use
         return
 
     # Check for active subscription
-    active_sub = db.get_active_subscription(user_id)
+    active_sub = ctx.active_subscription
 
     keyboard = [
         [InlineKeyboardButton("📚 Browse Services", callback_data="browse_services")],
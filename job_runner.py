@@ -0,0 +1,270 @@
+import asyncio
+import inspect
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Supports *, lists (1,15), ranges (1-5) and steps (*/5, 0-30/10).
+    Day of week runs 0-6 from Sunday (7 is also Sunday). As in cron, when
+    both day fields are restricted a day matching either one fires.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = parts[2] == '*'
+        self._any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for item in field.split(','):
+            spec, _, step = item.partition('/')
+            step = int(step) if step else 1
+            if spec == '*':
+                start, end = low, high
+            elif '-' in spec:
+                start, end = (int(value) for value in spec.split('-', 1))
+            else:
+                start = end = int(spec)
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f"Cron field '{field}' is outside {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return weekday
+        if self._any_weekday:
+            return day
+        return day or weekday
+
+    def next_after(self, moment):
+        """First firing time strictly after `moment` (naive local time)"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never fires: '{self.expression}'")
+
+    def min_interval(self, samples=10):
+        """Shortest gap between the next `samples` firings"""
+        moment = self.next_after(datetime.now())
+        gaps = []
+        for _ in range(samples):
+            following = self.next_after(moment)
+            gaps.append(following - moment)
+            moment = following
+        return min(gaps)
+
+def every_minutes(minutes):
+    """Cron expression firing exactly every N minutes.
+
+    N must divide an hour, or be whole hours dividing a day; anything else
+    can't be spaced evenly in cron and raises ValueError.
+    """
+    if 1 <= minutes < 60 and 60 % minutes == 0:
+        return f"*/{minutes} * * * *"
+    if minutes >= 60 and minutes % 60 == 0 and 24 % (minutes // 60) == 0:
+        return f"0 */{minutes // 60} * * *"
+    raise ValueError(f"Cannot schedule every {minutes} minutes with cron")
+
+class Job:
+    # Jitter is capped at this share of the shortest gap between firings, so a
+    # delayed run never reaches past the next one
+    MAX_JITTER_FRACTION = 0.5
+
+    def __init__(self, name, func, cron, jitter=0, catch_up=True, timeout=None):
+        self.name = name
+        self.func = func
+        self.cron = CronSchedule(cron)
+        max_jitter = self.cron.min_interval().total_seconds() * self.MAX_JITTER_FRACTION
+        if jitter > max_jitter:
+            logger.warning(f"Job {name}: jitter {jitter}s capped at {max_jitter:.0f}s for schedule '{cron}'")
+            jitter = max_jitter
+        self.jitter = jitter
+        self.catch_up = catch_up
+        self.timeout = timeout
+        self.running = False
+        self.next_run = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = None
+        self.last_started = None
+        self.last_status = None
+        self.last_result = None
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'cron': self.cron.expression,
+            'running': self.running,
+            'next_run': self.next_run,
+            'runs': self.runs,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'last_status': self.last_status,
+            'last_result': self.last_result,
+            'last_started': self.last_started,
+            'last_seconds': self.last_seconds,
+            'avg_seconds': self.total_seconds / self.runs if self.runs else None,
+            'max_seconds': self.max_seconds,
+        }
+
+class JobRunner:
+    """Runs async (or sync) jobs on cron schedules inside the bot's event loop.
+
+    - Each firing is delayed by up to `jitter` seconds so replicas and
+      jobs sharing a minute don't all hit the database at once; jitter is
+      capped at half the schedule's shortest interval so no run is lost.
+    - A job still running when it comes due again is skipped, not stacked.
+    - Every run is recorded in scheduler_runs; on start, a job whose next
+      firing after its last recorded run is already in the past runs once
+      straight away to catch up on what was missed during downtime.
+    - With a `leader` (leader.LeaderLease), only the elected replica runs
+      jobs; the others keep their timers but skip each firing. A replica
+      that takes over leadership runs the same catch-up, covering whatever
+      the old leader missed.
+    """
+
+    def __init__(self, database, leader=None):
+        self._db = database  # AsyncDatabase
+        self._leader = leader
+        self.jobs = {}
+        self._tasks = []
+        self._running_tasks = set()
+        self._stop = asyncio.Event()
+        self._started = False
+        if leader:
+            leader.add_listener(self._on_leadership)
+
+    def add_job(self, name, func, cron, jitter=0, catch_up=True, timeout=None):
+        self.jobs[name] = Job(name, func, cron, jitter, catch_up, timeout)
+        return self.jobs[name]
+
+    @property
+    def is_active(self):
+        """True when this replica runs jobs (always, without a leader lease)"""
+        return self._leader is None or self._leader.is_leader
+
+    async def start(self):
+        self._started = True
+        if self.is_active:
+            await self._catch_up()
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"job-{job.name}"))
+        logger.info(f"Job runner started with {len(self.jobs)} jobs")
+
+    async def _catch_up(self):
+        last_runs = await self._db.get_scheduler_runs() or {}
+        now = datetime.now()
+        for job in self.jobs.values():
+            last_scheduled = last_runs.get(job.name)
+            missed = (
+                job.catch_up and not job.running and last_scheduled is not None
+                and job.cron.next_after(last_scheduled) <= now
+            )
+            if missed:
+                logger.info(f"Job {job.name} missed a run since {last_scheduled:%Y-%m-%d %H:%M}; catching up")
+                self._launch(job, now)
+
+    async def _on_leadership(self, elected):
+        if elected and self._started and not self._stop.is_set():
+            await self._catch_up()
+
+    async def stop(self):
+        self._stop.set()
+        tasks = self._tasks + list(self._running_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        logger.info("Job runner stopped")
+
+    def stats(self):
+        return [job.stats() for job in self.jobs.values()]
+
+    async def _loop(self, job):
+        while not self._stop.is_set():
+            scheduled_at = job.cron.next_after(datetime.now())
+            job.next_run = scheduled_at
+            delay = (scheduled_at - datetime.now()).total_seconds() + random.uniform(0, job.jitter)
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=max(delay, 0))
+                return
+            except asyncio.TimeoutError:
+                pass
+            if not self.is_active:
+                logger.debug(f"Job {job.name}: not the scheduler leader, leaving the {scheduled_at:%H:%M} run to it")
+                continue
+            if job.running:
+                job.skipped += 1
+                logger.warning(f"Job {job.name} is still running; skipping the {scheduled_at:%H:%M} run")
+                continue
+            self._launch(job, scheduled_at)
+
+    def _launch(self, job, scheduled_at):
+        job.running = True
+        task = asyncio.create_task(self._execute(job, scheduled_at), name=f"run-{job.name}")
+        self._running_tasks.add(task)
+        task.add_done_callback(self._running_tasks.discard)
+
+    async def _execute(self, job, scheduled_at):
+        started_at = datetime.now()
+        started = time.perf_counter()
+        status, error = 'ok', None
+        try:
+            result = job.func()
+            if inspect.isawaitable(result):
+                result = await asyncio.wait_for(result, timeout=job.timeout)
+            job.last_result = result
+        except asyncio.CancelledError:
+            status, error = 'cancelled', None
+            raise
+        except Exception as e:
+            status, error = 'failed', str(e)
+            job.failures += 1
+            logger.error(f"Job {job.name} failed: {e}")
+        finally:
+            elapsed = time.perf_counter() - started
+            job.running = False
+            job.runs += 1
+            job.total_seconds += elapsed
+            job.max_seconds = max(job.max_seconds, elapsed)
+            job.last_seconds = elapsed
+            job.last_started = started_at
+            job.last_status = status
+            if status != 'cancelled':
+                logger.info(f"Job {job.name} {status} in {elapsed:.2f}s")
+                await self._db.record_scheduler_run(
+                    job.name, scheduled_at, started_at, datetime.now(), int(elapsed * 1000), status, error
+                )
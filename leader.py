@@ -0,0 +1,141 @@
+import asyncio
+import inspect
+import logging
+import time
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary pg_advisory_lock key every replica's scheduler competes for
+SCHEDULER_LOCK_KEY = 727_002
+
+class LeaderLease:
+    """Elects one bot replica as scheduler leader via a Postgres advisory lock.
+
+    The lock is session-level and lives on a dedicated connection outside
+    the pool. Every `heartbeat_interval` seconds the leader proves its
+    session is alive with a round-trip and the others try to take the
+    lock. Postgres releases the lock when the holder's session ends, so a
+    standby takes over within a heartbeat or two once the leader exits.
+    The lease connection sets short TCP keepalives, so the server also
+    drops a leader whose host vanished without closing it.
+
+    Leadership is a lease: a replica that hasn't renewed it for three
+    heartbeats stops calling itself leader even before it notices the
+    connection is gone. Listeners added with add_listener() are called
+    (and awaited, if coroutines) with True on election and False on loss.
+    """
+
+    def __init__(self, dsn, lock_key=SCHEDULER_LOCK_KEY, heartbeat_interval=10):
+        self.dsn = dsn
+        self.lock_key = lock_key
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_seconds = heartbeat_interval * 3
+        self.elections = 0
+        self._connection = None
+        self._held = False
+        self._renewed_at = 0.0
+        self._listeners = []
+        self._task = None
+
+    @property
+    def is_leader(self):
+        return self._held and time.monotonic() - self._renewed_at < self.lease_seconds
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+        return listener
+
+    async def start(self):
+        """Try for the lock once straight away, then keep heartbeating"""
+        await self._tick()
+        self._task = asyncio.create_task(self._run(), name="leader-lease")
+
+    async def stop(self):
+        """Stop heartbeating and close the lease connection, freeing the lock at once"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self._disconnect)
+        await self._set_held(False)
+
+    def stats(self):
+        return {
+            'leader': self.is_leader,
+            'elections': self.elections,
+            'renewed_seconds_ago': time.monotonic() - self._renewed_at if self._held else None,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await self._tick()
+
+    async def _tick(self):
+        try:
+            held = await asyncio.to_thread(self._heartbeat)
+        except Exception as e:
+            # Losing the session loses the lock with it
+            logger.warning(f"Leader lease heartbeat failed: {e}")
+            await asyncio.to_thread(self._disconnect)
+            held = False
+        if held:
+            self._renewed_at = time.monotonic()
+        await self._set_held(held)
+
+    def _heartbeat(self):
+        """Renew the lease if held, otherwise try to take the lock (blocking)"""
+        if self._connection is None or self._connection.closed:
+            self._connection = self._connect()
+        with self._connection.cursor() as cursor:
+            if self._held:
+                # Session-level locks last as long as the session does
+                cursor.execute("SELECT 1")
+                return True
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_key,))
+            return cursor.fetchone()[0]
+
+    def _connect(self):
+        keepalive = max(int(self.heartbeat_interval), 1)
+        connection = psycopg2.connect(
+            self.dsn,
+            application_name='tradingmentorbot-scheduler',
+            connect_timeout=keepalive,
+            keepalives=1,
+            keepalives_idle=keepalive,
+            keepalives_interval=keepalive,
+            keepalives_count=2
+        )
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            # Server-side keepalives, so a dead leader's session (and lock) is reaped
+            cursor.execute("SET tcp_keepalives_idle = %s", (keepalive,))
+            cursor.execute("SET tcp_keepalives_interval = %s", (keepalive,))
+            cursor.execute("SET tcp_keepalives_count = 2")
+        return connection
+
+    def _disconnect(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    async def _set_held(self, held):
+        if held == self._held:
+            return
+        self._held = held
+        if held:
+            self.elections += 1
+            logger.info("This replica is now the scheduler leader")
+        else:
+            logger.warning("This replica is no longer the scheduler leader")
+        for listener in self._listeners:
+            try:
+                result = listener(held)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Leader listener {getattr(listener, '__name__', listener)} failed: {e}")
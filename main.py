@@ -28,18 +28,20 @@ from handlers.payment_handler import (
 from handlers.admin_handler import (
     handle_admin_panel, handle_pending_payments, handle_approve_payment,
     handle_reject_payment, handle_all_users, handle_broadcast_setup,
-    handle_broadcast_message
+    handle_broadcast_message, handle_db_stats, handle_export, handle_jobs
 )
 from handlers.dashboard_handler import (
     handle_show_dashboard, handle_show_referrals, handle_copy_referral_link,
-    handle_update_profile, handle_main_menu
+    handle_update_profile, handle_main_menu, handle_referral_leaderboard, handle_referral_tree
 )
 from handlers.language_handler import handle_change_language, handle_set_language
 
 # Import other modules
 from config import BOT_TOKEN, ADMIN_IDS
-from database import db
+from database import adb
+from request_context import get_request_context, invalidate_request_context
 from scheduler import start_scheduler
+from email_service import email_service
 from utils import is_admin, log_user_action
 from messages import get_message
 
@@ -57,7 +59,8 @@ logger = logging.getLogger(__name__)
 async def handle_help_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show help menu with contact info"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     user_language = user.get('language', 'en') if user else 'en'
 
     # Escaped MarkdownV2 message
@@ -96,7 +99,8 @@ def escape_markdown_v2(text: str) -> str:
 async def handle_contact_support(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show contact support info"""
     user_id = update.effective_user.id
-    user = db.get_user(user_id)
+    ctx = await get_request_context(update, context)
+    user = ctx.user
     user_language = user.get('language', 'en') if user else 'en'
     
     message_raw = get_message(user_language, 'contact_support')
@@ -175,13 +179,13 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
         # Admin handlers
         elif data == "admin_panel" and is_admin(update.effective_user.id):
             await handle_admin_panel(update, context)
-        elif data == "admin_pending_payments" and is_admin(update.effective_user.id):
+        elif (data == "admin_pending_payments" or data.startswith("admin_payments_")) and is_admin(update.effective_user.id):
             await handle_pending_payments(update, context)
         elif data.startswith("approve_payment_") and is_admin(update.effective_user.id):
             await handle_approve_payment(update, context)
         elif data.startswith("reject_payment_") and is_admin(update.effective_user.id):
             await handle_reject_payment(update, context)
-        elif data == "admin_all_users" and is_admin(update.effective_user.id):
+        elif (data == "admin_all_users" or data.startswith("admin_users_")) and is_admin(update.effective_user.id):
             await handle_all_users(update, context)
         elif data == "admin_broadcast" and is_admin(update.effective_user.id):
             await handle_broadcast_setup(update, context)
@@ -195,8 +199,12 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
         # Dashboard handlers
         elif data == "show_dashboard":
             await handle_show_dashboard(update, context)
-        elif data == "show_referrals":
+        elif data == "show_referrals" or data.startswith("show_referrals_after_"):
             await handle_show_referrals(update, context)
+        elif data.startswith("referral_leaderboard_"):
+            await handle_referral_leaderboard(update, context)
+        elif data == "referral_tree":
+            await handle_referral_tree(update, context)
         elif data == "copy_referral_link":
             await handle_copy_referral_link(update, context)
         elif data == "update_profile":
@@ -222,13 +230,13 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                 "📱 **Update Phone Number**\n\nPlease type your new phone number:",
                 parse_mode='Markdown'
             )
-            db.update_user_session(update.effective_user.id, "updating_phone", "{}")
+            await adb.update_user_session(update.effective_user.id, "updating_phone", "{}")
         elif data == "update_country":
             await update.callback_query.edit_message_text(
                 "🌍 **Update Country**\n\nPlease type your country:",
                 parse_mode='Markdown'
             )
-            db.update_user_session(update.effective_user.id, "updating_country", "{}")
+            await adb.update_user_session(update.effective_user.id, "updating_country", "{}")
         
         else:
             await query.edit_message_text("❌ Unknown action. Please try again.")
@@ -297,11 +305,12 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     log_user_action(user_id, "text_message", update.message.text[:50])
     
     # Get user session
-    session = db.get_user_session(user_id)
+    ctx = await get_request_context(update, context)
+    session = ctx.session
     
     if not session:
         # No active session, show menu options
-        user = db.get_user(user_id)
+        user = ctx.user
         if user:
             # User is registered, show main menu
             keyboard = [
@@ -344,21 +353,23 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Profile update steps
         elif current_step == 'updating_phone':
             phone = update.message.text.strip()
-            if db.update_user_phone(user_id, phone):
+            if await adb.update_user_phone(user_id, phone):
+                invalidate_request_context(context)
                 await update.message.reply_text("✅ Phone number updated successfully!")
                 await handle_show_dashboard(update, context)
             else:
                 await update.message.reply_text("❌ Failed to update phone number. Please try again.")
-            db.clear_user_session(user_id)
+            await adb.clear_user_session(user_id)
         
         elif current_step == 'updating_country':
             country = update.message.text.strip()
-            if db.update_user_country(user_id, country):
+            if await adb.update_user_country(user_id, country):
+                invalidate_request_context(context)
                 await update.message.reply_text("✅ Country updated successfully!")
                 await handle_show_dashboard(update, context)
             else:
                 await update.message.reply_text("❌ Failed to update country. Please try again.")
-            db.clear_user_session(user_id)
+            await adb.clear_user_session(user_id)
         
         else:
             await update.message.reply_text(
@@ -376,7 +387,8 @@ async def handle_photo_message(update: Update, context: ContextTypes.DEFAULT_TYP
     log_user_action(user_id, "photo_upload")
 
     # Get user session
-    session = db.get_user_session(user_id)
+    ctx = await get_request_context(update, context)
+    session = ctx.session
 
     if session and session['current_step'] in ['waiting_receipt', 'uploading_receipt']:
         await handle_receipt_upload(update, context)
@@ -385,6 +397,16 @@ async def handle_photo_message(update: Update, context: ContextTypes.DEFAULT_TYP
             "I'm not expecting a photo right now. Please use the menu buttons."
         )
 
+async def post_init(application: Application):
+    """Start background jobs on the bot's event loop once it is running"""
+    application.bot_data['scheduler'] = await start_scheduler(application.bot)
+
+async def post_shutdown(application: Application):
+    scheduler = application.bot_data.get('scheduler')
+    if scheduler:
+        await scheduler.stop()
+    email_service.pool.close()
+
 def main():
     """Start the bot"""
     if not BOT_TOKEN:
@@ -392,10 +414,19 @@ def main():
         return
     
     # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Add handlers
     application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("dbstats", handle_db_stats))
+    application.add_handler(CommandHandler("export", handle_export))
+    application.add_handler(CommandHandler("jobs", handle_jobs))
     application.add_handler(CallbackQueryHandler(handle_callback_query))
     application.add_handler(CallbackQueryHandler(handle_binance_method, pattern="^binance_(payid|wallet)$"))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
@@ -404,9 +435,6 @@ def main():
     # Add error handler
     application.add_error_handler(error_handler)
     
-    # Start scheduler
-    start_scheduler(application.bot)
-    
     # Create receipts directory
     os.makedirs("receipts", exist_ok=True)
     
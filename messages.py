@@ -229,6 +229,20 @@ Unfortunately, your payment could not be verified.
 **Reason:** Invalid or unclear receipt
 
 Please contact support or try submitting again with a clear receipt.
+        """,
+        'bot_expiry_warning': """
+⏰ **Subscription Expiring Soon**
+
+Your {service} subscription expires in {days_left} day(s).
+
+Renew before it expires to keep your access.
+        """,
+        'bot_renewal_reminder': """
+🔄 **Subscription Expired**
+
+Your {service} subscription expired recently.
+
+Don't miss out on continuing your trading journey! Renew now and get back to learning and earning.
         """,
         'help_menu': """
 ❓ **Help & Support**
@@ -376,6 +390,20 @@ Do you allow the bot to contact you directly?
 **ምክንያት:** ልክ ያልሆነ ወይም ግልጽ ያልሆነ ደረሰኝ
 
 እባክዎ ድጋፍን ያነጋግሩ ወይም ግልጽ ደረሰኝ ይዘው እንደገና ይሞክሩ።
+        """,
+        'bot_expiry_warning': """
+⏰ **ምዝገባዎ በቅርቡ ያበቃል**
+
+የእርስዎ {service} ምዝገባ በ{days_left} ቀን(ቀናት) ውስጥ ያበቃል።
+
+አገልግሎቱን ለመቀጠል እባክዎ ከማብቃቱ በፊት ያድሱ።
+        """,
+        'bot_renewal_reminder': """
+🔄 **ምዝገባዎ አብቅቷል**
+
+የእርስዎ {service} ምዝገባ በቅርቡ አብቅቷል።
+
+የንግድ ጉዞዎን ለመቀጠል አሁን ያድሱ!
         """,
         'help_menu': """
 ❓ **Help & Support**
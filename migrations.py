@@ -0,0 +1,401 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ordered schema migrations: (version, description, statements).
+# Append new steps with the next version number; never edit a shipped step.
+MIGRATIONS = [
+    (1, "Initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            email VARCHAR(255),
+            phone VARCHAR(50),
+            country VARCHAR(100),
+            language VARCHAR(10) DEFAULT 'en',
+            referral_code VARCHAR(50) UNIQUE,
+            referred_by BIGINT,
+            telegram_username VARCHAR(100),
+            privacy_allowed BOOLEAN DEFAULT FALSE,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(user_id),
+            service VARCHAR(50) NOT NULL,
+            duration INTEGER NOT NULL,
+            amount DECIMAL(10,2) NOT NULL,
+            payment_method VARCHAR(50),
+            status VARCHAR(20) DEFAULT 'pending',
+            start_date TIMESTAMP,
+            expiry_date TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS payments (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(user_id),
+            subscription_id INTEGER REFERENCES subscriptions(id),
+            payment_method VARCHAR(50) NOT NULL,
+            amount DECIMAL(10,2) NOT NULL,
+            tx_hash VARCHAR(255),
+            receipt_path VARCHAR(500),
+            status VARCHAR(20) DEFAULT 'pending',
+            verified_by BIGINT,
+            verified_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS referrals (
+            id SERIAL PRIMARY KEY,
+            referrer_id BIGINT REFERENCES users(user_id),
+            referred_id BIGINT REFERENCES users(user_id),
+            reward_type VARCHAR(50),
+            reward_amount INTEGER,
+            status VARCHAR(20) DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS coupons (
+            id SERIAL PRIMARY KEY,
+            code VARCHAR(50) UNIQUE NOT NULL,
+            discount_type VARCHAR(20) NOT NULL,
+            discount_value DECIMAL(10,2) NOT NULL,
+            applicable_services TEXT[],
+            max_uses INTEGER DEFAULT 1,
+            used_count INTEGER DEFAULT 0,
+            expires_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            user_id BIGINT PRIMARY KEY,
+            current_step VARCHAR(100),
+            temp_data JSONB,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    ]),
+    (2, "Indexes for hot lookup and filter columns", [
+        "CREATE INDEX IF NOT EXISTS idx_subscriptions_user_status_expiry ON subscriptions (user_id, status, expiry_date)",
+        "CREATE INDEX IF NOT EXISTS idx_payments_status_created ON payments (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_referrals_referrer_status ON referrals (referrer_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_users_email ON users (email)",
+        "CREATE INDEX IF NOT EXISTS idx_users_joined_at ON users (joined_at)",
+        "CREATE INDEX IF NOT EXISTS idx_user_sessions_updated_at ON user_sessions (updated_at)"
+    ]),
+    (3, "Admin stats rollups maintained by triggers", [
+        # Block writes while backfilling so no row is counted twice or missed
+        "LOCK TABLE users, payments IN SHARE ROW EXCLUSIVE MODE",
+        """
+        CREATE TABLE IF NOT EXISTS stats_totals (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            total_users BIGINT NOT NULL DEFAULT 0,
+            active_users BIGINT NOT NULL DEFAULT 0,
+            pending_payments BIGINT NOT NULL DEFAULT 0,
+            approved_payments BIGINT NOT NULL DEFAULT 0,
+            total_revenue NUMERIC(14,2) NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS stats_daily (
+            day DATE PRIMARY KEY,
+            new_users INTEGER NOT NULL DEFAULT 0,
+            approved_payments INTEGER NOT NULL DEFAULT 0,
+            revenue NUMERIC(14,2) NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        INSERT INTO stats_totals (id, total_users, active_users, pending_payments, approved_payments, total_revenue)
+        SELECT TRUE,
+            (SELECT COUNT(*) FROM users),
+            (SELECT COUNT(*) FROM users WHERE is_active = true),
+            (SELECT COUNT(*) FROM payments WHERE status = 'pending'),
+            (SELECT COUNT(*) FROM payments WHERE status = 'approved'),
+            (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'approved')
+        ON CONFLICT (id) DO NOTHING
+        """,
+        """
+        INSERT INTO stats_daily (day, new_users)
+        SELECT joined_at::date, COUNT(*) FROM users
+        WHERE joined_at IS NOT NULL
+        GROUP BY 1
+        ON CONFLICT (day) DO NOTHING
+        """,
+        """
+        INSERT INTO stats_daily (day, approved_payments, revenue)
+        SELECT verified_at::date, COUNT(*), SUM(amount) FROM payments
+        WHERE status = 'approved' AND verified_at IS NOT NULL
+        GROUP BY 1
+        ON CONFLICT (day) DO UPDATE SET
+        approved_payments = EXCLUDED.approved_payments,
+        revenue = EXCLUDED.revenue
+        """,
+        # Each trigger retracts the old row's contribution and adds the new one's
+        """
+        CREATE OR REPLACE FUNCTION stats_users_rollup() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                UPDATE stats_totals SET
+                    total_users = total_users - 1,
+                    active_users = active_users - (CASE WHEN OLD.is_active THEN 1 ELSE 0 END);
+                IF OLD.joined_at IS NOT NULL THEN
+                    UPDATE stats_daily SET new_users = new_users - 1 WHERE day = OLD.joined_at::date;
+                END IF;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                UPDATE stats_totals SET
+                    total_users = total_users + 1,
+                    active_users = active_users + (CASE WHEN NEW.is_active THEN 1 ELSE 0 END);
+                IF NEW.joined_at IS NOT NULL THEN
+                    INSERT INTO stats_daily (day, new_users) VALUES (NEW.joined_at::date, 1)
+                    ON CONFLICT (day) DO UPDATE SET new_users = stats_daily.new_users + 1;
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION stats_payments_rollup() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                UPDATE stats_totals SET
+                    pending_payments = pending_payments - (CASE WHEN OLD.status = 'pending' THEN 1 ELSE 0 END),
+                    approved_payments = approved_payments - (CASE WHEN OLD.status = 'approved' THEN 1 ELSE 0 END),
+                    total_revenue = total_revenue - (CASE WHEN OLD.status = 'approved' THEN OLD.amount ELSE 0 END);
+                IF OLD.status = 'approved' AND OLD.verified_at IS NOT NULL THEN
+                    UPDATE stats_daily SET
+                        approved_payments = approved_payments - 1,
+                        revenue = revenue - OLD.amount
+                    WHERE day = OLD.verified_at::date;
+                END IF;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                UPDATE stats_totals SET
+                    pending_payments = pending_payments + (CASE WHEN NEW.status = 'pending' THEN 1 ELSE 0 END),
+                    approved_payments = approved_payments + (CASE WHEN NEW.status = 'approved' THEN 1 ELSE 0 END),
+                    total_revenue = total_revenue + (CASE WHEN NEW.status = 'approved' THEN NEW.amount ELSE 0 END);
+                IF NEW.status = 'approved' AND NEW.verified_at IS NOT NULL THEN
+                    INSERT INTO stats_daily (day, approved_payments, revenue) VALUES (NEW.verified_at::date, 1, NEW.amount)
+                    ON CONFLICT (day) DO UPDATE SET
+                    approved_payments = stats_daily.approved_payments + 1,
+                    revenue = stats_daily.revenue + EXCLUDED.revenue;
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_stats_users ON users",
+        """
+        CREATE TRIGGER trg_stats_users
+        AFTER INSERT OR DELETE OR UPDATE OF is_active, joined_at ON users
+        FOR EACH ROW EXECUTE FUNCTION stats_users_rollup()
+        """,
+        "DROP TRIGGER IF EXISTS trg_stats_payments ON payments",
+        """
+        CREATE TRIGGER trg_stats_payments
+        AFTER INSERT OR DELETE OR UPDATE OF status, amount, verified_at ON payments
+        FOR EACH ROW EXECUTE FUNCTION stats_payments_rollup()
+        """
+    ]),
+    (4, "Referral counters on users", [
+        "LOCK TABLE referrals IN SHARE ROW EXCLUSIVE MODE",
+        # Registration used to insert every referral twice; keep the first copy
+        """
+        DELETE FROM referrals r
+        USING referrals keep
+        WHERE r.referrer_id = keep.referrer_id AND r.referred_id = keep.referred_id AND r.id > keep.id
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_referrals_pair ON referrals (referrer_id, referred_id)",
+        "CREATE INDEX IF NOT EXISTS idx_referrals_referrer_created ON referrals (referrer_id, created_at, id)",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS referral_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS completed_referral_count INTEGER NOT NULL DEFAULT 0",
+        """
+        UPDATE users u SET
+            referral_count = c.total,
+            completed_referral_count = c.completed
+        FROM (
+            SELECT referrer_id, COUNT(*) AS total, COUNT(*) FILTER (WHERE status = 'completed') AS completed
+            FROM referrals GROUP BY referrer_id
+        ) c
+        WHERE u.user_id = c.referrer_id
+        """,
+        """
+        CREATE OR REPLACE FUNCTION referral_counters() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                UPDATE users SET
+                    referral_count = referral_count - 1,
+                    completed_referral_count = completed_referral_count - (CASE WHEN OLD.status = 'completed' THEN 1 ELSE 0 END)
+                WHERE user_id = OLD.referrer_id;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                UPDATE users SET
+                    referral_count = referral_count + 1,
+                    completed_referral_count = completed_referral_count + (CASE WHEN NEW.status = 'completed' THEN 1 ELSE 0 END)
+                WHERE user_id = NEW.referrer_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_referral_counters ON referrals",
+        """
+        CREATE TRIGGER trg_referral_counters
+        AFTER INSERT OR DELETE OR UPDATE OF status, referrer_id ON referrals
+        FOR EACH ROW EXECUTE FUNCTION referral_counters()
+        """
+    ]),
+    (5, "Referral leaderboard materialized view", [
+        "CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users (referred_by)",
+        # Calendar week/month so contests have fixed boundaries; refreshed by the scheduler
+        """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS referral_leaderboard AS
+        SELECT p.period,
+               r.referrer_id,
+               COUNT(*) AS referrals,
+               COUNT(*) FILTER (WHERE r.status = 'completed') AS completed_referrals,
+               RANK() OVER (PARTITION BY p.period ORDER BY COUNT(*) DESC) AS rank,
+               CURRENT_TIMESTAMP AS refreshed_at
+        FROM referrals r
+        CROSS JOIN (VALUES
+            ('week', date_trunc('week', CURRENT_TIMESTAMP)),
+            ('month', date_trunc('month', CURRENT_TIMESTAMP)),
+            ('all', NULL)
+        ) AS p(period, since)
+        WHERE p.since IS NULL OR r.created_at >= p.since
+        GROUP BY p.period, r.referrer_id
+        """,
+        # Unique index is what allows REFRESH ... CONCURRENTLY
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_referral_leaderboard_period_referrer ON referral_leaderboard (period, referrer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_referral_leaderboard_period_rank ON referral_leaderboard (period, rank)"
+    ]),
+    (6, "Index for the expiry sweeper", [
+        "CREATE INDEX IF NOT EXISTS idx_subscriptions_status_expiry ON subscriptions (status, expiry_date)"
+    ]),
+    (7, "Scheduler run history", [
+        """
+        CREATE TABLE IF NOT EXISTS scheduler_runs (
+            job_name VARCHAR(100) PRIMARY KEY,
+            last_scheduled_at TIMESTAMP NOT NULL,
+            last_started_at TIMESTAMP,
+            last_finished_at TIMESTAMP,
+            last_duration_ms INTEGER,
+            last_status VARCHAR(20),
+            last_error TEXT
+        )
+        """
+    ]),
+    (8, "Notification ledger for reminder jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS notification_ledger (
+            subscription_id INTEGER REFERENCES subscriptions(id) ON DELETE CASCADE,
+            notification_type VARCHAR(30) NOT NULL,
+            notify_window DATE NOT NULL,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (subscription_id, notification_type, notify_window)
+        )
+        """
+    ]),
+    (9, "Transactional email outbox", [
+        """
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            to_email VARCHAR(255) NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (next_attempt_at) WHERE status = 'pending'",
+    ]),
+    (10, "Per-channel notification ledger", [
+        "ALTER TABLE notification_ledger ADD COLUMN IF NOT EXISTS channel VARCHAR(10) NOT NULL DEFAULT 'telegram'",
+        "ALTER TABLE notification_ledger DROP CONSTRAINT IF EXISTS notification_ledger_pkey",
+        # Reminders recorded before now covered both channels
+        """
+        INSERT INTO notification_ledger (subscription_id, notification_type, notify_window, sent_at, channel)
+        SELECT subscription_id, notification_type, notify_window, sent_at, 'email'
+        FROM notification_ledger WHERE channel = 'telegram'
+        """,
+        "ALTER TABLE notification_ledger ADD PRIMARY KEY (subscription_id, notification_type, notify_window, channel)",
+        "ALTER TABLE notification_ledger ALTER COLUMN channel DROP DEFAULT",
+    ]),
+    (11, "users.joined_at is required (keyset pagination sorts on it)", [
+        # Backfill from the user's first subscription, else now; the stats trigger counts them on that day
+        """
+        UPDATE users u SET joined_at = COALESCE(
+            (SELECT MIN(created_at) FROM subscriptions WHERE user_id = u.user_id), CURRENT_TIMESTAMP
+        )
+        WHERE joined_at IS NULL
+        """,
+        "ALTER TABLE users ALTER COLUMN joined_at SET NOT NULL",
+    ]),
+]
+
+# Arbitrary key for pg_advisory_xact_lock so replicas booting together
+# apply each step only once
+MIGRATION_LOCK_KEY = 727_001
+
+def latest_version():
+    """Highest version shipped in MIGRATIONS"""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def get_schema_version(database):
+    """Return the applied schema version, or 0 for an empty database"""
+    result = database.execute_query("SELECT to_regclass('schema_version') IS NOT NULL AS present", fetch=True)
+    if not result or not result[0]['present']:
+        return 0
+    result = database.execute_query("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version", fetch=True)
+    return result[0]['version'] if result else 0
+
+def run_migrations(database):
+    """Apply pending migrations in order; no DDL runs when the schema is current"""
+    current = get_schema_version(database)
+    target = latest_version()
+    if current >= target:
+        logger.info(f"Database schema is current (version {current})")
+        return current
+
+    database.execute_query("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description VARCHAR(255),
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        with database.transaction() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            cursor.execute("SELECT 1 FROM schema_version WHERE version = %s", (version,))
+            if cursor.fetchone():
+                continue
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                (version, description)
+            )
+        logger.info(f"Applied migration {version}: {description}")
+        current = version
+
+    return current
@@ -0,0 +1,135 @@
+"""Compact row models.
+
+Each model stores its columns in `__slots__` instead of a per-row dict,
+which cuts per-row overhead to about a third (see benchmark_rows.py). Rows still read
+like the dict rows they replace (row['name'], row.get('email')), so
+handlers don't care which they get.
+
+A model can be filled from a partial SELECT: columns that weren't
+fetched are simply unset, and reading one raises KeyError just like a
+missing dict key. Use Model.columns(...) to build a validated column
+list for such projections; they save the transfer and the value objects
+of the columns left out.
+"""
+
+class Row:
+    __slots__ = ()
+    _fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = []
+        for klass in reversed(cls.__mro__):
+            fields.extend(klass.__dict__.get('__slots__', ()))
+        cls._fields = tuple(fields)
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """Build a row from a dict-like row; keys that aren't columns raise AttributeError"""
+        row = cls.__new__(cls)
+        for name, value in mapping.items():
+            setattr(row, name, value)
+        return row
+
+    @classmethod
+    def from_cursor(cls, cursor, rows):
+        """Build rows from plain tuples as returned by a non-dict cursor"""
+        names = [column[0] for column in cursor.description]
+        unknown = set(names) - set(cls._fields)
+        if unknown:
+            raise ValueError(f"{cls.__name__} has no columns {sorted(unknown)}")
+        new, set_attr = cls.__new__, object.__setattr__
+        result = []
+        for values in rows:
+            row = new(cls)
+            for name, value in zip(names, values):
+                set_attr(row, name, value)
+            result.append(row)
+        return result
+
+    @classmethod
+    def columns(cls, *names, alias=None):
+        """Comma-separated column list for a SELECT, checked against the model"""
+        names = names or cls._fields
+        unknown = set(names) - set(cls._fields)
+        if unknown:
+            raise ValueError(f"{cls.__name__} has no columns {sorted(unknown)}")
+        prefix = f"{alias}." if alias else ""
+        return ", ".join(f"{prefix}{name}" for name in names)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._fields and hasattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [name for name in self._fields if hasattr(self, name)]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.keys()]
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.keys()}
+
+    def __eq__(self, other):
+        if not isinstance(other, Row):
+            return NotImplemented
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.keys())
+        return f"{type(self).__name__}({fields})"
+
+class User(Row):
+    __slots__ = (
+        'user_id', 'name', 'email', 'phone', 'country', 'language', 'referral_code',
+        'referred_by', 'telegram_username', 'privacy_allowed', 'joined_at', 'is_active',
+        'referral_count', 'completed_referral_count'
+    )
+
+class Subscription(Row):
+    __slots__ = (
+        'id', 'user_id', 'service', 'duration', 'amount', 'payment_method',
+        'status', 'start_date', 'expiry_date', 'created_at'
+    )
+
+class SubscriptionWithUser(Subscription):
+    """Subscription joined with the owner's contact details"""
+    __slots__ = ('name', 'email', 'language')
+
+class Payment(Row):
+    __slots__ = (
+        'id', 'user_id', 'subscription_id', 'payment_method', 'amount', 'tx_hash',
+        'receipt_path', 'status', 'verified_by', 'verified_at', 'created_at'
+    )
+
+class Referral(Row):
+    __slots__ = ('id', 'referrer_id', 'referred_id', 'reward_type', 'reward_amount', 'status', 'created_at')
+
+class ReferralWithName(Referral):
+    """Referral joined with the referred user's name"""
+    __slots__ = ('referred_name',)
+
+class Session(Row):
+    __slots__ = ('user_id', 'current_step', 'temp_data', 'updated_at')
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import time
+from telegram.error import Forbidden, RetryAfter
+from email_quota import REMINDER
+
+logger = logging.getLogger(__name__)
+
+class Notification:
+    """One reminder for one user, rendered for each channel.
+    A channel whose content is None is skipped for this user. `key`
+    identifies the reminder in the caller's ledger (see dispatch())."""
+
+    __slots__ = ('user_id', 'email', 'subject', 'body', 'telegram_text', 'key')
+
+    def __init__(self, user_id, email=None, subject=None, body=None, telegram_text=None, key=None):
+        self.user_id = user_id
+        self.key = key
+        self.email = email
+        self.subject = subject
+        self.body = body
+        self.telegram_text = telegram_text
+
+class RateLimiter:
+    """Spaces calls to at most `rate` per second across every caller"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+class ReminderDispatcher:
+    """Fans reminders out to email and Telegram with bounded concurrency.
+
+    Notifications are fed through bounded queues (so a large stream never
+    piles up in memory) to a fixed set of workers per channel. Email
+    workers take whatever is queued (up to `email_batch`) and send it with
+    email_service.send_many() over one pooled SMTP session; each channel
+    is throttled to its own rate. Reminder email runs at REMINDER priority
+    against the email quota; what it defers counts as 'deferred' and, like
+    a failure, leaves the notification undelivered on that channel for the
+    next run, whatever happened on the other one.
+    dispatch() returns sent/failed/skipped counts per channel.
+
+    Send errors are counted per notification (per batch for email) and
+    never stop a worker. Should a worker die anyway, dispatch() raises
+    instead of waiting forever on a queue nobody drains.
+    """
+
+    def __init__(self, bot, email_service, email_workers=4, telegram_workers=8,
+                 email_rate=5, telegram_rate=25, queue_size=200, email_batch=20):
+        self.bot = bot
+        self.email_service = email_service
+        self.email_workers = email_workers
+        self.telegram_workers = telegram_workers
+        self.email_limiter = RateLimiter(email_rate)
+        self.telegram_limiter = RateLimiter(telegram_rate)
+        self.queue_size = queue_size
+        self.email_batch = email_batch
+
+    async def dispatch(self, name, notifications, summary=None):
+        """Send every Notification from the async iterable `notifications`.
+
+        The summary's 'undelivered' dict maps each channel to the keys of
+        keyed notifications queued on it that it failed to deliver. Pass
+        your own `summary` dict to read it even if dispatch() fails or is
+        cancelled (e.g. by a job timeout) partway through.
+        """
+        started = time.perf_counter()
+        summary = {} if summary is None else summary
+        summary.update({
+            'email': {'sent': 0, 'failed': 0, 'skipped': 0, 'deferred': 0},
+            'telegram': {'sent': 0, 'failed': 0, 'skipped': 0},
+        })
+        keys = {'email': [], 'telegram': []}
+        delivered = {'email': set(), 'telegram': set()}
+        email_queue = asyncio.Queue(self.queue_size)
+        telegram_queue = asyncio.Queue(self.queue_size)
+        email_workers = [
+            asyncio.create_task(self._email_worker(email_queue, summary['email'], delivered['email']))
+            for _ in range(self.email_workers)
+        ]
+        telegram_workers = [
+            asyncio.create_task(self._telegram_worker(telegram_queue, summary['telegram'], delivered['telegram']))
+            for _ in range(self.telegram_workers)
+        ]
+        workers = email_workers + telegram_workers
+        try:
+            async for notification in notifications:
+                keyed = notification.key is not None
+                if notification.email and notification.body:
+                    if keyed:
+                        keys['email'].append(notification.key)
+                    await self._put(email_queue, notification, email_workers)
+                else:
+                    summary['email']['skipped'] += 1
+                if notification.telegram_text:
+                    if keyed:
+                        keys['telegram'].append(notification.key)
+                    await self._put(telegram_queue, notification, telegram_workers)
+                else:
+                    summary['telegram']['skipped'] += 1
+            for _ in email_workers:
+                await self._put(email_queue, None, email_workers)
+            for _ in telegram_workers:
+                await self._put(telegram_queue, None, telegram_workers)
+            await asyncio.gather(*workers)
+        except BaseException:
+            for worker in workers:
+                worker.cancel()
+            raise
+        finally:
+            summary['undelivered'] = {
+                channel: [key for key in channel_keys if key not in delivered[channel]]
+                for channel, channel_keys in keys.items()
+            }
+
+        summary['seconds'] = round(time.perf_counter() - started, 1)
+        logger.info(
+            f"{name}: email {summary['email']['sent']} sent / {summary['email']['failed']} failed, "
+            f"telegram {summary['telegram']['sent']} sent / {summary['telegram']['failed']} failed "
+            f"in {summary['seconds']}s"
+        )
+        return summary
+
+    @staticmethod
+    async def _put(queue, item, workers):
+        """queue.put() that raises instead of hanging once the queue's workers are gone"""
+        try:
+            queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+        put = asyncio.create_task(queue.put(item))
+        try:
+            alive = [worker for worker in workers if not worker.done()]
+            while alive:
+                done, _ = await asyncio.wait([put, *alive], return_when=asyncio.FIRST_COMPLETED)
+                if put in done:
+                    return
+                for worker in done:
+                    # Re-raise whatever killed it; a worker that saw its sentinel just ends
+                    worker.result()
+                alive = [worker for worker in alive if not worker.done()]
+            raise RuntimeError("Reminder workers exited before draining their queue")
+        finally:
+            put.cancel()
+
+    async def _email_worker(self, queue, counts, delivered):
+        finished = False
+        while not finished:
+            # Whatever is already queued goes out in one batch; stop at our sentinel
+            batch = []
+            notification = await queue.get()
+            while notification is not None:
+                batch.append(notification)
+                if len(batch) >= self.email_batch or queue.empty():
+                    break
+                notification = queue.get_nowait()
+            finished = notification is None
+            if not batch:
+                continue
+            for _ in batch:
+                await self.email_limiter.wait()
+            try:
+                results = await asyncio.to_thread(
+                    self.email_service.send_many,
+                    [(notification.email, notification.subject, notification.body) for notification in batch],
+                    priority=REMINDER
+                )
+            except Exception as e:
+                logger.error(f"Reminder email batch of {len(batch)} failed: {e}")
+                results = [False] * len(batch)
+            for notification, sent in zip(batch, results):
+                if sent:
+                    counts['sent'] += 1
+                    delivered.add(notification.key)
+                elif sent is None:
+                    counts['deferred'] += 1
+                else:
+                    counts['failed'] += 1
+
+    async def _telegram_worker(self, queue, counts, delivered):
+        while True:
+            notification = await queue.get()
+            if notification is None:
+                return
+            try:
+                await self._send_telegram(notification, counts, delivered)
+            except Exception as e:
+                logger.error(f"Telegram reminder to user {notification.user_id} failed: {e}")
+                counts['failed'] += 1
+
+    async def _send_telegram(self, notification, counts, delivered):
+        for attempt in range(2):
+            await self.telegram_limiter.wait()
+            try:
+                await self.bot.send_message(
+                    chat_id=notification.user_id,
+                    text=notification.telegram_text,
+                    parse_mode='Markdown'
+                )
+                counts['sent'] += 1
+                delivered.add(notification.key)
+                break
+            except RetryAfter as e:
+                # Flood control: back off as told, then retry once
+                if attempt:
+                    counts['failed'] += 1
+                    break
+                retry_after = e.retry_after
+                await asyncio.sleep(retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after)
+            except Forbidden:
+                # User blocked the bot
+                counts['failed'] += 1
+                break
+            except Exception as e:
+                logger.error(f"Telegram reminder to user {notification.user_id} failed: {e}")
+                counts['failed'] += 1
+                break
@@ -0,0 +1,90 @@
+import re
+import threading
+import logging
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+def normalize_query(query):
+    """Collapse a SQL string to a stable key: literals become ?, whitespace is squashed"""
+    text = query.decode() if isinstance(query, bytes) else str(query)
+    text = _STRING_LITERAL.sub('?', text)
+    text = _NUMBER_LITERAL.sub('?', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+class QueryStats:
+    """Per-statement timing histograms, row and error counts.
+
+    Statements are grouped by their normalized text, so the same query
+    issued with different parameters lands in one entry. Anything slower
+    than `slow_threshold_ms` is also logged as a warning.
+    """
+
+    def __init__(self, slow_threshold_ms=200):
+        self.slow_threshold_ms = slow_threshold_ms
+        self._entries = {}  # normalized query -> counters
+        self._normalized = {}  # raw query text -> normalized key
+        self._lock = threading.Lock()
+
+    def record(self, query, elapsed_ms, rows=0, error=False):
+        key = self._normalized.get(query)
+        if key is None:
+            key = normalize_query(query)
+            self._normalized[query] = key
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {
+                    'calls': 0,
+                    'errors': 0,
+                    'rows': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+            entry['calls'] += 1
+            entry['rows'] += rows
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['buckets'][bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+            if error:
+                entry['errors'] += 1
+        if elapsed_ms >= self.slow_threshold_ms:
+            logger.warning(f"Slow query ({elapsed_ms:.1f} ms, {rows} rows): {key[:300]}")
+
+    def top(self, limit=10, order_by='total_ms'):
+        """The `limit` statements with the highest `order_by` counter"""
+        with self._lock:
+            snapshot = [
+                dict(entry, query=key, buckets=list(entry['buckets']))
+                for key, entry in self._entries.items()
+            ]
+        for entry in snapshot:
+            entry['avg_ms'] = entry['total_ms'] / entry['calls'] if entry['calls'] else 0.0
+            entry['p95_ms'] = self._percentile(entry['buckets'], entry['calls'], 0.95)
+        snapshot.sort(key=lambda entry: entry[order_by], reverse=True)
+        return snapshot[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _percentile(buckets, calls, fraction):
+        """Upper bound of the bucket holding the given fraction of calls (None if open-ended)"""
+        if not calls:
+            return 0.0
+        target = calls * fraction
+        seen = 0
+        for index, count in enumerate(buckets):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else None
+        return None
@@ -0,0 +1,47 @@
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes
+from database import db, adb
+
+logger = logging.getLogger(__name__)
+
+class RequestContext:
+    """Everything handlers need about the user behind an update.
+
+    The user row and active subscription are loaded together with the
+    stored session in a single query, which also settles whether the user
+    has a session at all. Writes made earlier in the same update are still
+    in the session store's memory and take precedence over that snapshot.
+    """
+
+    def __init__(self, user_id, user=None, active_subscription=None, session=None):
+        self.user_id = user_id
+        self.user = user
+        self.active_subscription = active_subscription
+        self._session = session  # As loaded; None when the user has none
+
+    @property
+    def session(self):
+        return db.sessions.peek(self.user_id, default=self._session)
+
+    @property
+    def language(self):
+        return self.user.get('language', 'en') if self.user else 'en'
+
+async def get_request_context(update: Update, context: ContextTypes.DEFAULT_TYPE, refresh=False):
+    """Return the RequestContext attached to `context`, loading it on first use"""
+    user_id = update.effective_user.id
+    request_context = getattr(context, 'request_context', None)
+    if refresh or request_context is None or request_context.user_id != user_id:
+        snapshot = await adb.get_request_snapshot(user_id)
+        if snapshot is None:
+            logger.error(f"Failed to load request context for user {user_id}")
+            # Still serve the stored session, so a flow in progress isn't cut short
+            snapshot = (None, None, await adb.get_user_session(user_id))
+        request_context = RequestContext(user_id, *snapshot)
+        context.request_context = request_context
+    return request_context
+
+def invalidate_request_context(context: ContextTypes.DEFAULT_TYPE):
+    """Force the next get_request_context() to reload, e.g. after a profile write"""
+    context.request_context = None
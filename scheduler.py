@@ -1,162 +1,224 @@
-import schedule
-import time
-import asyncio
 import logging
-from datetime import datetime, timedelta
-from database import db
+from datetime import datetime
+from database import adb, EXPIRY_WARNING, RENEWAL_REMINDER, EMAIL, TELEGRAM
 from email_service import email_service
-from config import SERVICES
+from messages import get_message
+from config import (
+    SERVICES, ADMIN_IDS, LEADERBOARD_REFRESH_MINUTES, EXPIRY_SWEEP_MINUTES, EXPIRY_SWEEP_BATCH_SIZE,
+    JOB_JITTER_SECONDS, REMINDER_EMAIL_WORKERS, REMINDER_EMAIL_RATE, REMINDER_TELEGRAM_WORKERS,
+    REMINDER_TELEGRAM_RATE, REMINDER_JOB_TIMEOUT, DATABASE_URL, SCHEDULER_HEARTBEAT_SECONDS, SERVICE_GROUPS,
+    EXPIRY_TIMER_HORIZON_MINUTES, GROUP_REMOVAL_RATE, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_SECONDS
+)
+from leader import LeaderLease
+from notification_dispatcher import Notification, ReminderDispatcher
+from expiry_sweeper import ExpirySweeper
+from expiry_timers import ExpiryTimers, GroupRemover
+from email_outbox import OutboxWorker
+from job_runner import JobRunner, every_minutes
 
 logger = logging.getLogger(__name__)
 
 class BotScheduler:
+    """Background jobs, run by a JobRunner on the bot's own event loop"""
+
     def __init__(self, bot):
         self.bot = bot
+        # Only one replica (the lease holder) runs jobs
+        self.leader = LeaderLease(DATABASE_URL, heartbeat_interval=SCHEDULER_HEARTBEAT_SECONDS)
+        self.runner = JobRunner(adb, leader=self.leader)
+        self.dispatcher = ReminderDispatcher(
+            bot, email_service,
+            email_workers=REMINDER_EMAIL_WORKERS, telegram_workers=REMINDER_TELEGRAM_WORKERS,
+            email_rate=REMINDER_EMAIL_RATE, telegram_rate=REMINDER_TELEGRAM_RATE
+        )
+        self.outbox = OutboxWorker(adb, email_service, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_SECONDS)
+        self.expiry_sweeper = ExpirySweeper(adb, EXPIRY_SWEEP_BATCH_SIZE)
+        self.expiry_sweeper.add_listener(self.log_expired_subscriptions)
+        self.group_remover = self.expiry_sweeper.add_listener(
+            GroupRemover(bot, adb, SERVICE_GROUPS, GROUP_REMOVAL_RATE)
+        )
+        # Expire each subscription at its exact time; the sweep remains the backstop
+        self.expiry_timers = ExpiryTimers(
+            adb, self.expiry_sweeper, EXPIRY_TIMER_HORIZON_MINUTES, is_active=lambda: self.runner.is_active
+        )
+        self.leader.add_listener(self.expiry_timers.on_leadership)
         self.setup_jobs()
-    
+
     def setup_jobs(self):
-        """Setup scheduled jobs"""
+        """Setup scheduled jobs (cron times are server local time)"""
         # Daily jobs
-        schedule.every().day.at("09:00").do(self.check_expiring_subscriptions)
-        schedule.every().day.at("10:00").do(self.send_renewal_reminders)
-        schedule.every().day.at("18:00").do(self.cleanup_old_sessions)
-        
+        self.runner.add_job(
+            "check_expiring_subscriptions", self.check_expiring_subscriptions, "0 9 * * *",
+            jitter=JOB_JITTER_SECONDS, timeout=REMINDER_JOB_TIMEOUT
+        )
+        self.runner.add_job(
+            "send_renewal_reminders", self.send_renewal_reminders, "0 10 * * *",
+            jitter=JOB_JITTER_SECONDS, timeout=REMINDER_JOB_TIMEOUT
+        )
+        self.runner.add_job("cleanup_old_sessions", self.cleanup_old_sessions, "0 18 * * *", jitter=JOB_JITTER_SECONDS)
+
+        # Frequent jobs
+        self.runner.add_job("send_queued_emails", self.outbox.drain, "* * * * *")
+        self.runner.add_job(
+            "sweep_expired_subscriptions", self.sweep_expired_subscriptions,
+            every_minutes(EXPIRY_SWEEP_MINUTES), jitter=min(JOB_JITTER_SECONDS, 30)
+        )
+        self.runner.add_job(
+            "refresh_referral_leaderboard", self.refresh_referral_leaderboard,
+            every_minutes(LEADERBOARD_REFRESH_MINUTES), jitter=min(JOB_JITTER_SECONDS, 30)
+        )
+
         # Weekly jobs
-        schedule.every().sunday.at("10:00").do(self.send_weekly_stats)
-        
+        self.runner.add_job("send_weekly_stats", self.send_weekly_stats, "0 10 * * 0", jitter=JOB_JITTER_SECONDS)
+
         logger.info("Scheduled jobs setup complete")
-    
-    def check_expiring_subscriptions(self):
-        """Check for subscriptions expiring soon"""
-        try:
-            # Check subscriptions expiring in 3 days
-            expiring_soon = db.get_expiring_subscriptions(3)
-            
-            for subscription in expiring_soon:
-                service_info = SERVICES.get(subscription['service'], {})
-                service_name = service_info.get('name', subscription['service'])
-                
-                days_left = (subscription['expiry_date'] - datetime.now()).days
-                
-                # Send email reminder
-                email_service.send_expiry_warning(
-                    subscription['name'],
-                    subscription['email'],
-                    service_name,
-                    days_left
-                )
-                
-                logger.info(f"Sent expiry warning to user {subscription['user_id']}")
-            
-            # Disable expired subscriptions
-            expired_query = """
-            UPDATE subscriptions 
-            SET status = 'expired' 
-            WHERE status = 'active' AND expiry_date < CURRENT_TIMESTAMP
-            """
-            db.execute_query(expired_query)
-            
-            logger.info("Checked expiring subscriptions")
-        except Exception as e:
-            logger.error(f"Failed to check expiring subscriptions: {e}")
-    
-    def send_renewal_reminders(self):
-        """Send renewal reminders to users with expired subscriptions"""
+
+    async def start(self):
+        await self.leader.start()
+        await self.runner.start()
+        await self.expiry_timers.start()
+
+    async def stop(self):
+        await self.expiry_timers.stop()
+        await self.runner.stop()
+        await self.leader.stop()
+
+    async def check_expiring_subscriptions(self):
+        """Warn users (email + Telegram) whose subscriptions expire within 3 days"""
+        def render(subscription, service_name):
+            days_left = (subscription['expiry_date'] - datetime.now()).days
+            subject, body = email_service.expiry_warning_content(subscription['name'], service_name, days_left)
+            telegram_text = get_message(
+                subscription['language'], 'bot_expiry_warning', service=service_name, days_left=days_left
+            )
+            return subject, body, telegram_text
+
+        # Subscriptions expiring in 3 days
+        return await self.send_ledgered_reminders(
+            "Expiry warnings", EXPIRY_WARNING, 'iter_expiring_subscriptions', 3, render
+        )
+
+    async def sweep_expired_subscriptions(self):
+        """Expire lapsed subscriptions in small batches (runs every few minutes)"""
+        await self.expiry_sweeper.sweep()
+
+    def log_expired_subscriptions(self, subscriptions):
+        """Expiry listener: record which subscriptions just lapsed"""
+        ids = ", ".join(str(subscription['id']) for subscription in subscriptions)
+        logger.info(f"Subscriptions expired: {ids}")
+
+    async def send_renewal_reminders(self):
+        """Remind users (email + Telegram) whose subscriptions expired in the last 7 days"""
+        def render(subscription, service_name):
+            subject, body = email_service.renewal_reminder_content(subscription['name'], service_name)
+            telegram_text = get_message(subscription['language'], 'bot_renewal_reminder', service=service_name)
+            return subject, body, telegram_text
+
+        # Recently expired subscriptions (within 7 days)
+        return await self.send_ledgered_reminders(
+            "Renewal reminders", RENEWAL_REMINDER, 'iter_recently_expired_subscriptions', 7, render
+        )
+
+    async def send_ledgered_reminders(self, name, notification_type, stream, days, render):
+        """Send one reminder per subscription and expiry date, at most once.
+
+        The stream already leaves out subscriptions claimed on every channel
+        in the notification ledger; each chunk is then claimed there per
+        channel in one INSERT each, and a channel is only sent what this run
+        claimed on it, so overlapping runs, restarts and catch-ups never
+        repeat a reminder. Claims a channel failed to deliver (including
+        email the quota deferred) are released afterwards for the next run
+        to retry on that channel alone, even if this run fails or times out.
+        """
+        # Claimed but not yet handed to the dispatcher
+        unsent = {EMAIL: set(), TELEGRAM: set()}
+
+        async def notifications():
+            async for subscriptions in adb.iterate(stream, days):
+                with_email = [subscription for subscription in subscriptions if subscription['email']]
+                telegram_claimed = await adb.claim_notifications(notification_type, subscriptions, TELEGRAM)
+                email_claimed = await adb.claim_notifications(notification_type, with_email, EMAIL)
+                if telegram_claimed is None or email_claimed is None:
+                    # Sending unclaimed rows could repeat them later; leave them for the next run
+                    logger.error(f"{name}: could not claim {len(subscriptions)} reminders on every channel, skipping the unclaimed ones")
+                    telegram_claimed = telegram_claimed or set()
+                    email_claimed = email_claimed or set()
+                unsent[EMAIL].update(email_claimed)
+                unsent[TELEGRAM].update(telegram_claimed)
+                for subscription in subscriptions:
+                    key = (subscription['id'], subscription['expiry_date'].date())
+                    send_email, send_telegram = key in email_claimed, key in telegram_claimed
+                    if not (send_email or send_telegram):
+                        continue
+                    service_info = SERVICES.get(subscription['service'], {})
+                    service_name = service_info.get('name', subscription['service'])
+                    subject, body, telegram_text = render(subscription, service_name)
+                    unsent[EMAIL].discard(key)
+                    unsent[TELEGRAM].discard(key)
+                    yield Notification(
+                        subscription['user_id'],
+                        email=subscription['email'] if send_email else None,
+                        subject=subject,
+                        body=body,
+                        telegram_text=telegram_text if send_telegram else None,
+                        key=key
+                    )
+
+        summary = {}
         try:
-            # Get users with recently expired subscriptions (within 7 days)
-            query = """
-            SELECT s.*, u.name, u.email FROM subscriptions s
-            JOIN users u ON s.user_id = u.user_id
-            WHERE s.status = 'expired' 
-            AND s.expiry_date > CURRENT_TIMESTAMP - INTERVAL '7 days'
-            AND s.expiry_date < CURRENT_TIMESTAMP
-            """
-            expired_subscriptions = db.execute_query(query, fetch=True)
-            
-            for subscription in expired_subscriptions:
-                service_info = SERVICES.get(subscription['service'], {})
-                service_name = service_info.get('name', subscription['service'])
-                
-                # Send renewal email
-                subject = f"Renew Your {service_name} Subscription"
-                body = f"""
-                Dear {subscription['name']},
-
-                Your {service_name} subscription expired recently. 
-
-                Don't miss out on continuing your trading journey! 
-                Renew now and get back to learning and earning.
-
-                Return to the bot to renew: [Bot Link]
-
-                Best regards,
-                Trading Mentor Team
-                """
-                
-                email_service.send_email(subscription['email'], subject, body)
-                
-                logger.info(f"Sent renewal reminder to user {subscription['user_id']}")
-        except Exception as e:
-            logger.error(f"Failed to send renewal reminders: {e}")
-    
-    def cleanup_old_sessions(self):
+            await self.dispatcher.dispatch(name, notifications(), summary)
+        finally:
+            undelivered_by_channel = summary.pop('undelivered', {})
+            for channel, claims in unsent.items():
+                undelivered = list(claims) + undelivered_by_channel.get(channel, [])
+                if undelivered:
+                    await adb.release_notifications(notification_type, undelivered, channel)
+                    logger.info(f"{name}: released {len(undelivered)} undelivered {channel} reminders for retry")
+        return summary
+
+    async def cleanup_old_sessions(self):
         """Clean up old user sessions"""
-        try:
-            # Remove sessions older than 24 hours
-            query = """
-            DELETE FROM user_sessions 
-            WHERE updated_at < CURRENT_TIMESTAMP - INTERVAL '24 hours'
-            """
-            db.execute_query(query)
-            
-            logger.info("Cleaned up old sessions")
-        except Exception as e:
-            logger.error(f"Failed to cleanup sessions: {e}")
-    
-    def send_weekly_stats(self):
+        # Remove sessions older than 24 hours
+        removed = await adb.cleanup_old_sessions()
+        # Delivered outbox emails are kept a week for reference
+        await adb.purge_sent_emails()
+
+        logger.info(f"Cleaned up old sessions ({removed} removed)")
+
+    async def refresh_referral_leaderboard(self):
+        """Recompute the referral leaderboard materialized view"""
+        await adb.refresh_referral_leaderboard()
+        logger.info("Refreshed referral leaderboard")
+
+    async def send_weekly_stats(self):
         """Send weekly statistics to admins"""
-        try:
-            from config import ADMIN_IDS
-            
-            # Get weekly stats
-            user_stats = db.get_user_stats()
-            revenue_stats = db.get_revenue_stats()
-            
-            # Get this week's revenue
-            weekly_revenue_query = """
-            SELECT SUM(amount) as weekly_revenue, COUNT(*) as weekly_payments
-            FROM payments 
-            WHERE status = 'approved' 
-            AND verified_at > CURRENT_DATE - INTERVAL '7 days'
-            """
-            weekly_stats = db.execute_query(weekly_revenue_query, fetch=True)
-            weekly_revenue = weekly_stats[0]['weekly_revenue'] if weekly_stats and weekly_stats[0]['weekly_revenue'] else 0
-            weekly_payments = weekly_stats[0]['weekly_payments'] if weekly_stats else 0
-            
-            stats_message = f"""
-            📊 **Weekly Stats Report**
-            
-            👥 **Users:**
-            • Total: {user_stats['total_users'] if user_stats else 0}
-            • New this week: {user_stats['new_this_week'] if user_stats else 0}
-            • Active: {user_stats['active_users'] if user_stats else 0}
-            
-            💰 **Revenue:**
-            • This week: ${weekly_revenue:,.2f} ({weekly_payments} payments)
-            • Total: ${revenue_stats['total_revenue'] if revenue_stats else 0:,.2f}
-            • Average payment: ${revenue_stats['avg_payment'] if revenue_stats else 0:,.2f}
-            
-            Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
-            """
-            
-            # Send to all admins
-            for admin_id in ADMIN_IDS:
-                asyncio.create_task(self.send_admin_message(admin_id, stats_message))
-            
-            logger.info("Sent weekly stats to admins")
-        except Exception as e:
-            logger.error(f"Failed to send weekly stats: {e}")
-    
+        # Get weekly stats from the precomputed rollups
+        stats = await adb.get_stats_summary()
+        weekly_revenue = stats['weekly_revenue'] if stats else 0
+        weekly_payments = stats['weekly_payments'] if stats else 0
+
+        stats_message = f"""
+        📊 **Weekly Stats Report**
+
+        👥 **Users:**
+        • Total: {stats['total_users'] if stats else 0}
+        • New this week: {stats['new_this_week'] if stats else 0}
+        • Active: {stats['active_users'] if stats else 0}
+
+        💰 **Revenue:**
+        • This week: ${weekly_revenue:,.2f} ({weekly_payments} payments)
+        • Total: ${stats['total_revenue'] if stats else 0:,.2f}
+        • Average payment: ${stats['avg_payment'] if stats else 0:,.2f}
+
+        Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
+        """
+
+        # Send to all admins
+        for admin_id in ADMIN_IDS:
+            await self.send_admin_message(admin_id, stats_message)
+
+        logger.info("Sent weekly stats to admins")
+
     async def send_admin_message(self, admin_id, message):
         """Send message to admin"""
         try:
@@ -167,24 +229,11 @@ class BotScheduler:
             )
         except Exception as e:
             logger.error(f"Failed to send message to admin {admin_id}: {e}")
-    
-    def run_pending(self):
-        """Run pending scheduled jobs"""
-        schedule.run_pending()
-
-def start_scheduler(bot):
-    """Start the scheduler in a separate thread"""
-    import threading
-    
+
+async def start_scheduler(bot):
+    """Start the job runner on the running event loop (call from post_init)"""
     scheduler = BotScheduler(bot)
-    
-    def scheduler_loop():
-        while True:
-            scheduler.run_pending()
-            time.sleep(60)  # Check every minute
-    
-    scheduler_thread = threading.Thread(target=scheduler_loop, daemon=True)
-    scheduler_thread.start()
-    
+    await scheduler.start()
+
     logger.info("Scheduler started")
-    return scheduler
\ No newline at end of file
+    return scheduler
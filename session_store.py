@@ -0,0 +1,155 @@
+import copy
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from psycopg2.extras import Json, execute_values
+from models import Session
+
+logger = logging.getLogger(__name__)
+
+class SessionStore:
+    """Write-back buffer in front of the user_sessions table.
+
+    Writes land in memory and a background thread flushes them to Postgres
+    in batches every `flush_interval` seconds; until then they are served
+    from memory. Reads are not cached: the per-update request snapshot
+    already reads the row, so a session another replica changed is never
+    served stale from here. With several replicas handling updates, set
+    `flush_interval` to 0 so writes go straight to the table (write-through)
+    and the next update sees them whichever replica it lands on. Sessions
+    idle for longer than `ttl` are treated as gone, judged by the database
+    clock as the cleanup job does.
+    """
+
+    def __init__(self, database, flush_interval=2.0, batch_size=500, ttl=timedelta(hours=24)):
+        self._db = database
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self._pending = {}  # user_id -> Session, or None to delete; not yet flushed
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def write_through(self):
+        return self.flush_interval <= 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="session-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write out anything still pending"""
+        self._stop.set()
+        self.flush()
+
+    def get(self, user_id):
+        with self._lock:
+            if user_id in self._pending:
+                return copy.deepcopy(self._pending[user_id])
+        return self._load(user_id)
+
+    def peek(self, user_id, default=None):
+        """Memory-only get(): returns `default` when no write is pending"""
+        with self._lock:
+            if user_id in self._pending:
+                return copy.deepcopy(self._pending[user_id])
+        return default
+
+    def update(self, user_id, step, temp_data=None):
+        if isinstance(temp_data, str):
+            try:
+                temp_data = json.loads(temp_data)
+            except ValueError as e:
+                logger.error(f"Invalid session data for user {user_id}: {e}")
+                return None
+        session = Session(user_id=user_id, current_step=step, temp_data=temp_data, updated_at=datetime.now())
+        with self._lock:
+            self._pending[user_id] = session
+        if self.write_through:
+            self.flush()
+        return True
+
+    def clear(self, user_id):
+        with self._lock:
+            self._pending[user_id] = None
+        if self.write_through:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Write pending sessions to user_sessions; failed batches are retried next flush"""
+        with self._flush_lock:
+            with self._lock:
+                pending = list(self._pending.items())
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logger.error(f"Failed to flush {len(batch)} sessions: {e}")
+                    continue
+                with self._lock:
+                    for user_id, session in batch:
+                        # Keep anything written again while the batch was in flight
+                        if user_id in self._pending and self._pending[user_id] is session:
+                            del self._pending[user_id]
+            return len(pending)
+
+    def stats(self):
+        with self._lock:
+            return {'dirty': len(self._pending)}
+
+    def _write_batch(self, batch):
+        upserts, deletes = [], []
+        for user_id, session in batch:
+            if session is None:
+                deletes.append(user_id)
+            else:
+                upserts.append((
+                    user_id,
+                    session['current_step'],
+                    Json(session['temp_data']) if session['temp_data'] is not None else None
+                ))
+        with self._db.transaction() as cursor:
+            if upserts:
+                # Stamped with the database clock, which the TTL checks and cleanup use
+                execute_values(cursor, """
+                INSERT INTO user_sessions (user_id, current_step, temp_data, updated_at)
+                VALUES %s
+                ON CONFLICT (user_id) DO UPDATE SET
+                current_step = EXCLUDED.current_step,
+                temp_data = EXCLUDED.temp_data,
+                updated_at = EXCLUDED.updated_at
+                """, upserts, template="(%s, %s, %s, CURRENT_TIMESTAMP)")
+            if deletes:
+                cursor.execute("DELETE FROM user_sessions WHERE user_id = ANY(%s)", (deletes,))
+
+    def _load(self, user_id):
+        query = f"""
+        SELECT {Session.columns()} FROM user_sessions
+        WHERE user_id = %s AND updated_at > CURRENT_TIMESTAMP - %s
+        """
+        result = self._db.execute_query(query, (user_id, self.ttl), fetch=True, model=Session)
+        return self.from_row(result[0]) if result else None
+
+    @staticmethod
+    def from_row(row):
+        session = Session.from_mapping(row)
+        # Rows written before JSONB parsing was consistent may hold strings
+        if session.get('temp_data') and isinstance(session['temp_data'], str):
+            try:
+                session['temp_data'] = json.loads(session['temp_data'])
+            except ValueError:
+                session['temp_data'] = {}
+        return session
+
+    def _flush_loop(self):
+        # Write-through mode only needs the thread to retry failed writes
+        interval = 1.0 if self.write_through else self.flush_interval
+        while not self._stop.wait(interval):
+            self.flush()
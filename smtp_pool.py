@@ -0,0 +1,112 @@
+import smtplib
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the session is unusable, as opposed to one rejected message
+SMTP_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError)
+
+class SMTPPoolTimeoutError(Exception):
+    """Raised when no SMTP session frees up within the acquire timeout"""
+
+class SMTPPool:
+    """Thread-safe pool of logged-in SMTP sessions.
+
+    Sessions go back to the pool after each use instead of being closed,
+    so consecutive emails skip the connect/STARTTLS/login handshake. At
+    most `max_size` sessions exist at once, which also keeps us under the
+    provider's concurrent connection limit; callers queue for up to
+    `timeout` seconds for a free one.
+
+    A session idle longer than `idle_timeout` is closed rather than reused
+    (servers drop idle clients anyway); one idle longer than
+    `health_check_interval` is probed with NOOP first. Dead sessions are
+    replaced transparently.
+    """
+
+    def __init__(self, connect, max_size=4, timeout=30, idle_timeout=120, health_check_interval=15):
+        self._connect = connect  # returns a new logged-in smtplib.SMTP
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle = []  # (session, monotonic time it was returned), most recent last
+        self.opened = 0
+        self.reused = 0
+
+    @contextmanager
+    def session(self):
+        """Check out a live session, returning it to the pool afterwards"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise SMTPPoolTimeoutError(f"No SMTP connection available after {self.timeout}s")
+        try:
+            session = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+        broken = False
+        try:
+            yield session
+        except SMTP_CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self._checkin(session, broken)
+            self._slots.release()
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                session, idle_since = self._idle.pop()
+            if self._is_alive(session, time.monotonic() - idle_since):
+                self.reused += 1
+                return session
+            self._close(session)
+        session = self._connect()
+        self.opened += 1
+        return session
+
+    def _is_alive(self, session, idle_for):
+        """NOOP round-trip only for sessions idle a while"""
+        if session.sock is None or idle_for >= self.idle_timeout:
+            return False
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            return session.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkin(self, session, broken=False):
+        if broken or session.sock is None:
+            self._close(session)
+            return
+        with self._lock:
+            self._idle.append((session, time.monotonic()))
+
+    @staticmethod
+    def _close(session):
+        try:
+            session.quit()
+        except Exception:
+            session.close()
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {'max_size': self.max_size, 'idle': idle, 'opened': self.opened, 'reused': self.reused}
+
+    def close(self):
+        """Close every idle session"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session, _ in idle:
+            self._close(session)
+        logger.info("SMTP connection pool closed")
@@ -0,0 +1,52 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', lambda: now[0])
+    # No jitter, so the backoff is exact
+    monkeypatch.setattr(circuit_breaker.random, 'uniform', lambda low, high: high)
+    return now
+
+def test_opens_after_the_threshold(clock):
+    breaker = CircuitBreaker('db', failure_threshold=2, reset_timeout=1)
+    breaker.record_failure()
+    assert breaker.before_call() is False
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+def test_single_trial_after_the_backoff(clock):
+    breaker = CircuitBreaker('db', failure_threshold=1, reset_timeout=1)
+    breaker.record_failure()
+    clock[0] += 1
+    assert breaker.before_call() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_failed_trial_doubles_the_backoff(clock):
+    breaker = CircuitBreaker('db', failure_threshold=1, reset_timeout=1)
+    breaker.record_failure()
+    clock[0] += 1
+    breaker.before_call()
+    breaker.record_failure()
+    clock[0] += 1.5
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock[0] += 0.5
+    assert breaker.before_call() is True
+
+def test_released_trial_lets_the_next_probe_through(clock):
+    breaker = CircuitBreaker('db', failure_threshold=1, reset_timeout=1)
+    breaker.record_failure()
+    clock[0] += 1
+    assert breaker.before_call() is True
+    breaker.release_trial()
+    assert breaker.before_call() is True
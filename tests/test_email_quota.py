@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import email_quota
+from email_quota import EmailQuota, REMINDER, TRANSACTIONAL
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen monotonic clock the test moves forward by hand"""
+    now = [1000.0]
+    monkeypatch.setattr(email_quota.time, 'monotonic', lambda: now[0])
+    return now
+
+def test_transactional_may_use_the_whole_minute_bucket(clock):
+    quota = EmailQuota(per_minute=10, per_day=0, max_wait=0)
+    assert quota.acquire(15, TRANSACTIONAL) == 10
+    assert quota.acquire(1, TRANSACTIONAL) == 0
+
+def test_reminders_leave_the_reserve_for_transactional(clock):
+    quota = EmailQuota(per_minute=10, per_day=0, reserve=0.2, max_wait=0)
+    assert quota.acquire(10, REMINDER) == 8
+    assert quota.acquire(1, REMINDER) == 0
+    assert quota.acquire(5, TRANSACTIONAL) == 2
+
+def test_bucket_refills_with_time(clock):
+    quota = EmailQuota(per_minute=60, per_day=0, max_wait=0)
+    assert quota.acquire(60) == 60
+    clock[0] += 5
+    assert quota.acquire(60) == 5
+
+def test_daily_limit_and_reserve(clock):
+    quota = EmailQuota(per_minute=0, per_day=10, reserve=0.2, max_wait=0)
+    assert quota.acquire(20, REMINDER) == 8
+    assert quota.acquire(20, TRANSACTIONAL) == 2
+    assert quota.stats()['used_today'] == 10
+
+def test_counters_track_sent_and_deferred(clock):
+    quota = EmailQuota(per_minute=0, per_day=5, reserve=0, max_wait=0)
+    quota.acquire(7, REMINDER)
+    assert quota.stats()['counters'][REMINDER] == {'sent': 5, 'deferred': 2}
+
+def test_refund_gives_back_tokens_and_daily_count(clock):
+    quota = EmailQuota(per_minute=10, per_day=100, max_wait=0)
+    assert quota.acquire(10) == 10
+    quota.refund(3)
+    assert quota.stats()['used_today'] == 7
+    assert quota.stats()['counters'][TRANSACTIONAL]['sent'] == 7
+    assert quota.acquire(10) == 3
+
+def test_deferred_until_next_day_once_the_daily_quota_is_spent(clock):
+    quota = EmailQuota(per_minute=0, per_day=5, reserve=0.2, max_wait=0)
+    quota.acquire(4, REMINDER)
+    tomorrow = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    assert quota.deferred_until(REMINDER) == tomorrow
+    # Transactional mail still has the reserve, so it only waits a minute
+    assert quota.deferred_until(TRANSACTIONAL) - datetime.now() <= timedelta(minutes=1)
+
+def test_disabled_limits_grant_everything(clock):
+    quota = EmailQuota(per_minute=0, per_day=0, max_wait=0)
+    assert quota.acquire(1000, REMINDER) == 1000
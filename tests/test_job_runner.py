@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from job_runner import CronSchedule, Job, every_minutes
+
+def test_every_minute_fires_on_the_next_minute():
+    cron = CronSchedule("* * * * *")
+    assert cron.next_after(datetime(2024, 5, 1, 10, 0, 30)) == datetime(2024, 5, 1, 10, 1)
+
+def test_next_after_is_strictly_after():
+    cron = CronSchedule("0 9 * * *")
+    assert cron.next_after(datetime(2024, 5, 1, 9, 0)) == datetime(2024, 5, 2, 9, 0)
+
+def test_steps_ranges_and_lists():
+    cron = CronSchedule("0-30/10 8,20 * * *")
+    assert cron.minutes == {0, 10, 20, 30}
+    assert cron.hours == {8, 20}
+    assert cron.next_after(datetime(2024, 5, 1, 8, 30)) == datetime(2024, 5, 1, 20, 0)
+
+def test_day_of_week_counts_from_sunday_and_accepts_7():
+    # 2024-05-05 is a Sunday
+    assert CronSchedule("0 10 * * 0").next_after(datetime(2024, 5, 1)) == datetime(2024, 5, 5, 10, 0)
+    assert CronSchedule("0 10 * * 7").next_after(datetime(2024, 5, 1)) == datetime(2024, 5, 5, 10, 0)
+
+def test_restricted_day_fields_match_either():
+    # 15th of the month or any Monday; 2024-05-06 is a Monday
+    cron = CronSchedule("0 0 15 * 1")
+    assert cron.next_after(datetime(2024, 5, 1)) == datetime(2024, 5, 6)
+    assert cron.next_after(datetime(2024, 5, 13)) == datetime(2024, 5, 15)
+
+def test_month_rollover_crosses_the_year():
+    cron = CronSchedule("0 0 1 1 *")
+    assert cron.next_after(datetime(2024, 3, 1)) == datetime(2025, 1, 1)
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* 24 * * *", "*/0 * * * *", "5-1 * * * *"])
+def test_invalid_expressions_raise(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+def test_expression_that_never_fires_raises():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 31 2 *").next_after(datetime(2024, 1, 1))
+
+def test_min_interval():
+    assert CronSchedule("*/15 * * * *").min_interval() == timedelta(minutes=15)
+    assert CronSchedule("0 9,10 * * *").min_interval() == timedelta(hours=1)
+
+@pytest.mark.parametrize("minutes, expression", [
+    (1, "*/1 * * * *"),
+    (5, "*/5 * * * *"),
+    (30, "*/30 * * * *"),
+    (60, "0 */1 * * *"),
+    (360, "0 */6 * * *"),
+    (1440, "0 */24 * * *"),
+])
+def test_every_minutes(minutes, expression):
+    assert every_minutes(minutes) == expression
+    assert CronSchedule(expression).min_interval() == timedelta(minutes=minutes)
+
+@pytest.mark.parametrize("minutes", [0, -5, 7, 45, 90, 300, 2880])
+def test_every_minutes_rejects_uneven_intervals(minutes):
+    with pytest.raises(ValueError):
+        every_minutes(minutes)
+
+def test_jitter_is_capped_at_half_the_interval():
+    assert Job("frequent", None, "* * * * *", jitter=300).jitter == 30
+    assert Job("daily", None, "0 9 * * *", jitter=300).jitter == 300
@@ -0,0 +1,49 @@
+import pytest
+
+from query_stats import QueryStats, normalize_query
+
+def test_literals_and_whitespace_are_normalized():
+    query = "SELECT *  FROM users\n WHERE id = 42 AND name = 'O''Brien' AND score > 1.5"
+    assert normalize_query(query) == "SELECT * FROM users WHERE id = ? AND name = ? AND score > ?"
+
+def test_placeholders_and_identifiers_with_digits_are_kept():
+    query = "SELECT col1 FROM t2 WHERE id = %s LIMIT %s"
+    assert normalize_query(query) == query
+
+def test_bytes_queries_are_decoded():
+    assert normalize_query(b"SELECT 1") == "SELECT ?"
+
+def test_same_statement_with_different_literals_shares_an_entry():
+    stats = QueryStats(slow_threshold_ms=1000)
+    stats.record("SELECT * FROM users WHERE id = 1", 2.0, rows=1)
+    stats.record("SELECT * FROM users WHERE id = 2", 4.0, rows=1)
+    stats.record("SELECT * FROM users WHERE id = 3", 6.0, error=True)
+    [entry] = stats.top()
+    assert entry['calls'] == 3
+    assert entry['rows'] == 2
+    assert entry['errors'] == 1
+    assert entry['max_ms'] == 6.0
+    assert entry['avg_ms'] == pytest.approx(4.0)
+
+def test_top_orders_by_the_requested_counter():
+    stats = QueryStats(slow_threshold_ms=1000)
+    for _ in range(3):
+        stats.record("SELECT a FROM t", 1.0)
+    stats.record("SELECT b FROM t", 50.0)
+    assert [entry['query'] for entry in stats.top(order_by='calls')] == ["SELECT a FROM t", "SELECT b FROM t"]
+    assert [entry['query'] for entry in stats.top(limit=1)] == ["SELECT b FROM t"]
+
+def test_p95_is_the_bucket_upper_bound():
+    stats = QueryStats(slow_threshold_ms=10000)
+    for _ in range(19):
+        stats.record("SELECT 1", 3.0)
+    stats.record("SELECT 1", 400.0)
+    assert stats.top()[0]['p95_ms'] == 5
+    stats.record("SELECT 1", 5000.0)
+    stats.record("SELECT 1", 5000.0)
+    assert stats.top()[0]['p95_ms'] is None
+
+def test_slow_queries_are_logged(caplog):
+    stats = QueryStats(slow_threshold_ms=100)
+    stats.record("SELECT 1", 150.0)
+    assert "Slow query" in caplog.text
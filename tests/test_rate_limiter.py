@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from notification_dispatcher import RateLimiter
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_calls_are_spaced_to_the_rate():
+    async def scenario():
+        limiter = RateLimiter(20)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.gather(*(limiter.wait() for _ in range(5)))
+        return loop.time() - started
+
+    # Five calls at 20/s: the first goes at once, the last 4 intervals later
+    assert 0.18 <= run(scenario()) < 0.5
+
+def test_zero_rate_means_unlimited():
+    async def scenario():
+        limiter = RateLimiter(0)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(100):
+            await limiter.wait()
+        return loop.time() - started
+
+    assert run(scenario()) < 0.05
@@ -95,6 +95,15 @@ def log_user_action(user_id, action, details=None):
         log_message += f" - {details}"
     logger.info(log_message)
 
+def encode_page_cursor(timestamp, row_id):
+    """Encode a (timestamp, id) keyset position compactly for callback data"""
+    return f"{timestamp.strftime('%Y%m%d%H%M%S%f')}-{row_id}"
+
+def decode_page_cursor(token):
+    """Inverse of encode_page_cursor"""
+    timestamp, row_id = token.split('-', 1)
+    return datetime.strptime(timestamp, '%Y%m%d%H%M%S%f'), int(row_id)
+
 def chunk_list(lst, chunk_size):
     """Split list into chunks"""
     for i in range(0, len(lst), chunk_size):